@@ -0,0 +1,23 @@
+"""
+ASGI config for devops project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Under ASGI, /api/devops is served by the asynchronous view logic.views.process_async.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'devops.settings')
+os.environ.setdefault('LOGIC_ASYNC_PROCESS', '1')
+
+application = get_asgi_application()
+
+# start the offload process pool before serving the first request
+from logic import offload  # noqa: E402
+
+offload.warm()
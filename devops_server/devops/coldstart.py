@@ -0,0 +1,101 @@
+"""
+Cold start of the server: warm-up of a loaded application, and measurement of
+the time a fresh interpreter takes to set up Django and answer its first request.
+
+Run from devops_server, in a fresh interpreter:
+    python -m devops.coldstart --settings devops.settings_production
+It prints the measurements as JSON, and exits with status 1 when they exceed
+the budget given by --import-budget and --response-budget, in seconds.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Import and setup of Django, from the first import to get_wsgi_application returning
+IMPORT_BUDGET = 0.3
+# From the first import to the response of the first request
+FIRST_RESPONSE_BUDGET = 0.5
+
+WARM_UP_BODY = (b'{"DM_capacity": 50, "DE_capacity": 30, "data_centers": '
+                b'[{"name": "A", "servers": 80}, {"name": "B", "servers": 20}]}')
+
+
+def post(application, path: str, body: bytes):
+    """
+    Posts a JSON body to the WSGI application
+
+    :return: tuple (status code, response body)
+    """
+    from logic.synthetic import wsgi_environ
+    status = []
+    response = application(wsgi_environ(path, body), lambda line, headers: status.append(int(line.split()[0])))
+    try:
+        return status[0], b"".join(response)
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+
+
+def warm_up(application):
+    """
+    Answers a request so that the URL configuration, the views and the solver are
+    loaded, then forgets it: the metrics and the counters of the result cache start
+    out at zero, and the request is not stored, so that no writer thread runs in a
+    gunicorn master. The cache itself is not cleared, as it may be shared with
+    other replicas
+
+    :param application: WSGI application of the project
+    :return: status code of the warm-up request
+    """
+    status, _ = post(application, "/api/devops", WARM_UP_BODY)
+    from logic import cache, metrics, store
+    store.stop(discard=True)
+    metrics.reset()
+    result_cache = cache.get_cache()
+    if result_cache is not None:
+        result_cache.reset_stats()
+    return status
+
+
+def measure(settings_module: str):
+    """
+    Sets up Django and answers a first request; to be run once in a fresh interpreter
+
+    :param settings_module: settings module to set up Django with
+    :return: dict with the seconds spent, the status code and the modules loaded
+    """
+    os.environ["DJANGO_SETTINGS_MODULE"] = settings_module
+    start = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    loaded = time.perf_counter()
+    status = warm_up(application)
+    answered = time.perf_counter()
+    return {
+        "settings": settings_module,
+        "import_seconds": loaded - start,
+        "first_response_seconds": answered - start,
+        "status": status,
+        "modules": len(sys.modules),
+        "contrib_modules": sorted(name for name in sys.modules if name.startswith("django.contrib")),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the cold start of the server against a budget")
+    parser.add_argument("--settings", default="devops.settings_production")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET)
+    parser.add_argument("--response-budget", type=float, default=FIRST_RESPONSE_BUDGET)
+    options = parser.parse_args(argv)
+    result = measure(options.settings)
+    result["within_budget"] = (result["status"] == 200 and result["import_seconds"] <= options.import_budget
+                               and result["first_response_seconds"] <= options.response_budget)
+    print(json.dumps(result, indent=2))
+    return 0 if result["within_budget"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
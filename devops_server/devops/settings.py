@@ -39,12 +39,18 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 ]
 
+MIDDLEWARE = [
+    'logic.compression.CompressionMiddleware',
+]
+
 
 ROOT_URLCONF = 'devops.urls'
 
 
 WSGI_APPLICATION = 'devops.wsgi.application'
 
+ASGI_APPLICATION = 'devops.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
@@ -53,9 +59,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            # readers are not blocked by the batched writes of logic.store; init_command needs Django 5.1
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
     }
 }
 
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -80,3 +92,129 @@ USE_TZ = True
 
 
 STATIC_URL = '/static/'
+
+
+# Logic app
+
+# Request bodies larger than this number of bytes are parsed incrementally
+# instead of being buffered; None disables streaming ingestion
+LOGIC_STREAMING_THRESHOLD = 1024 * 1024
+
+# Cache solutions of repeated request bodies
+LOGIC_CACHE_ENABLED = True
+# None keeps an in-process LRU cache, otherwise the alias of a cache from CACHES
+LOGIC_CACHE_BACKEND = None
+# Maximum number of entries of the in-process cache
+LOGIC_CACHE_SIZE = 1024
+# Number of seconds a solution is cached, None for no expiry
+LOGIC_CACHE_TTL = 300
+
+# Concurrent requests with the same body share one computation
+LOGIC_COALESCE_ENABLED = True
+# Number of seconds a request waits for an identical one before solving it itself
+LOGIC_COALESCE_TIMEOUT = 10
+
+# Admit /api/devops requests by cost, queueing or rejecting the others, see logic.admission
+LOGIC_ADMISSION_ENABLED = True
+# Number of cost units solved at once; a request costs 1, plus 1 per LOGIC_ADMISSION_UNIT_SITES
+# data centers, estimated from its Content-Length at LOGIC_ADMISSION_SITE_BYTES bytes each
+LOGIC_ADMISSION_CAPACITY = 8
+LOGIC_ADMISSION_UNIT_SITES = 50000
+LOGIC_ADMISSION_SITE_BYTES = 32
+# Share of the capacity a single tenant may hold
+LOGIC_ADMISSION_TENANT_SHARE = 0.5
+# Number of requests waiting to be admitted, in all and per tenant; more are rejected
+LOGIC_ADMISSION_QUEUE = 64
+LOGIC_ADMISSION_TENANT_QUEUE = 16
+# Number of seconds a request waits to be admitted, unless the deadline header asks for less
+LOGIC_ADMISSION_TIMEOUT = 5
+# Header naming the tenant of a request, the client address being used otherwise. Clients
+# could name any tenant with it, so it is only read from the addresses or networks of
+# LOGIC_ADMISSION_TRUSTED_PROXIES, e.g. a reverse proxy setting it after authentication
+LOGIC_ADMISSION_TENANT_HEADER = 'X-Tenant'
+LOGIC_ADMISSION_TRUSTED_PROXIES = ['127.0.0.1', '::1']
+# Header giving the number of seconds the client waits for the response
+LOGIC_ADMISSION_DEADLINE_HEADER = 'X-Request-Timeout'
+# Retry-After value of rejected requests, in seconds
+LOGIC_ADMISSION_RETRY_AFTER = 1
+
+# Maximum number of ranked placements returned at once for top_k requests
+LOGIC_TOP_K_PAGE_SIZE = 1000
+
+# Maximum number of fleets kept in memory, the least recently used is dropped beyond,
+# and number of seconds a fleet is kept after it was last used, None for no expiry
+LOGIC_FLEETS_MAX_COUNT = 1000
+LOGIC_FLEETS_TTL = 24 * 3600
+
+# Maximum number of capacity combinations of a sweep, and number of values computed at a time
+LOGIC_SWEEP_MAX_CELLS = 10000
+LOGIC_SWEEP_CHUNK_SIZE = 1 << 22
+
+# Compress responses of at least this number of bytes with the coding accepted by the client,
+# see logic.compression; zstd needs the zstandard package
+LOGIC_COMPRESSION_MIN_BYTES = 1024
+LOGIC_COMPRESSION_GZIP_LEVEL = 6
+LOGIC_COMPRESSION_ZSTD_LEVEL = 3
+# Compressed request bodies larger than this number of bytes once decompressed are rejected
+LOGIC_COMPRESSION_MAX_BODY_BYTES = 1024 * 1024 * 1024
+# Request bodies larger than this number of bytes are rejected with 413; bodies are read from
+# the stream, so DATA_UPLOAD_MAX_MEMORY_SIZE does not apply to them. None accepts any size
+LOGIC_MAX_BODY_BYTES = 256 * 1024 * 1024
+# Results holding longer lists are streamed, encoding this number of list items at a time;
+# None always builds the whole response
+LOGIC_RESPONSE_CHUNK_ITEMS = 8192
+
+# Number of values computed at a time when replaying the history of a fleet
+LOGIC_REPLAY_CHUNK_SIZE = 1 << 22
+
+# Route /api/devops to the asynchronous view; devops.asgi turns it on
+LOGIC_ASYNC_PROCESS = os.environ.get('LOGIC_ASYNC_PROCESS', '0') == '1'
+# Bodies larger than this number of bytes are solved off the event loop by the asynchronous view
+LOGIC_ASYNC_OFFLOAD_THRESHOLD = 64 * 1024
+# Number of threads solving offloaded requests
+LOGIC_ASYNC_WORKERS = 4
+
+# Problems with more data centers than this are solved in a pool of worker processes
+# instead of the request thread; None solves everything inline. Only buffered bodies
+# are offloaded, so it should stay below the size of a LOGIC_STREAMING_THRESHOLD body
+LOGIC_OFFLOAD_THRESHOLD = None
+# Number of worker processes of the offload pool
+LOGIC_OFFLOAD_WORKERS = 2
+# Number of offloaded problems queued or being solved at once; more are answered with 503
+LOGIC_OFFLOAD_QUEUE = 8
+# Number of seconds to wait for an offloaded problem before answering 503
+LOGIC_OFFLOAD_TIMEOUT = 30
+
+# Store submitted fleets and their placements in the default database, see logic.store;
+# turn it on once its tables are created with manage.py migrate
+LOGIC_STORE_ENABLED = os.environ.get('LOGIC_STORE_ENABLED', '0') == '1'
+# Number of records written per transaction, and seconds between two writes at most
+LOGIC_STORE_BATCH_SIZE = 500
+LOGIC_STORE_FLUSH_INTERVAL = 1.0
+# Bytes of bodies waiting to be written; further records are dropped
+LOGIC_STORE_QUEUE_BYTES = 64 * 1024 * 1024
+# Bodies larger than this number of bytes are not kept, only their placements
+LOGIC_STORE_MAX_BODY_BYTES = 1024 * 1024
+# Bodies larger than this number of bytes are looked up in the database before being solved;
+# it should not be below LOGIC_ASYNC_OFFLOAD_THRESHOLD, the event loop does not query the database
+LOGIC_STORE_LOOKUP_BYTES = 64 * 1024
+# Header naming the fleet of a request, whose placements are kept over time
+LOGIC_STORE_LABEL_HEADER = 'X-Fleet'
+# Maximum number of placements returned by /api/devops/history
+LOGIC_STORE_HISTORY_LIMIT = 1000
+
+# Directory keeping fleet snapshots solved by id, see logic.snapshots
+LOGIC_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshots')
+# Snapshot uploads larger than this number of bytes are rejected with 413, None accepts any size
+LOGIC_SNAPSHOT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Profile /api/devops requests carrying LOGIC_PROFILE_HEADER: 1, or a sampled share of them
+LOGIC_PROFILE_ENABLED = False
+LOGIC_PROFILE_HEADER = 'X-Profile'
+# Probability of profiling any other request
+LOGIC_PROFILE_SAMPLE_RATE = 0.0
+# Number of seconds between two stack samples of a profiled request
+LOGIC_PROFILE_INTERVAL = 0.001
+# Directory keeping the profiles, and its size in bytes beyond which the oldest are removed
+LOGIC_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+LOGIC_PROFILE_MAX_BYTES = 64 * 1024 * 1024
@@ -0,0 +1,60 @@
+"""
+Production settings for devops project.
+
+Only the logic app is installed: the endpoint uses neither auth, sessions,
+messages nor static files, so none of them is loaded at start, and the database
+only when LOGIC_STORE_DB is set, see logic.store.
+Selected with DJANGO_SETTINGS_MODULE=devops.settings_production, as done by
+gunicorn.conf.py; the Logic app settings are those of devops.settings.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+# Nothing is signed by the endpoint, the key is only there for Django's sake
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+
+DEBUG = False
+
+# Comma separated host names; replicas usually sit behind a load balancer checking them
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',') if host]
+
+INSTALLED_APPS = [
+    'logic',
+]
+
+MIDDLEWARE = [
+    'logic.compression.CompressionMiddleware',
+]
+
+# JSON is served to clients behind a load balancer terminating TLS: there are no
+# pages to frame and no cookies to protect
+SILENCED_SYSTEM_CHECKS = ['security.W001', 'security.W002', 'security.W003']
+
+# The database of logic.store, a SQLite file given by LOGIC_STORE_DB and created with
+#     python manage.py migrate --settings=devops.settings_production
+# Without it, there is no database: the dummy backend is never connected to
+if os.environ.get('LOGIC_STORE_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['LOGIC_STORE_DB'],
+            'OPTIONS': {
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            },
+        }
+    }
+else:
+    DATABASES = {}
+
+USE_I18N = False
+
+STATIC_URL = None
+
+# Logic app
+
+# Profiles are written on local disk, keep them off unless debugging a replica
+LOGIC_PROFILE_ENABLED = os.environ.get('LOGIC_PROFILE_ENABLED', '0') == '1'
+
+LOGIC_STORE_ENABLED = bool(DATABASES)
@@ -16,6 +16,9 @@ Including another URLconf
 
 from django.urls import path, include
 
+from logic.views import export_metrics
+
 urlpatterns = [
-    path('api/devops', include('logic.urls')),
+    path('api/', include('logic.urls')),
+    path('metrics', export_metrics, name='metrics'),
 ]
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'devops.settings')
 
 application = get_wsgi_application()
+
+# start the offload process pool before serving the first request; gunicorn
+# preloads the application in its master, and gunicorn.conf.py starts the pool
+# in every worker instead
+from logic import offload  # noqa: E402
+
+if not os.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+    offload.warm()
@@ -0,0 +1,69 @@
+"""
+Production entry point, read by gunicorn when started from devops_server:
+    gunicorn devops.wsgi:application
+
+The application is loaded once in the master with devops.settings_production,
+answers a warm-up request there, and is then forked into the workers, so a new
+or restarted worker serves right away without importing anything. The garbage
+collector is kept off in the master and the objects it holds are frozen before
+every fork: collections in the workers then leave their pages alone, and the
+memory stays shared copy-on-write between the workers.
+
+A single worker process is started by default, serving requests with threads.
+Fleets (logic.fleets), the result cache (logic.cache), metrics (logic.metrics)
+and admission control (logic.admission) keep their state in the memory of the
+process: with several workers, a fleet created in one worker is unknown to the
+others, /metrics and /api/devops/cache report the worker that answered, and
+LOGIC_ADMISSION_CAPACITY applies per worker. Raise WEB_CONCURRENCY only for a
+deployment using none of these; large problems use the other CPUs through the
+offload pool, see LOGIC_OFFLOAD_THRESHOLD.
+
+Configured with environment variables:
+    PORT                 port to listen on, 8000 by default
+    WEB_CONCURRENCY      number of worker processes, 1 by default, see above
+    GUNICORN_THREADS     number of threads per worker, 16 by default
+    GUNICORN_TIMEOUT     seconds a request may take before its worker is restarted, 60 by default
+"""
+
+import gc
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "devops.settings_production")
+
+# Avoid collections in the master, they would free objects in the middle of pages shared with the workers
+gc.disable()
+
+bind = "0.0.0.0:{port}".format(port=os.environ.get("PORT", "8000"))
+# Several workers would split the in-memory state of the logic app, see above
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "gthread"
+# More than LOGIC_ADMISSION_CAPACITY, so that requests wait for admission, or get rejected, in the workers
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+preload_app = True
+# Above LOGIC_OFFLOAD_TIMEOUT, so that offloaded problems are answered with 503 first
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+keepalive = 5
+accesslog = None
+
+
+def when_ready(server):
+    """
+    Runs in the master once the application is loaded, before the first fork
+    """
+    from devops.coldstart import warm_up
+    status = warm_up(server.app.wsgi())
+    if status != 200:
+        raise RuntimeError("Warm-up request was answered with {status}".format(status=status))
+    server.log.info("Application warmed up")
+
+
+def pre_fork(server, worker):
+    # everything allocated so far is kept for the lifetime of the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    # the offload pool is not inherited, every worker starts its own
+    from logic import offload
+    offload.warm()
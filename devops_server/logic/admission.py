@@ -0,0 +1,317 @@
+"""
+Admission control of /api/devops requests.
+
+Every request is given a cost from the size of its body: one unit, plus one per
+settings.LOGIC_ADMISSION_UNIT_SITES data centers, a data center taking about
+settings.LOGIC_ADMISSION_SITE_BYTES bytes; bodies of unknown size, e.g. compressed
+ones, cost the share of a tenant. At most settings.LOGIC_ADMISSION_CAPACITY
+units are being solved at a time in a process, and further requests wait in a
+bounded queue, so that a burst is answered with fast rejections instead of every
+client timing out.
+
+Requests are grouped by tenant, named by the settings.LOGIC_ADMISSION_TENANT_HEADER
+header when they come from one of settings.LOGIC_ADMISSION_TRUSTED_PROXIES, or by
+the client address otherwise, so that clients cannot pick a tenant. A tenant holds at most
+settings.LOGIC_ADMISSION_TENANT_SHARE of the capacity, which is the cost of its
+largest requests, and whenever capacity frees up, the waiting tenant holding the
+least of it goes first. A tenant sending huge fleets thus keeps at most its share
+busy, and the requests of other tenants do not queue behind its own.
+
+A request waits at most settings.LOGIC_ADMISSION_TIMEOUT seconds, or less when the
+client gives its own timeout in seconds in the settings.LOGIC_ADMISSION_DEADLINE_HEADER
+header. The time left once the request is admitted bounds its later waits as well,
+see remaining. Requests are rejected with a Retry-After header of
+settings.LOGIC_ADMISSION_RETRY_AFTER seconds, with the status:
+    429 when the tenant already has settings.LOGIC_ADMISSION_TENANT_QUEUE requests waiting
+    503 when settings.LOGIC_ADMISSION_QUEUE requests are waiting, or the wait times out
+"""
+
+from collections import deque
+import contextvars
+import ipaddress
+import itertools
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import compression
+
+DEFAULT_CAPACITY = 8
+DEFAULT_UNIT_SITES = 50000
+DEFAULT_SITE_BYTES = 32
+DEFAULT_TENANT_SHARE = 0.5
+DEFAULT_QUEUE = 64
+DEFAULT_TENANT_QUEUE = 16
+DEFAULT_TIMEOUT = 5
+DEFAULT_TENANT_HEADER = "X-Tenant"
+DEFAULT_TRUSTED_PROXIES = ("127.0.0.1", "::1")
+DEFAULT_DEADLINE_HEADER = "X-Request-Timeout"
+DEFAULT_RETRY_AFTER = 1
+
+# Deadline of the request handled in the current context, as a time.monotonic() value
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class Rejected(Exception):
+    """
+    Raised when a request is not admitted
+    """
+
+    def __init__(self, message: str, status: int, retry_after: int = DEFAULT_RETRY_AFTER):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    Admission of a request, to be released once it is answered; used as a context
+    manager, it also sets the deadline of the request, see remaining
+    """
+
+    __slots__ = ("controller", "tenant", "cost", "deadline", "order", "admitted", "ready", "token")
+
+    def __init__(self, controller, tenant: str, cost: int, deadline: float = None, order: int = 0):
+        self.controller = controller
+        self.tenant = tenant
+        self.cost = cost
+        self.deadline = deadline
+        self.order = order
+        self.admitted = False
+        self.ready = threading.Event()
+        self.token = None
+
+    def release(self):
+        if self.controller is not None and self.admitted:
+            self.controller.release(self)
+
+    def __enter__(self):
+        self.token = _deadline.set(self.deadline)
+        return self
+
+    def __exit__(self, *exc_info):
+        _deadline.reset(self.token)
+        self.release()
+
+
+class Controller:
+    """
+    Admits requests up to a total cost, queueing the others fairly between tenants
+    """
+
+    def __init__(self, capacity: int, tenant_share: float, queue: int, tenant_queue: int,
+                 retry_after: int = DEFAULT_RETRY_AFTER):
+        self.capacity = capacity
+        self.tenant_limit = min(capacity, max(1, int(capacity * tenant_share)))
+        self.queue = queue
+        self.tenant_queue = tenant_queue
+        self.retry_after = retry_after
+        self.in_flight = 0
+        # cost admitted per tenant, and tickets waiting per tenant in arrival order
+        self.usage = {}
+        self.waiting = {}
+        self.waiters = 0
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+
+    def acquire(self, tenant: str, cost: int, timeout: float, deadline: float = None, wait: bool = True):
+        """
+        Admits a request, waiting for its turn when needed
+
+        :param tenant: name of the tenant sending the request
+        :param cost: cost of the request, counted up to the share of a tenant
+        :param timeout: number of seconds to wait at most
+        :param deadline: deadline of the request, given to the ticket
+        :param wait: False to return None instead of waiting
+        :return: admitted Ticket, raises Rejected when it is not admitted
+        """
+        ticket = Ticket(self, tenant, min(cost, self.tenant_limit), deadline, next(self.order))
+        with self.lock:
+            self.waiting.setdefault(tenant, deque()).append(ticket)
+            self.waiters += 1
+            self._dispatch()
+            if not ticket.admitted:
+                self._withdraw(ticket)
+                if not wait:
+                    return None
+                if len(self.waiting.get(tenant, ())) >= self.tenant_queue:
+                    raise Rejected("Too many requests of this client are waiting, retry later", 429,
+                                   self.retry_after)
+                if self.waiters >= self.queue:
+                    raise Rejected("Too many requests are waiting, retry later", 503, self.retry_after)
+                self.waiting.setdefault(tenant, deque()).append(ticket)
+                self.waiters += 1
+        if ticket.ready.wait(timeout):
+            return ticket
+        with self.lock:
+            if ticket.admitted:
+                return ticket
+            self._withdraw(ticket)
+            # the withdrawn ticket may have held back others
+            self._dispatch()
+        raise Rejected("Request was not admitted within {timeout:g} seconds, retry later".format(timeout=timeout),
+                       503, self.retry_after)
+
+    def release(self, ticket: Ticket):
+        with self.lock:
+            self.in_flight -= ticket.cost
+            self.usage[ticket.tenant] -= ticket.cost
+            if not self.usage[ticket.tenant]:
+                del self.usage[ticket.tenant]
+            ticket.admitted = False
+            self._dispatch()
+
+    def _dispatch(self):
+        """
+        Admits waiting tickets while capacity allows, the tenant holding the least first
+        """
+        while self.waiting:
+            eligible = [(self.usage.get(tenant, 0), queue[0].order, tenant) for tenant, queue in self.waiting.items()
+                        if self.usage.get(tenant, 0) + queue[0].cost <= self.tenant_limit]
+            if not eligible:
+                return
+            _, _, tenant = min(eligible)
+            ticket = self.waiting[tenant][0]
+            if self.in_flight + ticket.cost > self.capacity:
+                # smaller requests of others do not overtake it, so that it is not starved
+                return
+            self._withdraw(ticket)
+            self.in_flight += ticket.cost
+            self.usage[tenant] = self.usage.get(tenant, 0) + ticket.cost
+            ticket.admitted = True
+            ticket.ready.set()
+
+    def _withdraw(self, ticket: Ticket):
+        queue = self.waiting[ticket.tenant]
+        queue.remove(ticket)
+        if not queue:
+            del self.waiting[ticket.tenant]
+        self.waiters -= 1
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """
+    :return: Controller configured from settings, or None when admission control is disabled
+    """
+    global _controller
+    if not getattr(settings, "LOGIC_ADMISSION_ENABLED", True):
+        return None
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = Controller(getattr(settings, "LOGIC_ADMISSION_CAPACITY", DEFAULT_CAPACITY),
+                                         getattr(settings, "LOGIC_ADMISSION_TENANT_SHARE", DEFAULT_TENANT_SHARE),
+                                         getattr(settings, "LOGIC_ADMISSION_QUEUE", DEFAULT_QUEUE),
+                                         getattr(settings, "LOGIC_ADMISSION_TENANT_QUEUE", DEFAULT_TENANT_QUEUE),
+                                         getattr(settings, "LOGIC_ADMISSION_RETRY_AFTER", DEFAULT_RETRY_AFTER))
+    return _controller
+
+
+def estimate_cost(request):
+    """
+    :param request: incoming POST request
+    :return: cost of the request in units, estimated from its Content-Length;
+             bodies of unknown size, e.g. compressed ones, are given the largest cost
+    """
+    content_length = compression.body_size(request)
+    if content_length is None:
+        return math.inf
+    sites = content_length // getattr(settings, "LOGIC_ADMISSION_SITE_BYTES", DEFAULT_SITE_BYTES)
+    return 1 + sites // getattr(settings, "LOGIC_ADMISSION_UNIT_SITES", DEFAULT_UNIT_SITES)
+
+
+def is_trusted(address: str):
+    """
+    :param address: client address of a request
+    :return: True when it belongs to settings.LOGIC_ADMISSION_TRUSTED_PROXIES, given
+             as addresses or networks, e.g. 10.0.0.0/8
+    """
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(proxy)
+               for proxy in getattr(settings, "LOGIC_ADMISSION_TRUSTED_PROXIES", DEFAULT_TRUSTED_PROXIES))
+
+
+def tenant(request):
+    """
+    :return: name of the tenant sending the request; the tenant header is only
+             trusted from a trusted proxy, the client address is used otherwise
+    """
+    address = request.META.get("REMOTE_ADDR", "")
+    header = getattr(settings, "LOGIC_ADMISSION_TENANT_HEADER", DEFAULT_TENANT_HEADER)
+    if header and is_trusted(address):
+        return request.headers.get(header) or address
+    return address
+
+
+def request_timeout(request):
+    """
+    :param request: incoming POST request
+    :return: number of seconds the client waits for the response, None when not given;
+             raises ValueError on a malformed header
+    """
+    header = getattr(settings, "LOGIC_ADMISSION_DEADLINE_HEADER", DEFAULT_DEADLINE_HEADER)
+    value = request.headers.get(header) if header else None
+    if value is None:
+        return None
+    try:
+        timeout = float(value)
+    except ValueError:
+        timeout = math.nan
+    if not 0 < timeout < math.inf:
+        raise ValueError("{header} must be a positive number of seconds, got {value}".format(
+            header=header, value=value))
+    return timeout
+
+
+def admit(request, wait: bool = True):
+    """
+    Admits a request to be solved, see Controller.acquire
+
+    :param request: incoming POST request
+    :param wait: False to return None instead of waiting
+    :return: Ticket to use as a context manager while answering the request,
+             raises Rejected when it is not admitted and ValueError on a malformed deadline
+    """
+    controller = get_controller()
+    if controller is None:
+        return Ticket(None, "", 0)
+    now = time.monotonic()
+    timeout = request_timeout(request)
+    deadline = None if timeout is None else now + timeout
+    wait_timeout = getattr(settings, "LOGIC_ADMISSION_TIMEOUT", DEFAULT_TIMEOUT)
+    if timeout is not None:
+        wait_timeout = min(wait_timeout, timeout)
+    return controller.acquire(tenant(request), estimate_cost(request), wait_timeout, deadline, wait)
+
+
+def remaining(timeout: float):
+    """
+    :param timeout: number of seconds to wait for something, None for no limit
+    :return: timeout bounded by the time left until the deadline of the current request
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    left = max(deadline - time.monotonic(), 0)
+    return left if timeout is None else min(timeout, left)
+
+
+@receiver(setting_changed)
+def reset_controller(setting, **kwargs):
+    """
+    Drops the controller when admission settings change, e.g. in tests
+    """
+    global _controller
+    if setting.startswith("LOGIC_ADMISSION"):
+        _controller = None
@@ -0,0 +1,227 @@
+"""
+Result cache for repeated planning queries.
+
+Results are keyed twice: by a digest of the raw request body, so an identical
+body is answered without being parsed, and by a canonical fingerprint of
+(DM_capacity, DE_capacity, DM_count, ordered data centers), so differently formatted
+bodies describing the same fleet share an entry.
+
+The cache is configured with the following settings:
+    LOGIC_CACHE_ENABLED: switches the cache on and off
+    LOGIC_CACHE_BACKEND: None for an in-process LRU cache, or the alias of
+                         a cache configured in settings.CACHES
+    LOGIC_CACHE_SIZE: maximum number of entries of the in-process cache
+    LOGIC_CACHE_TTL: number of seconds an entry is kept, None for no expiry
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_SIZE = 1024
+DEFAULT_TTL = 300
+
+
+def body_digest(raw: bytes):
+    """
+    :param raw: raw request body
+    :return: hex digest of the body
+    """
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def fingerprint(fleet):
+    """
+    Canonical hash of a validated problem: does not depend on formatting
+    or on the order of fields, but does depend on the order of data centers,
+    which decides ties.
+
+    :param fleet: validation.CompactFleet
+    :return: hex digest of (DM_capacity, DE_capacity, DM_count, ordered data centers)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([fleet.dm_capacity, fleet.de_capacity, fleet.dm_count]).encode("utf-8"))
+    if type(fleet.names) == list:
+        digest.update(json.dumps(fleet.names).encode("utf-8"))
+    else:
+        # names of a columnar fleet, see columnar.NameTable
+        digest.update(fleet.names.tobytes())
+    if fleet.exact:
+        digest.update(json.dumps(fleet.servers.tolist()).encode("utf-8"))
+    else:
+        digest.update(fleet.servers.tobytes())
+    return digest.hexdigest()
+
+
+class LocalStore:
+    """
+    In-process store with LRU eviction and a time to live per entry
+    """
+
+    def __init__(self, size: int = DEFAULT_SIZE, ttl: float = DEFAULT_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DjangoStore:
+    """
+    Store backed by a cache from Django's cache framework; eviction is left
+    to the cache backend
+    """
+
+    def __init__(self, alias: str, ttl: float = DEFAULT_TTL):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key: str):
+        return self.cache.get("logic:" + key)
+
+    def set(self, key: str, value):
+        self.cache.set("logic:" + key, value, timeout=self.ttl)
+
+    def clear(self):
+        """
+        Does nothing: the cache alias may be shared with other processes and hold other
+        keys, which must not be wiped; entries are left to expire
+        """
+
+
+class ResultCache:
+    """
+    Caches solutions of request bodies and counts hits and misses
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def solve(self, raw: bytes, parse, solve, digest: str = None, lookup=None):
+        """
+        Returns the cached solution of the body, computing it on a miss.
+        Failures of parse and solve are not cached.
+
+        :param raw: raw request body
+        :param parse: function parsing and validating the raw body into a CompactFleet
+        :param solve: function solving the parsed problem
+        :param digest: body_digest of the raw body, when already computed
+        :param lookup: function returning a solution of the body kept elsewhere, or None,
+                       tried on a miss before parsing the body
+        :return: solution of the body
+        """
+        raw_key = "body:" + (digest or body_digest(raw))
+        result = self.store.get(raw_key)
+        if result is None and lookup is not None:
+            result = lookup()
+            if result is not None:
+                self._count(hit=False)
+                self.store.set(raw_key, result)
+                return result
+        if result is None:
+            fleet = parse(raw)
+            key = "fleet:" + fingerprint(fleet)
+            result = self.store.get(key)
+            if result is None:
+                self._count(hit=False)
+                result = solve(fleet)
+                self.store.set(key, result)
+            else:
+                self._count(hit=True)
+            self.store.set(raw_key, result)
+        else:
+            self._count(hit=True)
+        return result
+
+    def _count(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """
+        :return: hit and miss counters of this process
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def reset_stats(self):
+        """
+        Sets the hit and miss counters back to zero
+        """
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    def clear(self):
+        self.store.clear()
+        self.reset_stats()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    :return: ResultCache configured from settings, or None when caching is disabled
+    """
+    global _cache
+    if not getattr(settings, "LOGIC_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = getattr(settings, "LOGIC_CACHE_TTL", DEFAULT_TTL)
+                alias = getattr(settings, "LOGIC_CACHE_BACKEND", None)
+                if alias is None:
+                    store = LocalStore(getattr(settings, "LOGIC_CACHE_SIZE", DEFAULT_SIZE), ttl)
+                else:
+                    store = DjangoStore(alias, ttl)
+                _cache = ResultCache(store)
+    return _cache
+
+
+@receiver(setting_changed)
+def reset_cache(setting, **kwargs):
+    """
+    Drops the configured cache when cache settings change, e.g. in tests
+    """
+    global _cache
+    if setting.startswith("LOGIC_CACHE"):
+        _cache = None
@@ -0,0 +1,144 @@
+"""
+Coalescing of concurrent identical requests.
+
+When several requests with the same body arrive while the first one is still
+being solved, the later ones wait for that computation and share its result
+instead of parsing and solving the body again. Failures are shared the same
+way, but nothing is kept once the computation ends, so the next request with
+that body computes it afresh; caching results is left to cache.ResultCache.
+
+A request waits at most settings.LOGIC_COALESCE_TIMEOUT seconds for another
+one, and no longer than its deadline, see admission.remaining. When the
+computation it waits for takes longer, it is detached, so that new requests do
+not queue up behind it, and the waiting request computes the result itself.
+Requests solved on the event loop of the ASGI handler never wait, see
+without_waiting, as that would block every other request of the loop.
+
+The coalescing is configured with the following settings:
+    LOGIC_COALESCE_ENABLED: switches the coalescing on and off
+    LOGIC_COALESCE_TIMEOUT: number of seconds to wait for a computation in flight
+"""
+
+import contextvars
+import copy
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import admission, metrics
+
+DEFAULT_TIMEOUT = 10
+
+# False while solving on an event loop, where waiting for another request would block it
+_may_wait = contextvars.ContextVar("may_wait", default=True)
+
+
+class Flight:
+    """
+    Computation in flight and its outcome
+    """
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def do(self, key: str, function, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Returns the result of function(), sharing it with concurrent calls with the same key
+
+        :param key: identity of the computation, e.g. a digest of the request body
+        :param function: computation to run when none is in flight for the key
+        :param timeout: number of seconds to wait for a computation in flight
+        :return: result of the computation, raises the exception it raised
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            if flight.done.wait(timeout):
+                metrics.COALESCED.labels().inc()
+                if flight.error is not None:
+                    raise copy_error(flight.error) from flight.error
+                return flight.result
+            self._detach(key, flight)
+            return function()
+
+        try:
+            flight.result = function()
+            return flight.result
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            self._detach(key, flight)
+            flight.done.set()
+
+    def _detach(self, key: str, flight: Flight):
+        """
+        Stops new calls from joining the flight
+        """
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def __len__(self):
+        return len(self.flights)
+
+
+def copy_error(error: BaseException):
+    """
+    :return: a copy of the exception, so that each waiting caller raises its own
+             object with its own traceback
+    """
+    try:
+        return copy.copy(error)
+    except Exception:
+        # e.g. an exception whose constructor does not accept its args
+        return error
+
+
+_flights = SingleFlight()
+
+
+@contextmanager
+def without_waiting():
+    """
+    Runs computations in the block without waiting for identical ones in flight,
+    e.g. on an event loop
+    """
+    token = _may_wait.set(False)
+    try:
+        yield
+    finally:
+        _may_wait.reset(token)
+
+
+def run(key: str, function):
+    """
+    Runs the computation coalesced with identical ones in flight, when enabled in settings
+
+    :param key: identity of the computation
+    :param function: computation to run
+    :return: result of the computation
+    """
+    if not getattr(settings, "LOGIC_COALESCE_ENABLED", True) or not _may_wait.get():
+        return function()
+    return _flights.do(key, function, admission.remaining(getattr(settings, "LOGIC_COALESCE_TIMEOUT",
+                                                                              DEFAULT_TIMEOUT)))
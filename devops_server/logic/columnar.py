@@ -0,0 +1,173 @@
+"""
+Columnar binary format of fleets, an alternative to the JSON data_centers list.
+
+JSON bodies cost a dict per data center to decode and validate. A columnar
+body holds the numbers of servers as a single array and the names as a single
+blob, so it is loaded with np.frombuffer without copying and validated with
+a few vectorized checks. Names are decoded only when a solution refers to them.
+
+Layout, all integers little-endian:
+    8 bytes       MAGIC
+    4 bytes       uint32 length of the header
+    header        UTF-8 JSON object, e.g. {"DM_capacity": 4, "DE_capacity": 1, "sites": 3};
+                  DM_count is optional and the capacities may be left out of fleets
+                  stored on their own; series of fleets also give the number of
+                  time steps, e.g. {"sites": 3, "steps": 2160}, see replay
+    padding       zero bytes up to a multiple of 8
+    8 * n bytes   int64 number of servers per data center; for series, 8 * steps * n
+                  bytes holding a row per time step
+    8 * (n + 1)   int64 offsets of the names in the blob, starting with 0
+    blob          UTF-8 names of the data centers, concatenated
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from .validation import (CAPACITY_FIELDS, INT64_SAFE_LIMIT, OPTIONAL_BODY_FIELDS, CompactFleet,
+                         dict_raise_on_duplicates, validate_capacity)
+
+CONTENT_TYPE = "application/x-dm-fleet"
+MAGIC = b"DMFLEET1"
+HEADER_LENGTH = struct.Struct("<I")
+INT64 = np.dtype("<i8")
+
+
+class NameTable:
+    """
+    Read-only sequence of data center names backed by a UTF-8 blob and an
+    array of offsets; names are decoded on access
+    """
+
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int):
+        if not -len(self) <= index < len(self):
+            raise IndexError("name index out of range")
+        index %= len(self)
+        return bytes(self.blob[int(self.offsets[index]):int(self.offsets[index + 1])]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def tobytes(self):
+        """
+        :return: offsets and blob as bytes, a canonical form of the names
+        """
+        return self.offsets.tobytes() + bytes(self.blob)
+
+
+def dumps(names: list, servers, header: dict):
+    """
+    Encodes a fleet into the columnar format
+
+    :param names: names of the data centers
+    :param servers: numbers of servers per data center, or a list of them per time step
+    :param header: capacities and DM_count to store along with the data centers
+    :return: encoded fleet
+    """
+    encoded = [name.encode("utf-8") for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=INT64)
+    np.cumsum([len(name) for name in encoded], out=offsets[1:])
+    servers = np.asarray(servers, dtype=INT64)
+    if servers.ndim == 2:
+        header = dict(header, steps=len(servers))
+    meta = json.dumps(dict(header, sites=len(encoded))).encode("utf-8")
+    start = len(MAGIC) + HEADER_LENGTH.size + len(meta)
+    return b"".join([MAGIC, HEADER_LENGTH.pack(len(meta)), meta, b"\0" * (-start % 8),
+                     servers.tobytes(), offsets.tobytes()] + encoded)
+
+
+def read_columns(buffer):
+    """
+    Decodes the layout of a columnar fleet without copying its columns.
+    Checks the structure and the values of the columns, not the header fields.
+
+    :param buffer: bytes, memoryview or memory map holding the encoded fleet
+    :return: tuple (header, int64 servers array, NameTable), raises ValueError on a malformed buffer;
+             the servers array has a row per time step when the header gives steps
+    """
+    view = memoryview(buffer)
+    if len(view) < len(MAGIC) + HEADER_LENGTH.size or bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Expecting a columnar fleet starting with {magic}".format(magic=MAGIC))
+    length, = HEADER_LENGTH.unpack_from(view, len(MAGIC))
+    start = len(MAGIC) + HEADER_LENGTH.size
+    try:
+        header = json.loads(bytes(view[start:start + length]), object_pairs_hook=dict_raise_on_duplicates)
+    except ValueError as err:
+        raise ValueError("Malformed columnar header: {err}".format(err=err))
+    if type(header) != dict or type(header.get("sites")) != int or header["sites"] < 0:
+        raise ValueError("Columnar header must be an object with the number of sites, "
+                         "got {header}".format(header=header))
+
+    if "steps" in header and (type(header["steps"]) != int or header["steps"] < 1):
+        raise ValueError("Number of steps must be a positive integer, got {steps}".format(steps=header["steps"]))
+
+    sites = header["sites"]
+    values = sites * header.get("steps", 1)
+    start += length + (-(start + length) % 8)
+    blob_start = start + 8 * (values + sites + 1)
+    if blob_start > len(view):
+        raise ValueError("Columnar fleet is truncated: expecting {sites} sites".format(sites=sites))
+    servers = np.frombuffer(view, dtype=INT64, count=values, offset=start)
+    offsets = np.frombuffer(view, dtype=INT64, count=sites + 1, offset=start + 8 * values)
+    blob = view[blob_start:]
+
+    if values and servers.min() < 1:
+        index = int(np.argmin(servers))
+        raise ValueError("Numeric value for servers {value} is smaller than 1 "
+                         "for data center {index}".format(value=servers[index], index=index % sites))
+    if "steps" in header:
+        servers = servers.reshape(header["steps"], sites)
+    if offsets[0] != 0 or offsets[-1] != len(blob) or (np.diff(offsets) < 0).any():
+        raise ValueError("Name offsets must grow from 0 to the size of the names blob")
+    try:
+        bytes(blob).decode("utf-8")
+    except UnicodeDecodeError:
+        raise ValueError("Data center names must be UTF-8")
+    # every name must start at a character, not within one
+    characters = np.frombuffer(blob, dtype=np.uint8)
+    starts = offsets[:-1][offsets[:-1] < len(blob)]
+    if ((characters[starts] & 0xC0) == 0x80).any():
+        raise ValueError("Data center names must be UTF-8")
+    return header, servers, NameTable(blob, offsets)
+
+
+def loads(raw: bytes):
+    """
+    Loads and validates a columnar request body, applying the rules of
+    validate_body to the header and to the columns
+
+    :param raw: raw request body
+    :return: CompactFleet, raises ValueError on failed validation
+    """
+    header, servers, names = read_columns(raw)
+    fields = set(header) - {"sites"}
+    if not set(CAPACITY_FIELDS) <= fields <= set(CAPACITY_FIELDS) | OPTIONAL_BODY_FIELDS:
+        raise ValueError("Got unexpected set of header fields {fields} "
+                         "instead of {expected}".format(fields=fields, expected=set(CAPACITY_FIELDS)))
+    for key in fields:
+        validate_capacity(key, header[key])
+    return compact_fleet(header["DM_capacity"], header["DE_capacity"], names, servers, header.get("DM_count"))
+
+
+def compact_fleet(dm_capacity: int, de_capacity: int, names: NameTable, servers: np.ndarray,
+                  dm_count: int = None):
+    """
+    Wraps validated columns into a CompactFleet, keeping the int64 array
+    unless solving it could overflow, see validation.pack_servers
+
+    :return: CompactFleet
+    """
+    if (dm_capacity >= INT64_SAFE_LIMIT or de_capacity >= INT64_SAFE_LIMIT
+            or len(servers) and int(servers.max()) * len(servers) >= INT64_SAFE_LIMIT):
+        servers = servers.astype(object)
+    return CompactFleet(dm_capacity, de_capacity, names, servers, dm_count)
@@ -0,0 +1,266 @@
+"""
+Content codings of request and response bodies.
+
+Responses are compressed with the coding the client prefers in its
+Accept-Encoding header, among zstd and gzip, by CompressionMiddleware. Buffered
+responses smaller than settings.LOGIC_COMPRESSION_MIN_BYTES are sent as they
+are. Streamed responses, see responses, are compressed chunk by chunk, so that
+only the chunk being compressed is held in memory.
+
+Request bodies may be sent compressed with a Content-Encoding header of gzip or
+zstd. They are decompressed as they are read, see decoded, and a body larger
+than settings.LOGIC_COMPRESSION_MAX_BODY_BYTES once decompressed is rejected
+with 413. As their decompressed size is unknown until they are read, see
+body_size, compressed bodies are streamed, solved off the event loop and given
+the largest admission cost, like chunked uploads.
+
+zstd is available when the zstandard package is installed.
+"""
+
+import gzip
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MIN_BYTES = 1024
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024 * 1024
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_ZSTD_LEVEL = 3
+CHUNK_SIZE = 64 * 1024
+# Raised by decompressors on malformed input
+DECODE_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def codings():
+    """
+    :return: supported content codings, the preferred one first
+    """
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str):
+    """
+    Picks the coding of a response, see RFC 9110 section 12.5.3
+
+    :param accept_encoding: value of the Accept-Encoding header of the request
+    :return: name of the coding, None to send the response as it is
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.partition(";")
+        coding = coding.strip().lower()
+        weight = 1.0
+        parameter, _, value = parameters.partition("=")
+        if parameter.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                continue
+        if coding:
+            weights[coding] = weight
+    best = None
+    for coding in codings():
+        weight = weights.get(coding, weights.get("*", 0))
+        if weight > 0 and (best is None or weight > best[0]):
+            best = (weight, coding)
+    return best[1] if best else None
+
+
+class Compressor:
+    """
+    Incremental compressor of one body
+    """
+
+    def __init__(self, coding: str):
+        if coding == "zstd":
+            self.compressor = zstandard.ZstdCompressor(
+                level=getattr(settings, "LOGIC_COMPRESSION_ZSTD_LEVEL", DEFAULT_ZSTD_LEVEL)).compressobj()
+        else:
+            self.compressor = zlib.compressobj(getattr(settings, "LOGIC_COMPRESSION_GZIP_LEVEL", DEFAULT_GZIP_LEVEL),
+                                               zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes):
+        return self.compressor.compress(chunk)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+def compress(content: bytes, coding: str):
+    """
+    :return: content compressed with the coding
+    """
+    compressor = Compressor(coding)
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_chunks(chunks, coding: str):
+    """
+    :param chunks: iterable of bytes
+    :return: generator of the compressed chunks
+    """
+    compressor = Compressor(coding)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def compress_async_chunks(chunks, coding: str):
+    """
+    :param chunks: asynchronous iterable of bytes
+    :return: asynchronous generator of the compressed chunks
+    """
+    compressor = Compressor(coding)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def compress_response(request, response):
+    """
+    Compresses a response with the coding accepted by the client, when worth it
+
+    :param request: request answered by the response
+    :param response: HttpResponse or StreamingHttpResponse
+    :return: the response, compressed in place
+    """
+    if response.has_header("Content-Encoding"):
+        return response
+    if not response.streaming and len(response.content) < getattr(settings, "LOGIC_COMPRESSION_MIN_BYTES",
+                                                                  DEFAULT_MIN_BYTES):
+        return response
+    patch_vary_headers(response, ("Accept-Encoding",))
+    coding = negotiate(request.headers.get("Accept-Encoding", ""))
+    if coding is None:
+        return response
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = compress_async_chunks(response.streaming_content, coding)
+        else:
+            response.streaming_content = compress_chunks(response.streaming_content, coding)
+        # the compressed size is only known once everything is sent
+        del response.headers["Content-Length"]
+    else:
+        response.content = compress(response.content, coding)
+        response.headers["Content-Length"] = str(len(response.content))
+    etag = response.get("ETag")
+    if etag and etag.startswith('"'):
+        # the representation changed, see RFC 9110 section 8.8.1
+        response.headers["ETag"] = "W/" + etag
+    response.headers["Content-Encoding"] = coding
+    return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses, see compress_response; runs in both the WSGI and ASGI handlers
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress_response(request, await self.get_response(request))
+
+
+class TooLarge(ValueError):
+    """
+    Raised when a request body is larger than allowed, answered with 413
+    """
+
+
+class DecodedStream:
+    """
+    Binary stream of a request body decompressed as it is read, with read(size)
+    like HttpRequest; raises ValueError on a malformed body, TooLarge on a too large one
+    """
+
+    def __init__(self, reader, coding: str, limit: int = None):
+        self.reader = reader
+        self.coding = coding
+        self.limit = limit
+        self.size = 0
+
+    def read(self, size: int = -1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(CHUNK_SIZE), b""))
+        try:
+            data = self.reader.read(size)
+        except DECODE_ERRORS as err:
+            raise ValueError("Malformed {coding} request body: {err}".format(coding=self.coding, err=err))
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            raise TooLarge("Request body is larger than {limit} bytes once decompressed".format(limit=self.limit))
+        return data
+
+
+def content_coding(request):
+    """
+    :param request: incoming request
+    :return: coding of the request body, None when it is not compressed;
+             raises ValueError on an unsupported coding
+    """
+    coding = request.headers.get("Content-Encoding", "").strip().lower()
+    if coding in ("", "identity"):
+        return None
+    if coding not in codings():
+        raise ValueError("Unsupported Content-Encoding {coding}, expecting one of {expected}".format(
+            coding=coding, expected=", ".join(codings())))
+    return coding
+
+
+def body_size(request):
+    """
+    :param request: incoming request
+    :return: size of the body from its Content-Length, None when it is unknown: for a
+             compressed body, whose decompressed size is only known once it is read,
+             or for a chunked upload
+    """
+    if request.headers.get("Content-Encoding", "").strip().lower() not in ("", "identity"):
+        return None
+    try:
+        return int(request.META.get("CONTENT_LENGTH"))
+    except (TypeError, ValueError):
+        return None
+
+
+def decoded(request, limit: int = None):
+    """
+    :param request: incoming request
+    :param limit: largest size of the decompressed body, by default
+                  settings.LOGIC_COMPRESSION_MAX_BODY_BYTES
+    :return: the request, or a DecodedStream of its body when it is compressed;
+             raises ValueError on an unsupported coding
+    """
+    coding = content_coding(request)
+    if coding is None:
+        return request
+    if coding == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(request, read_across_frames=True)
+    else:
+        reader = gzip.GzipFile(fileobj=request, mode="rb")
+    if limit is None:
+        limit = getattr(settings, "LOGIC_COMPRESSION_MAX_BODY_BYTES", DEFAULT_MAX_BODY_BYTES)
+    return DecodedStream(reader, coding, limit)
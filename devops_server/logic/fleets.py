@@ -0,0 +1,278 @@
+"""
+Stateful fleets: a fleet is created once and then updated a few data centers
+at a time, keeping its optimal DM placement current.
+
+A fleet keeps the baseline (DE's needed without DM) and a max-heap of
+per-site savings, see solver.site_saving. Updating, adding or removing a
+data center adjusts the baseline and pushes a new heap entry, so every update
+costs O(log n). Outdated heap entries are dropped lazily when they reach the
+top, and the heap is rebuilt once they outnumber the live ones.
+
+Data centers are addressed by name, which must therefore be unique within
+a fleet. Ties are resolved in favour of the data center added first, which
+is the order solve_problem uses for the equivalent data_centers list.
+
+Fleets are kept in the memory of the server process, see Registry, with the
+following settings:
+    LOGIC_FLEETS_MAX_COUNT: maximum number of fleets, the least recently used
+                            one is dropped to register a new one
+    LOGIC_FLEETS_TTL: number of seconds a fleet is kept after it was last used,
+                      None for no expiry
+"""
+
+from collections import OrderedDict
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import solver
+from .validation import validate_body, validate_data_center
+
+DEFAULT_MAX_COUNT = 1000
+DEFAULT_TTL = 24 * 3600
+
+
+class Fleet:
+    """
+    Data centers of a fleet along with the running state of the solver
+    """
+
+    def __init__(self, dm_capacity: int, de_capacity: int):
+        self.dm_capacity = dm_capacity
+        self.de_capacity = de_capacity
+        self.baseline = 0
+        # name -> (order, servers, saving)
+        self.sites = {}
+        # entries (-saving, order, name)
+        self.heap = []
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_body(cls, body: dict):
+        """
+        Creates a fleet from a request body accepted by process(request)
+
+        :param body: validated request body
+        :return: new fleet
+        """
+        fleet = cls(body['DM_capacity'], body['DE_capacity'])
+        for data_center in body['data_centers']:
+            if data_center['name'] in fleet.sites:
+                raise ValueError("Data center names must be unique within a fleet, "
+                                 "got {name} twice".format(name=data_center['name']))
+            fleet._set(data_center['name'], data_center['servers'])
+        return fleet
+
+    def _set(self, name: str, servers: int):
+        """
+        Adds a data center or changes its number of servers in O(log n)
+        """
+        current = self.sites.get(name)
+        if current is not None:
+            order = current[0]
+            self.baseline -= solver.de_count(current[1], self.de_capacity)
+        else:
+            order = next(self.order)
+        saving = solver.site_saving(servers, self.dm_capacity, self.de_capacity)
+        self.baseline += solver.de_count(servers, self.de_capacity)
+        self.sites[name] = (order, servers, saving)
+        heapq.heappush(self.heap, (-saving, order, name))
+
+    def _remove(self, name: str):
+        """
+        Removes a data center in O(1); its heap entries become outdated
+        """
+        servers = self.sites.pop(name)[1]
+        self.baseline -= solver.de_count(servers, self.de_capacity)
+
+    def _is_current(self, entry: tuple):
+        site = self.sites.get(entry[2])
+        return site is not None and site[0] == entry[1] and site[2] == -entry[0]
+
+    def _compact(self):
+        """
+        Rebuilds the heap from live data centers once outdated entries dominate
+        """
+        if len(self.heap) > 2 * len(self.sites) + 16:
+            self.heap = [(-saving, order, name) for name, (order, servers, saving) in self.sites.items()]
+            heapq.heapify(self.heap)
+
+    def update(self, data_centers: list = (), remove: list = ()):
+        """
+        Applies changes to the fleet. All changes are validated before any of them is applied.
+
+        :param data_centers: data centers to add or update, in the data_centers list format
+        :param remove: names of data centers to remove
+        :return: raises ValueError on failed validation
+        """
+        with self.lock:
+            names = set()
+            for data_center in data_centers:
+                validate_data_center(data_center)
+                if data_center['name'] in names:
+                    raise ValueError("Data center {name} is updated twice".format(name=data_center['name']))
+                names.add(data_center['name'])
+            removed = set()
+            for name in remove:
+                if type(name) != str:
+                    raise ValueError("Data center name must be str, got {name}".format(name=name))
+                if name not in self.sites:
+                    raise ValueError("Unknown data center {name}".format(name=name))
+                if name in names:
+                    raise ValueError("Data center {name} is both updated and removed".format(name=name))
+                if name in removed:
+                    raise ValueError("Data center {name} is removed twice".format(name=name))
+                removed.add(name)
+
+            for name in remove:
+                self._remove(name)
+            for data_center in data_centers:
+                self._set(data_center['name'], data_center['servers'])
+            self._compact()
+
+    def solution(self):
+        """
+        :return: optimal solution in the format returned by solve_problem;
+                 an empty fleet needs no DE's and has no DM data center
+        """
+        with self.lock:
+            while self.heap and not self._is_current(self.heap[0]):
+                heapq.heappop(self.heap)
+            if not self.heap:
+                return {"DE": 0, "DM_data_center": None}
+            saving, order, name = self.heap[0]
+            return {"DE": self.baseline + saving, "DM_data_center": name}
+
+
+class Registry:
+    """
+    Registered fleets with LRU eviction and a time to live since their last use
+    """
+
+    def __init__(self, size: int = DEFAULT_MAX_COUNT, ttl: float = DEFAULT_TTL):
+        self.size = size
+        self.ttl = ttl
+        # fleet id -> (fleet, expiry), least recently used first
+        self.fleets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expiry(self):
+        return None if self.ttl is None else time.monotonic() + self.ttl
+
+    def add(self, fleet_id: str, fleet: Fleet):
+        with self.lock:
+            self.fleets[fleet_id] = (fleet, self._expiry())
+            now = time.monotonic()
+            # fleets are ordered by last use, so the expired ones come first
+            while self.fleets:
+                _, expires = next(iter(self.fleets.values()))
+                if len(self.fleets) <= self.size and (expires is None or expires >= now):
+                    break
+                self.fleets.popitem(last=False)
+
+    def get(self, fleet_id: str):
+        with self.lock:
+            entry = self.fleets.get(fleet_id)
+            if entry is None:
+                return None
+            fleet, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self.fleets[fleet_id]
+                return None
+            self.fleets[fleet_id] = (fleet, self._expiry())
+            self.fleets.move_to_end(fleet_id)
+            return fleet
+
+    def delete(self, fleet_id: str):
+        with self.lock:
+            return self.fleets.pop(fleet_id, None) is not None
+
+    def __len__(self):
+        return len(self.fleets)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    :return: Registry configured from settings
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = Registry(getattr(settings, "LOGIC_FLEETS_MAX_COUNT", DEFAULT_MAX_COUNT),
+                                     getattr(settings, "LOGIC_FLEETS_TTL", DEFAULT_TTL))
+    return _registry
+
+
+@receiver(setting_changed)
+def reset_registry(setting, **kwargs):
+    """
+    Drops the registered fleets when fleet settings change, e.g. in tests
+    """
+    global _registry
+    if setting.startswith("LOGIC_FLEETS"):
+        _registry = None
+
+
+def create(body: dict):
+    """
+    Validates the body and registers a new fleet
+
+    :param body: request body accepted by process(request)
+    :return: tuple (fleet id, fleet)
+    """
+    validate_body(body)
+    if "DM_count" in body:
+        raise ValueError("Fleets place a single DM, DM_count is not supported")
+    fleet = Fleet.from_body(body)
+    fleet_id = uuid.uuid4().hex
+    get_registry().add(fleet_id, fleet)
+    return fleet_id, fleet
+
+
+def get(fleet_id: str):
+    """
+    :return: registered fleet or None, e.g. when it was evicted
+    """
+    return get_registry().get(fleet_id)
+
+
+def delete(fleet_id: str):
+    """
+    :return: True when the fleet was registered
+    """
+    return get_registry().delete(fleet_id)
+
+
+def validate_update(body: dict):
+    """
+    Validates the structure of a fleet update request body:
+    {"data_centers": [{"name": "City", "servers": 3}, ...], "remove": ["City2", ...]}
+    where both fields are optional. Entries are validated by Fleet.update
+
+    :param body: request body to validate
+    :return: raises ValueError on failed validation
+    """
+    if type(body) != dict:
+        raise ValueError("Expecting an object, instead got value {body}".format(body=body))
+    fields_set = {"data_centers", "remove"}
+    if not set(body) <= fields_set:
+        raise ValueError("Got unexpected set of fields {body} "
+                         "instead of a subset of {expected}".format(body=set(body), expected=fields_set))
+    if type(body.get("data_centers", [])) != list:
+        raise ValueError("Expecting a list of data centers, "
+                         "instead got value {data_centers} instead".format(data_centers=body["data_centers"]))
+    if type(body.get("remove", [])) != list:
+        raise ValueError("Expecting a list of data center names to remove, "
+                         "instead got value {remove}".format(remove=body["remove"]))
@@ -0,0 +1,155 @@
+"""
+Benchmark suite of the planning endpoint.
+
+For synthetic fleets of growing size, times every stage of a request on its own:
+parsing (json.loads with dict_raise_on_duplicates), validation (compile_body, which
+validate_body runs), solving (solve_fleet) and the whole POST through Django's test
+Client. Peak memory of every stage is recorded in a separate run with tracemalloc,
+so that tracing does not distort the timings.
+
+Results are written as JSON and can be compared with the results of an earlier
+commit; the command fails when a stage got slower than the regression threshold.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from logic.synthetic import fleet_body
+from logic.validation import compile_body, dict_raise_on_duplicates
+from logic.views import solve_fleet
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+# Sizes added by --large: a run of 1,000,000 data centers takes tens of seconds
+LARGE_SIZES = [1000000]
+
+STAGES = ["parse", "validate", "solve", "request"]
+
+
+def stage_functions(sites: int):
+    """
+    :param sites: number of data centers of the synthetic fleet
+    :return: dict of stage name to a function running that stage once
+    """
+    raw = json.dumps(fleet_body(sites)).encode("utf-8")
+    body = json.loads(raw, object_pairs_hook=dict_raise_on_duplicates)
+    fleet = compile_body(body)
+    client = Client()
+    return {
+        "parse": lambda: json.loads(raw, object_pairs_hook=dict_raise_on_duplicates),
+        "validate": lambda: compile_body(body),
+        "solve": lambda: solve_fleet(fleet),
+        "request": lambda: client.post("/api/devops", data=raw, content_type="application/json"),
+    }
+
+
+def measure(function, repeat: int):
+    """
+    :return: dict with the median run time in seconds and the peak of traced memory in bytes
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": statistics.median(timings), "peak_bytes": peak}
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float, min_seconds: float):
+    """
+    Compares benchmark results with the results of an earlier run
+
+    :param results: results of this run
+    :param baseline: results of the earlier run
+    :param threshold: allowed relative slowdown, e.g. 0.2 for 20%
+    :param min_seconds: stages faster than that in the baseline are too noisy to compare
+    :return: list of messages describing stages slower than allowed
+    """
+    regressions = []
+    for size, stages in results["results"].items():
+        for stage, result in stages.items():
+            previous = baseline["results"].get(size, {}).get(stage)
+            if previous is None or previous["seconds"] < min_seconds:
+                continue
+            slowdown = result["seconds"] / previous["seconds"] - 1
+            if slowdown > threshold:
+                regressions.append("{stage} with {size} sites is {slowdown:.0%} slower: "
+                                   "{before:.6f}s -> {after:.6f}s".format(
+                                    stage=stage, size=size, slowdown=slowdown,
+                                    before=previous["seconds"], after=result["seconds"]))
+    return regressions
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Times parsing, validation, solving and whole requests for synthetic fleets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                            default=DEFAULT_SIZES, help="comma separated numbers of data centers")
+        parser.add_argument("--large", action="store_true",
+                            help="also run {sizes} data centers".format(
+                                sizes=", ".join(str(size) for size in LARGE_SIZES)))
+        parser.add_argument("--repeat", type=int, default=5, help="number of timed runs per stage")
+        parser.add_argument("--output", help="file to write the results to as JSON")
+        parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="allowed relative slowdown against the baseline")
+        parser.add_argument("--min-seconds", type=float, default=0.001,
+                            help="stages faster than that in the baseline are not compared")
+
+    def handle(self, *args, **options):
+        results = {
+            "meta": {
+                "commit": current_commit(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "repeat": options["repeat"],
+            },
+            "results": {},
+        }
+
+        self.stdout.write("{:>9}  {:<9}{:>14}{:>14}".format("sites", "stage", "seconds", "peak MiB"))
+        with override_settings(LOGIC_CACHE_ENABLED=False, ALLOWED_HOSTS=["testserver"]):
+            sizes = options["sizes"] + [size for size in LARGE_SIZES
+                                        if options["large"] and size not in options["sizes"]]
+            for size in sizes:
+                stages = {}
+                for stage, function in stage_functions(size).items():
+                    stages[stage] = measure(function, options["repeat"])
+                    self.stdout.write("{:>9}  {:<9}{:>14.6f}{:>14.2f}".format(
+                        size, stage, stages[stage]["seconds"], stages[stage]["peak_bytes"] / 2 ** 20))
+                results["results"][str(size)] = stages
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                regressions = find_regressions(results, json.load(baseline),
+                                               options["threshold"], options["min_seconds"])
+            if regressions:
+                raise CommandError("Performance regressions found:\n" + "\n".join(regressions))
+            self.stdout.write("No regressions against {baseline}".format(baseline=options["baseline"]))
@@ -0,0 +1,151 @@
+"""
+Local throughput comparison of the WSGI and ASGI entry points.
+
+Both applications are driven in-process, each one in its own subprocess so
+that /api/devops is routed to process or process_async respectively.
+Slow clients are simulated by delaying the delivery of every request body.
+Every request carries a different fleet, so that the result cache does not
+answer them.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from logic.synthetic import fleet_body, wsgi_environ
+
+
+class SlowInput(io.BytesIO):
+    """
+    wsgi.input delivering the body after a delay, as a slow client upload would
+    """
+
+    def __init__(self, body: bytes, delay: float):
+        super().__init__(body)
+        self.delay = delay
+
+    def read(self, *args):
+        if self.delay:
+            time.sleep(self.delay)
+            self.delay = 0
+        return super().read(*args)
+
+
+def percentile(latencies: list, fraction: float):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_wsgi(bodies: list, concurrency: int, threads: int, delay: float):
+    """
+    Sends requests to the WSGI application, serving them from a pool of threads
+    the way a WSGI worker does; concurrency does not matter beyond the thread count
+
+    :return: list of latencies in seconds
+    """
+    from devops.wsgi import application
+
+    def send(body):
+        start = time.perf_counter()
+        response = application(wsgi_environ("/api/devops", body, SlowInput(body, delay)),
+                               lambda status, headers: None)
+        b"".join(response)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(send, bodies))
+
+
+def run_asgi(bodies: list, concurrency: int, threads: int, delay: float):
+    """
+    Sends requests to the ASGI application from one event loop, at most
+    concurrency at a time
+
+    :return: list of latencies in seconds
+    """
+    from devops.asgi import application
+
+    async def send_one(semaphore, body):
+        async with semaphore:
+            received = []
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "POST",
+                "scheme": "http",
+                "path": "/api/devops",
+                "raw_path": b"/api/devops",
+                "query_string": b"",
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())],
+                "server": ("localhost", 8000),
+            }
+
+            async def receive():
+                if received:
+                    await asyncio.Event().wait()
+                received.append(True)
+                if delay:
+                    await asyncio.sleep(delay)
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(message):
+                pass
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - start
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(send_one(semaphore, body) for body in bodies))
+
+    return asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = "Compares throughput of the WSGI and ASGI entry points on /api/devops"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sites", type=int, default=1000, help="number of data centers per request")
+        parser.add_argument("--requests", type=int, default=200, help="number of requests per run")
+        parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent requests")
+        parser.add_argument("--wsgi-threads", type=int, default=1,
+                            help="number of threads of the WSGI worker, 1 for a synchronous worker")
+        parser.add_argument("--upload-delay", type=float, default=0.0,
+                            help="milliseconds it takes a client to upload a body")
+        parser.add_argument("--handler", choices=["wsgi", "asgi"], help="run a single handler in this process")
+
+    def handle(self, *args, **options):
+        if options["handler"]:
+            bodies = [json.dumps(fleet_body(options["sites"], seed)).encode("utf-8")
+                      for seed in range(options["requests"])]
+            run = run_wsgi if options["handler"] == "wsgi" else run_asgi
+            start = time.perf_counter()
+            latencies = run(bodies, options["concurrency"], options["wsgi_threads"], options["upload_delay"] / 1000)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(json.dumps({
+                "throughput": len(latencies) / elapsed,
+                "p50": percentile(latencies, 0.5),
+                "p99": percentile(latencies, 0.99),
+            }))
+            return
+
+        self.stdout.write("{:<6}{:>14}{:>12}{:>12}".format("", "requests/s", "p50 ms", "p99 ms"))
+        for handler, flag in (("wsgi", "0"), ("asgi", "1")):
+            command = [sys.executable, sys.argv[0], "compare_handlers", "--handler", handler]
+            for option in ("sites", "requests", "concurrency", "wsgi_threads", "upload_delay"):
+                command += ["--" + option.replace("_", "-"), str(options[option])]
+            env = dict(os.environ, LOGIC_ASYNC_PROCESS=flag)
+            output = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE).stdout
+            result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+            self.stdout.write("{:<6}{:>14.1f}{:>12.2f}{:>12.2f}".format(
+                handler, result["throughput"], result["p50"] * 1000, result["p99"] * 1000))
@@ -0,0 +1,229 @@
+"""
+Open-loop load test of the planning endpoint.
+
+Requests are sent at a fixed arrival rate, either evenly spaced or as a Poisson
+process, regardless of how fast earlier requests are answered. The latency of
+a request is measured from the time it was scheduled to be sent, not from the
+time a client thread got to send it, so queueing behind a slow server shows up
+in the latencies instead of lowering the load (coordinated omission).
+
+Payloads are drawn from a weighted mix of fleet sizes, and a share of them is
+invalid and expected to be answered with 400. Each arrival rate runs for the
+given duration, and the resulting saturation curve shows the throughput achieved
+and the latency percentiles for every rate.
+
+The Django application is driven in-process through its WSGI handler, sharing
+the interpreter with the client threads, or a running server is targeted with --url.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import random
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logic.metrics import SECONDS_BUCKETS
+from logic.synthetic import fleet_body, wsgi_environ
+
+PERCENTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+
+# Payloads failing validation, each answered with 400
+INVALID_BODIES = [
+    b'{"DM_capacity": 1, "DE_capacity": 1}',
+    b'{"DM_capacity": 0, "DE_capacity": 1, "data_centers": [{"name": "A", "servers": 1}]}',
+    b'{"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": "A", "servers": 1.5}]}',
+    b'{"DM_capacity": 1, "DM_capacity": 1, "DE_capacity": 1, "data_centers": []}',
+    b'{"DM_capacity": 1, "DE_capacity": 1, "data_centers": []}',
+    b'{"DM_capacity": 1, "DE_capacity": 1, "data_centers": [',
+]
+
+
+def parse_mix(value: str):
+    """
+    :param value: comma separated sizes with optional weights, e.g. "10:5,1000:4,100000:1"
+    :return: list of tuples (number of data centers, weight)
+    """
+    mix = []
+    for item in value.split(","):
+        size, _, weight = item.partition(":")
+        mix.append((int(size), float(weight or 1)))
+    return mix
+
+
+def arrival_times(rate: float, duration: float, poisson: bool, rng: random.Random):
+    """
+    :param rate: number of requests per second
+    :param duration: number of seconds to send requests for
+    :param poisson: exponential gaps between requests instead of even ones
+    :return: list of times to send the requests at, in seconds from the start
+    """
+    times = []
+    current = 0.0
+    while True:
+        current += rng.expovariate(rate) if poisson else 1 / rate
+        if current >= duration:
+            return times
+        times.append(current)
+
+
+def percentile(latencies: list, fraction: float):
+    """
+    :param latencies: latencies sorted in ascending order
+    :return: smallest latency not exceeded by the given fraction of requests
+    """
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+def summarize(rate: float, outcomes: list, elapsed: float, duration: float):
+    """
+    :param rate: offered number of requests per second
+    :param outcomes: list of tuples (latency in seconds, status code, expected status code)
+    :param elapsed: seconds from the first scheduled request to the last response
+    :param duration: seconds the requests were scheduled over
+    :return: dict with throughput, latency percentiles and histogram, unexpected statuses,
+             and whether the server fell behind the offered load
+    """
+    latencies = sorted(latency for latency, _, _ in outcomes)
+    histogram = [0] * (len(SECONDS_BUCKETS) + 1)
+    for latency in latencies:
+        for position, bound in enumerate(SECONDS_BUCKETS):
+            if latency <= bound:
+                histogram[position] += 1
+                break
+        else:
+            histogram[-1] += 1
+    summary = {
+        "rate": rate,
+        "requests": len(outcomes),
+        "throughput": len(outcomes) / elapsed if elapsed else 0,
+        "errors": sum(1 for _, status, expected in outcomes if status != expected),
+        "saturated": bool(outcomes) and len(outcomes) / elapsed < 0.95 * len(outcomes) / duration,
+        "histogram": dict(zip([str(bound) for bound in SECONDS_BUCKETS] + ["+Inf"], histogram)),
+    }
+    for key, fraction in PERCENTILES:
+        summary[key] = percentile(latencies, fraction) if latencies else None
+    return summary
+
+
+def in_process_sender():
+    """
+    :return: function posting a body to /api/devops of the WSGI application and returning the status code
+    """
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    # invalid payloads are expected, do not log every 400
+    logging.getLogger("django.request").setLevel(logging.ERROR)
+
+    def send(body: bytes):
+        status = []
+        response = application(wsgi_environ("/api/devops", body),
+                                lambda line, headers: status.append(int(line.split()[0])))
+        b"".join(response)
+        return status[0]
+
+    return send
+
+
+def url_sender(url: str):
+    """
+    :return: function posting a body to the URL and returning the status code
+    """
+    def send(body: bytes):
+        request = urllib.request.Request(url, data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as err:
+            err.read()
+            return err.code
+
+    return send
+
+
+def run_rate(send, payloads: list, times: list, concurrency: int):
+    """
+    Sends the payloads at the scheduled times from a pool of client threads
+
+    :param payloads: list of tuples (body, expected status code), one per scheduled time
+    :param times: times to send the requests at, in seconds from the start
+    :return: tuple (list of (latency, status, expected status), seconds until the last response)
+    """
+    def timed(body, expected, scheduled):
+        status = send(body)
+        finished = time.perf_counter()
+        return finished - scheduled, status, expected, finished
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        for offset, (body, expected) in zip(times, payloads):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(timed, body, expected, scheduled))
+        results = [future.result() for future in futures]
+    last = max((finished for _, _, _, finished in results), default=start)
+    return [result[:3] for result in results], last - start
+
+
+class Command(BaseCommand):
+    help = "Puts open-loop load on /api/devops and reports throughput, latency percentiles and saturation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="URL of a running /api/devops endpoint; the app runs in-process otherwise")
+        parser.add_argument("--rates", type=lambda value: [float(rate) for rate in value.split(",")],
+                            default=[50, 100, 200, 400], help="comma separated arrival rates in requests/s")
+        parser.add_argument("--duration", type=float, default=10, help="seconds to run every arrival rate for")
+        parser.add_argument("--mix", type=parse_mix, default=parse_mix("10:5,1000:4,100000:1"),
+                            help="comma separated numbers of data centers with weights, e.g. 10:5,1000:1")
+        parser.add_argument("--invalid", type=float, default=0.1, help="share of invalid payloads")
+        parser.add_argument("--pool", type=int, default=16, help="number of distinct fleets per size")
+        parser.add_argument("--concurrency", type=int, default=64, help="maximum number of requests in flight")
+        parser.add_argument("--arrivals", choices=["poisson", "uniform"], default="poisson",
+                            help="distribution of the gaps between requests")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="file to write the results to as JSON")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["invalid"] <= 1:
+            raise CommandError("--invalid must be within [0, 1]")
+        rng = random.Random(options["seed"])
+        sizes = [size for size, _ in options["mix"]]
+        weights = [weight for _, weight in options["mix"]]
+        fleets = {size: [json.dumps(fleet_body(size, seed=options["seed"] + i)).encode("utf-8")
+                         for i in range(options["pool"])] for size in sizes}
+        send = url_sender(options["url"]) if options["url"] else in_process_sender()
+
+        def payload():
+            if rng.random() < options["invalid"]:
+                return rng.choice(INVALID_BODIES), 400
+            return rng.choice(fleets[rng.choices(sizes, weights)[0]]), 200
+
+        results = []
+        self.stdout.write("{:>10}{:>12}{:>10}{:>10}{:>10}{:>10}{:>8}".format(
+            "offered/s", "achieved/s", "p50 ms", "p95 ms", "p99 ms", "p999 ms", "errors"))
+        for rate in options["rates"]:
+            times = arrival_times(rate, options["duration"], options["arrivals"] == "poisson", rng)
+            outcomes, elapsed = run_rate(send, [payload() for _ in times], times, options["concurrency"])
+            summary = summarize(rate, outcomes, elapsed, options["duration"])
+            results.append(summary)
+            self.stdout.write("{:>10.0f}{:>12.1f}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>8}{}".format(
+                rate, summary["throughput"], *(summary[key] * 1000 if summary[key] is not None else 0
+                                               for key in ("p50", "p95", "p99", "p999")),
+                summary["errors"], "  saturated" if summary["saturated"] else ""))
+            if options["verbosity"] > 1:
+                for bound, count in summary["histogram"].items():
+                    self.stdout.write("    le {:>8} {:>8}".format(bound, count))
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({"options": {key: options[key] for key in
+                                       ("url", "rates", "duration", "mix", "invalid", "concurrency", "arrivals")},
+                           "results": results}, output, indent=2)
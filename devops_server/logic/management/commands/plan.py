@@ -0,0 +1,190 @@
+"""
+Offline bulk planning of problems stored as JSONL.
+
+Every input line is a request body accepted by /api/devops, and every output
+line is the response to it, or {"error": message} when it fails validation,
+in input order; blank lines are skipped. Lines are read in chunks, which are
+solved in worker processes by views.solve_batch. At most two chunks per worker
+are in flight, so memory does not grow with the size of the input.
+
+With --checkpoint, the input position and the output size are recorded after
+every chunk written, and --resume continues an interrupted run from there.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from logic.validation import dict_raise_on_duplicates
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def solve_chunk(lines: list):
+    """
+    Runs in a worker process: solves a chunk of JSONL problems
+
+    :param lines: input lines as bytes
+    :return: tuple (encoded output lines, number of failed problems)
+    """
+    from logic.views import solve_batch
+
+    results = [None] * len(lines)
+    problems = []
+    for i, line in enumerate(lines):
+        try:
+            problems.append((i, json.loads(line, object_pairs_hook=dict_raise_on_duplicates)))
+        except ValueError as err:
+            results[i] = {"error": "Input validation failed, {err}".format(err=err)}
+    for (i, _), result in zip(problems, solve_batch([problem for _, problem in problems])):
+        results[i] = result
+    errors = sum(1 for result in results if "error" in result)
+    return "".join(json.dumps(result) + "\n" for result in results).encode("utf-8"), errors
+
+
+def read_chunks(stream, chunk_size: int):
+    """
+    :param stream: binary input stream
+    :return: generator of tuples (lines, number of bytes they span)
+    """
+    lines, size = [], 0
+    for line in stream:
+        size += len(line)
+        if line.strip():
+            lines.append(line)
+        if len(lines) == chunk_size:
+            yield lines, size
+            lines, size = [], 0
+    if lines or size:
+        yield lines, size
+
+
+def load_checkpoint(path: str):
+    """
+    :return: checkpoint written by an earlier run, or an empty one
+    """
+    try:
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+    except FileNotFoundError:
+        return {"problems": 0, "errors": 0, "input_offset": 0, "output_size": 0}
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """
+    Replaces the checkpoint atomically, so that an interrupted write leaves the previous one
+    """
+    with open(path + ".tmp", "w") as temporary:
+        json.dump(checkpoint, temporary)
+    os.replace(path + ".tmp", path)
+
+
+class Command(BaseCommand):
+    help = "Solves planning problems read from a JSONL file or stdin, writing solutions as JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="JSONL file with a request body per line, - for stdin")
+        parser.add_argument("--output", default="-", help="file to write the solutions to, - for stdout")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="number of problems sent to a worker at a time")
+        parser.add_argument("--checkpoint", help="file recording the progress after every chunk")
+        parser.add_argument("--resume", action="store_true",
+                            help="continue from the checkpoint of an interrupted run")
+        parser.add_argument("--progress", type=float, default=10,
+                            help="seconds between progress reports on stderr")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be at least 1")
+        if options["checkpoint"] and options["output"] == "-":
+            raise CommandError("--checkpoint requires --output to be a file")
+        if options["resume"] and not options["checkpoint"]:
+            raise CommandError("--resume requires --checkpoint")
+
+        checkpoint = {"problems": 0, "errors": 0, "input_offset": 0, "output_size": 0}
+        if options["resume"]:
+            checkpoint = load_checkpoint(options["checkpoint"])
+
+        source = sys.stdin.buffer if options["input"] == "-" else open(options["input"], "rb")
+        if options["output"] == "-":
+            output = sys.stdout.buffer
+        else:
+            output = open(options["output"], "ab" if options["resume"] else "wb")
+        try:
+            self.skip(source, checkpoint["input_offset"], options["input"] == "-")
+            if options["resume"]:
+                output.truncate(checkpoint["output_size"])
+                output.seek(checkpoint["output_size"])
+            self.run(source, output, checkpoint, options)
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+            if output is not sys.stdout.buffer:
+                output.close()
+
+    def skip(self, source, offset: int, is_pipe: bool):
+        """
+        Moves the input past the problems solved before the checkpoint
+        """
+        if not offset:
+            return
+        if not is_pipe:
+            source.seek(offset)
+            return
+        while offset > 0:
+            skipped = len(source.readline(offset))
+            if not skipped:
+                raise CommandError("Input is shorter than the checkpoint")
+            offset -= skipped
+
+    def run(self, source, output, checkpoint: dict, options: dict):
+        start = time.perf_counter()
+        solved = 0
+        last_report = start
+        window = deque()
+        executor = ProcessPoolExecutor(max_workers=options["workers"],
+                                       mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=django.setup)
+        try:
+            chunks = read_chunks(source, options["chunk_size"])
+            while True:
+                # keep at most two chunks per worker in flight
+                for lines, size in chunks:
+                    window.append((executor.submit(solve_chunk, lines), len(lines), size))
+                    if len(window) >= 2 * options["workers"]:
+                        break
+                if not window:
+                    break
+                future, count, size = window.popleft()
+                encoded, errors = future.result()
+                output.write(encoded)
+                output.flush()
+                solved += count
+                checkpoint["problems"] += count
+                checkpoint["errors"] += errors
+                checkpoint["input_offset"] += size
+                if options["checkpoint"]:
+                    os.fsync(output.fileno())
+                    checkpoint["output_size"] = output.tell()
+                    save_checkpoint(options["checkpoint"], checkpoint)
+
+                now = time.perf_counter()
+                if now - last_report >= options["progress"]:
+                    last_report = now
+                    self.report(checkpoint, solved, now - start)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.report(checkpoint, solved, time.perf_counter() - start)
+
+    def report(self, checkpoint: dict, solved: int, elapsed: float):
+        self.stderr.write("{problems} problems done, {errors} failed, {rate:.0f} problems/s".format(
+            problems=checkpoint["problems"], errors=checkpoint["errors"],
+            rate=solved / elapsed if elapsed else 0))
@@ -0,0 +1,208 @@
+"""
+Latency and size metrics of the planning endpoint, exposed in the Prometheus
+text format.
+
+Metrics are recorded without locks: every thread writes to its own shard of
+preallocated counters, and shards are only summed up when the metrics are
+scraped. Shards of finished threads are folded into a retired shard when
+a new thread registers, so short-lived threads do not accumulate.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+# Upper bounds of histogram buckets
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = tuple(2 ** power for power in range(8, 31, 2))
+SITES_BUCKETS = tuple(10 ** power for power in range(0, 8))
+
+STAGES = ("queue", "read", "parse", "validate", "solve", "stream", "serialize")
+
+
+class ShardedValues:
+    """
+    Fixed-size list of numbers, one copy per thread, summed up on read
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.retired = [0] * size
+
+    def shard(self):
+        """
+        :return: list of values owned by the current thread
+        """
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = [0] * self.size
+            with self.lock:
+                alive = []
+                for thread, values in self.shards:
+                    if thread.is_alive():
+                        alive.append((thread, values))
+                    else:
+                        self.retired = [a + b for a, b in zip(self.retired, values)]
+                alive.append((threading.current_thread(), shard))
+                self.shards = alive
+            self.local.shard = shard
+            return shard
+
+    def total(self):
+        """
+        :return: values summed over all threads
+        """
+        with self.lock:
+            shards = [values for _, values in self.shards]
+            total = list(self.retired)
+        for values in shards:
+            total = [a + b for a, b in zip(total, values)]
+        return total
+
+
+class Histogram:
+    """
+    Histogram with preallocated buckets; the last bucket counts values above all bounds
+    """
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # bucket counts followed by the sum of observed values
+        self.values = ShardedValues(len(bounds) + 2)
+
+    def observe(self, value: float):
+        shard = self.values.shard()
+        shard[bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def samples(self, name: str, labels: str):
+        """
+        :return: lines of the Prometheus text format for this histogram
+        """
+        total = self.values.total()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ("+Inf",), total[:-1]):
+            cumulative += count
+            lines.append('{name}_bucket{{{labels}le="{bound}"}} {count}'.format(
+                name=name, labels=labels + "," if labels else "", bound=bound, count=cumulative))
+        braces = "{" + labels + "}" if labels else ""
+        lines.append("{name}_sum{labels} {value}".format(name=name, labels=braces, value=total[-1]))
+        lines.append("{name}_count{labels} {value}".format(name=name, labels=braces, value=cumulative))
+        return lines
+
+
+class Counter:
+    """
+    Monotonic counter
+    """
+
+    def __init__(self):
+        self.values = ShardedValues(1)
+
+    def inc(self, amount: int = 1):
+        self.values.shard()[0] += amount
+
+    def samples(self, name: str, labels: str):
+        braces = "{" + labels + "}" if labels else ""
+        return ["{name}{labels} {value}".format(name=name, labels=braces, value=self.values.total()[0])]
+
+
+class Family:
+    """
+    Metric with one child per value of a label; children are created on first use
+    """
+
+    def __init__(self, name: str, help: str, kind: str, factory, label: str = None, values: tuple = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.factory = factory
+        self.label = label
+        self.lock = threading.Lock()
+        self.values = values
+        self.children = {value: factory() for value in values} if label else {None: factory()}
+
+    def reset(self):
+        """
+        Drops all observations, keeping the children known upfront
+        """
+        with self.lock:
+            self.children = ({value: self.factory() for value in self.values} if self.label
+                             else {None: self.factory()})
+
+    def labels(self, value=None):
+        child = self.children.get(value)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(value, self.factory())
+        return child
+
+    def exposition(self):
+        lines = ["# HELP {name} {help}".format(name=self.name, help=self.help),
+                 "# TYPE {name} {kind}".format(name=self.name, kind=self.kind)]
+        for value, child in sorted(self.children.items(), key=lambda item: str(item[0])):
+            labels = '{label}="{value}"'.format(label=self.label, value=value) if self.label else ""
+            lines.extend(child.samples(self.name, labels))
+        return lines
+
+
+STAGE_SECONDS = Family("logic_stage_seconds", "Time spent in each stage of /api/devops requests",
+                       "histogram", lambda: Histogram(SECONDS_BUCKETS), "stage", STAGES)
+REQUEST_SECONDS = Family("logic_request_seconds", "Time spent handling /api/devops requests",
+                         "histogram", lambda: Histogram(SECONDS_BUCKETS))
+REQUEST_BYTES = Family("logic_request_bytes", "Size of /api/devops request bodies",
+                       "histogram", lambda: Histogram(BYTES_BUCKETS))
+REQUEST_SITES = Family("logic_request_sites", "Number of data centers in /api/devops requests",
+                       "histogram", lambda: Histogram(SITES_BUCKETS))
+RESPONSES = Family("logic_responses_total", "Responses to /api/devops requests by status code",
+                   "counter", Counter, "status", (200, 400, 429, 503))
+ERRORS = Family("logic_errors_total", "/api/devops requests failed with an unhandled exception",
+                "counter", Counter)
+COALESCED = Family("logic_coalesced_total", "/api/devops requests answered by an identical request in flight",
+                   "counter", Counter)
+STORE_WRITTEN = Family("logic_store_written_total", "/api/devops requests written to the database",
+                       "counter", Counter)
+STORE_DROPPED = Family("logic_store_dropped_total", "/api/devops requests not written to the database",
+                       "counter", Counter)
+
+FAMILIES = (STAGE_SECONDS, REQUEST_SECONDS, REQUEST_BYTES, REQUEST_SITES, RESPONSES, ERRORS, COALESCED,
+            STORE_WRITTEN, STORE_DROPPED)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Records the time spent in the block as the given stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def reset():
+    """
+    Drops all observations, e.g. those of a warm-up request
+    """
+    for family in FAMILIES:
+        family.reset()
+
+
+def exposition(extra: list = ()):
+    """
+    :param extra: additional lines to append, e.g. from other components
+    :return: all metrics in the Prometheus text format
+    """
+    lines = []
+    for family in FAMILIES:
+        lines.extend(family.exposition())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
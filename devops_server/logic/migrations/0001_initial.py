@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmittedFleet',
+            fields=[
+                ('digest', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('content_type', models.CharField(max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('body', models.BinaryField(null=True)),
+                ('created', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Placement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=128, null=True)),
+                ('result', models.JSONField()),
+                ('created', models.DateTimeField(db_index=True)),
+                ('fleet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='placements', to='logic.submittedfleet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fleet', 'created'], name='placement_fleet_created'), models.Index(fields=['label', 'created'], name='placement_label_created')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('label__isnull', True)), fields=('fleet',), name='placement_unlabelled_fleet')],
+            },
+        ),
+    ]
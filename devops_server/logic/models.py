@@ -0,0 +1,42 @@
+"""
+Fleets submitted to /api/devops and their placements, kept in the configured
+database by logic.store.
+"""
+
+from django.db import models
+
+
+class SubmittedFleet(models.Model):
+    """
+    Request body, identified by its content hash, see cache.body_digest
+    """
+
+    digest = models.CharField(max_length=32, primary_key=True)
+    content_type = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    # None when larger than settings.LOGIC_STORE_MAX_BODY_BYTES
+    body = models.BinaryField(null=True)
+    created = models.DateTimeField(db_index=True)
+
+
+class Placement(models.Model):
+    """
+    Solution of a submitted fleet. A fleet has a single unlabelled placement, written
+    for any request, and a placement per request naming it with
+    settings.LOGIC_STORE_LABEL_HEADER, which gives the history of the named fleet
+    """
+
+    fleet = models.ForeignKey(SubmittedFleet, on_delete=models.CASCADE, related_name="placements")
+    label = models.CharField(max_length=128, null=True)
+    result = models.JSONField()
+    created = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["fleet", "created"], name="placement_fleet_created"),
+            models.Index(fields=["label", "created"], name="placement_label_created"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["fleet"], condition=models.Q(label__isnull=True),
+                                    name="placement_unlabelled_fleet"),
+        ]
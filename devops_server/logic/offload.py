@@ -0,0 +1,193 @@
+"""
+Offloading of oversized problems to a warm pool of worker processes.
+
+Problems with more data centers than settings.LOGIC_OFFLOAD_THRESHOLD are not
+solved on the request thread. Their servers array is copied into a shared
+memory block, and a worker process attaches to it by name and solves it in
+place, so the fleet is never pickled. Only the capacities and the block name
+go to the worker, and only the DE count and the DM index, or the DM indices
+of a DM_count problem, come back.
+
+At most settings.LOGIC_OFFLOAD_QUEUE problems are queued or being solved at a
+time, counting those whose request stopped waiting for them. When the pool is saturated, or a problem is not solved within
+settings.LOGIC_OFFLOAD_TIMEOUT seconds, Unavailable is raised so that the
+endpoint can answer 503 right away. Small requests keep being solved inline.
+
+The multiprocessing machinery is only imported once a pool is started, so that
+servers not offloading anything do not load it.
+"""
+
+from concurrent.futures import TimeoutError
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import admission, solver
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE = 8
+DEFAULT_TIMEOUT = 30
+RETRY_AFTER = 1
+
+
+class Unavailable(Exception):
+    """
+    Raised when an offloaded problem cannot be solved in time
+    """
+
+    def __init__(self, message: str, retry_after: int = RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def solve_shared(name: str, count: int, dm_capacity: int, de_capacity: int, dm_count: int = None):
+    """
+    Runs in a worker process: solves servers stored in a shared memory block
+
+    :param name: name of the shared memory block holding count int64 servers
+    :param dm_count: number of DM's to place, None for a single one
+    :return: tuple (number of DE's, index of the DM data center), or
+             (number of DE's, list of indices of the DM data centers) with dm_count
+    """
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        servers = np.ndarray((count,), dtype=np.int64, buffer=block.buf)
+        if dm_count is not None:
+            result = solver.solve_multi(servers, dm_capacity, de_capacity, dm_count)
+        else:
+            result = solver.solve_array(servers, dm_capacity, de_capacity)
+        del servers
+        return result
+    finally:
+        block.close()
+
+
+def warm_up():
+    """
+    Runs in a worker process: loads the solver so that the first problem is solved fast
+    """
+    solver.solve_array(np.ones(1, dtype=np.int64), 1, 1)
+
+
+class OffloadPool:
+    """
+    Process pool with bounded queueing
+    """
+
+    def __init__(self, workers: int, queue: int, timeout: float):
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(queue) if queue > 0 else None
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+
+    def warm(self):
+        """
+        Starts all worker processes and waits for them to be ready
+        """
+        for future in [self.executor.submit(warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def solve(self, fleet):
+        """
+        Solves a problem in a worker process
+
+        :param fleet: validation.CompactFleet with int64 servers
+        :return: tuple (number of DE's, index of the DM data center), or
+                 (number of DE's, list of indices of the DM data centers) when
+                 the fleet has DM_count, see solve_shared
+        """
+        if not len(fleet):
+            raise ValueError("Cannot place DM: no data centers given")
+        if self.slots is None or not self.slots.acquire(blocking=False):
+            raise Unavailable("Too many large problems are being solved, retry later")
+        from multiprocessing import shared_memory
+        block = None
+        try:
+            block = shared_memory.SharedMemory(create=True, size=fleet.servers.nbytes)
+            servers = np.ndarray(fleet.servers.shape, dtype=np.int64, buffer=block.buf)
+            servers[:] = fleet.servers
+            del servers
+            future = self.executor.submit(solve_shared, block.name, len(fleet),
+                                          fleet.dm_capacity, fleet.de_capacity, fleet.dm_count)
+        except BaseException:
+            self.release(block)
+            raise
+        # the slot and the block are held until the worker is done with them,
+        # also when the request stops waiting for it
+        future.add_done_callback(lambda _: self.release(block))
+        # no longer than the request's deadline
+        timeout = admission.remaining(self.timeout)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise Unavailable("Problem was not solved within {timeout:g} seconds".format(timeout=timeout))
+
+    def release(self, block):
+        """
+        Frees the slot of a problem and its shared memory block, if any
+        """
+        try:
+            if block is not None:
+                block.close()
+                block.unlink()
+        finally:
+            self.slots.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def is_offloaded(fleet):
+    """
+    :param fleet: validation.CompactFleet
+    :return: True when the problem is large enough to be solved in the pool
+    """
+    threshold = getattr(settings, "LOGIC_OFFLOAD_THRESHOLD", None)
+    return threshold is not None and len(fleet) > threshold and not fleet.exact
+
+
+def get_pool():
+    """
+    :return: OffloadPool configured from settings, started on first use
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = OffloadPool(getattr(settings, "LOGIC_OFFLOAD_WORKERS", DEFAULT_WORKERS),
+                                   getattr(settings, "LOGIC_OFFLOAD_QUEUE", DEFAULT_QUEUE),
+                                   getattr(settings, "LOGIC_OFFLOAD_TIMEOUT", DEFAULT_TIMEOUT))
+                pool.warm()
+                _pool = pool
+    return _pool
+
+
+def warm():
+    """
+    Starts the pool ahead of the first request when offloading is enabled
+    """
+    if getattr(settings, "LOGIC_OFFLOAD_THRESHOLD", None) is not None:
+        get_pool()
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    """
+    Drops the pool when offload settings change, e.g. in tests
+    """
+    global _pool
+    if setting.startswith("LOGIC_OFFLOAD") and _pool is not None:
+        _pool.executor.shutdown(wait=False)
+        _pool = None
@@ -0,0 +1,112 @@
+"""
+Partial aggregates of problems split into shards, e.g. by region.
+
+The number of DE's of a placement is the baseline, a sum over data centers,
+minus the saving at the DM site. A shard is therefore summarized by its baseline
+and its best saving along with the data center reaching it, and the summaries of
+all shards give the exact solution of the whole problem: the baselines add up,
+and the best saving is the largest of the shards' best savings. The runner-up
+saving is kept as well, to tell how far the second best placement is.
+
+Partials are merged in the order they are given, which stands for the order of
+the data centers in the whole problem: on ties, the DM goes to the first shard,
+as solve_problem would place it. A merged partial can be merged again.
+"""
+
+from . import solver
+from .validation import CAPACITY_FIELDS, validate_capacity
+
+PARTIAL_FIELDS = {"DM_capacity", "DE_capacity", "sites", "baseline", "best_saving",
+                  "runner_up_saving", "DM_data_center"}
+
+
+def make_partial(fleet):
+    """
+    :param fleet: validation.CompactFleet of a shard, which may have no data centers
+    :return: partial aggregate of the shard
+    """
+    baseline, best_saving, best_index, runner_up = solver.aggregate(fleet.servers, fleet.dm_capacity,
+                                                                    fleet.de_capacity)
+    return {
+        "DM_capacity": fleet.dm_capacity,
+        "DE_capacity": fleet.de_capacity,
+        "sites": len(fleet),
+        "baseline": baseline,
+        "best_saving": best_saving,
+        "runner_up_saving": runner_up,
+        "DM_data_center": None if best_index is None else fleet.names[best_index],
+    }
+
+
+def validate_partial(partial: dict):
+    """
+    Validates a partial aggregate produced by make_partial or merge
+
+    :param partial: partial aggregate to validate
+    :return: raises ValueError on failed validation
+    """
+    if type(partial) != dict:
+        raise ValueError("Expecting a partial object, instead got value {partial}".format(partial=partial))
+    if set(partial) != PARTIAL_FIELDS:
+        raise ValueError("Got unexpected set of partial fields {fields} "
+                         "instead of {expected}".format(fields=set(partial), expected=PARTIAL_FIELDS))
+    for key in CAPACITY_FIELDS:
+        validate_capacity(key, partial[key])
+    for key in ("sites", "baseline"):
+        if type(partial[key]) != int or partial[key] < 0:
+            raise ValueError("{key} must be a non-negative integer, got {value}".format(
+                key=key, value=partial[key]))
+    # savings are known for as many data centers as there are, up to two
+    for key, needed in (("best_saving", 1), ("runner_up_saving", 2)):
+        value = partial[key]
+        if partial["sites"] < needed:
+            if value is not None:
+                raise ValueError("{key} must be null for {sites} sites".format(key=key, sites=partial["sites"]))
+        elif type(value) != int or value < 0:
+            raise ValueError("{key} must be a non-negative integer, got {value}".format(key=key, value=value))
+    if partial["sites"] and type(partial["DM_data_center"]) != str:
+        raise ValueError("DM_data_center must be str, got {name}".format(name=partial["DM_data_center"]))
+    if not partial["sites"] and partial["DM_data_center"] is not None:
+        raise ValueError("DM_data_center must be null when there are no sites")
+    if partial["sites"] > 1 and partial["runner_up_saving"] > partial["best_saving"]:
+        raise ValueError("runner_up_saving {runner_up} exceeds best_saving {best}".format(
+            runner_up=partial["runner_up_saving"], best=partial["best_saving"]))
+
+
+def merge(partials: list):
+    """
+    Combines partials of shards into the partial of the whole problem in O(number of partials)
+
+    :param partials: validated partials in the order of the shards
+    :return: merged partial, raises ValueError when the capacities differ or nothing is given
+    """
+    if not partials:
+        raise ValueError("Expecting at least one partial")
+    first = partials[0]
+    merged = {"DM_capacity": first["DM_capacity"], "DE_capacity": first["DE_capacity"], "sites": 0,
+              "baseline": 0, "best_saving": None, "runner_up_saving": None, "DM_data_center": None}
+    for partial in partials:
+        if (partial["DM_capacity"], partial["DE_capacity"]) != (merged["DM_capacity"], merged["DE_capacity"]):
+            raise ValueError("Partials were computed with different capacities")
+        merged["sites"] += partial["sites"]
+        merged["baseline"] += partial["baseline"]
+        # the two largest savings among the kept ones and those of the partial
+        savings = [saving for saving in (merged["best_saving"], merged["runner_up_saving"],
+                                         partial["best_saving"], partial["runner_up_saving"]) if saving is not None]
+        savings.sort(reverse=True)
+        if partial["best_saving"] is not None and (merged["best_saving"] is None
+                                                   or partial["best_saving"] > merged["best_saving"]):
+            merged["DM_data_center"] = partial["DM_data_center"]
+        merged["best_saving"] = savings[0] if savings else None
+        merged["runner_up_saving"] = savings[1] if len(savings) > 1 else None
+    return merged
+
+
+def solution(partial: dict):
+    """
+    :param partial: partial of the whole problem
+    :return: optimal solution in the format returned by solve_problem
+    """
+    if not partial["sites"]:
+        raise ValueError("Cannot place DM: no data centers given")
+    return {"DE": partial["baseline"] - partial["best_saving"], "DM_data_center": partial["DM_data_center"]}
@@ -0,0 +1,152 @@
+"""
+Opt-in profiling of single /api/devops requests.
+
+With settings.LOGIC_PROFILE_ENABLED, a request is profiled when it carries the
+settings.LOGIC_PROFILE_HEADER header set to 1, or when it is drawn with the
+probability settings.LOGIC_PROFILE_SAMPLE_RATE. Such a request runs under
+cProfile, while a sampler thread records the stack of the request thread every
+settings.LOGIC_PROFILE_INTERVAL seconds. Both are written to
+settings.LOGIC_PROFILE_DIR, named after the request id:
+    <id>.pstats     cProfile statistics, to be loaded with pstats.Stats
+    <id>.collapsed  sampled stacks in the collapsed format of flamegraph.pl
+The id is taken from the X-Request-ID header, or generated, and returned in the
+X-Profile-Id response header. The oldest profiles are removed once the directory
+exceeds settings.LOGIC_PROFILE_MAX_BYTES.
+
+When profiling is disabled, a request costs a single settings lookup.
+"""
+
+from collections import Counter
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+
+from django.conf import settings
+
+DEFAULT_HEADER = "X-Profile"
+DEFAULT_INTERVAL = 0.001
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+REQUEST_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the stacks a thread is seen in at a fixed interval
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append("{name} ({file}:{line})".format(
+                    name=code.co_name, file=code.co_filename, line=code.co_firstlineno))
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        """
+        :return: stacks in the collapsed format, one "frame;frame;... count" line per stack
+        """
+        return "".join("{stack} {count}\n".format(stack=stack, count=count)
+                       for stack, count in sorted(self.stacks.items()))
+
+
+def is_profiled(request):
+    """
+    :param request: incoming request
+    :return: True when the request is to be profiled
+    """
+    if not getattr(settings, "LOGIC_PROFILE_ENABLED", False):
+        return False
+    header = getattr(settings, "LOGIC_PROFILE_HEADER", DEFAULT_HEADER)
+    if header and request.headers.get(header) == "1":
+        return True
+    rate = getattr(settings, "LOGIC_PROFILE_SAMPLE_RATE", 0)
+    return rate > 0 and random.random() < rate
+
+
+def request_id(request):
+    """
+    :return: id from the X-Request-ID header when it is safe to use in a file name, a new one otherwise
+    """
+    given = request.headers.get("X-Request-ID", "")
+    return given if REQUEST_ID.fullmatch(given) else uuid.uuid4().hex
+
+
+def profile(request, handle):
+    """
+    Runs handle(request) under the profilers and writes the profiles
+
+    :param request: incoming request
+    :param handle: function returning the response to the request
+    :return: response, with the X-Profile-Id header
+    """
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), getattr(settings, "LOGIC_PROFILE_INTERVAL", DEFAULT_INTERVAL))
+    sampler.start()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is active in this thread
+        sampler.stop()
+        return handle(request)
+    try:
+        response = handle(request)
+    finally:
+        profiler.disable()
+        sampler.stop()
+    profile_id = request_id(request)
+    save(profile_id, profiler, sampler)
+    response["X-Profile-Id"] = profile_id
+    return response
+
+
+def save(profile_id: str, profiler: cProfile.Profile, sampler: StackSampler):
+    """
+    Writes the profiles of a request and removes the oldest ones beyond the size limit
+    """
+    directory = settings.LOGIC_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, profile_id)
+    profiler.dump_stats(path + ".pstats")
+    with open(path + ".collapsed", "w") as collapsed:
+        collapsed.write(sampler.collapsed())
+    prune(directory, getattr(settings, "LOGIC_PROFILE_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+def prune(directory: str, max_bytes: int):
+    """
+    Removes the oldest files of the directory until it holds at most max_bytes
+    """
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            stat = entry.stat()
+            files.append((stat.st_mtime_ns, entry.path, stat.st_size))
+    total = sum(size for _, _, size in files)
+    for _, path, size in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,107 @@
+"""
+Replay of a fleet over time: the same data centers with a number of servers per
+time step, e.g. hourly counts over a quarter, solved for every step in one
+vectorized pass, see solver.solve_series.
+
+A series is given once with the names of its data centers and a matrix of
+servers with a row per time step, either as JSON:
+    {"DM_capacity": 4, "DE_capacity": 1, "sites": ["City1", "City2"], "servers": [[1, 4], [5, 2], ...]}
+or in the columnar format, see columnar, whose header gives the number of steps.
+settings.LOGIC_REPLAY_CHUNK_SIZE bounds the number of values computed at a time.
+"""
+
+import numpy as np
+from django.conf import settings
+
+from . import columnar, solver
+from .validation import CAPACITY_FIELDS, INT64_SAFE_LIMIT, validate_capacity
+
+DEFAULT_CHUNK_SIZE = 1 << 22
+SERIES_FIELDS = {"DM_capacity", "DE_capacity", "sites", "servers"}
+
+
+def compile_series(body: dict):
+    """
+    Validates a JSON series body
+
+    :param body: series request body
+    :return: tuple (DM capacity, DE capacity, names, servers matrix), raises ValueError on failed validation
+    """
+    if type(body) != dict:
+        raise ValueError("Expecting an object, instead got value {body}".format(body=body))
+    if set(body) != SERIES_FIELDS:
+        raise ValueError("Got unexpected set of fields {fields} "
+                         "instead of {expected}".format(fields=set(body), expected=SERIES_FIELDS))
+    for key in CAPACITY_FIELDS:
+        validate_capacity(key, body[key])
+    names = body["sites"]
+    if type(names) != list or set(map(type, names)) - {str}:
+        raise ValueError("Expecting a list of data center names, instead got value {names}".format(names=names))
+    rows = body["servers"]
+    if type(rows) != list or not rows:
+        raise ValueError("Expecting a non-empty list of servers per time step, "
+                         "instead got value {rows}".format(rows=rows))
+    for step, row in enumerate(rows):
+        # bool is a subclass of int, that numpy would take for 0 and 1
+        if type(row) != list or len(row) != len(names) or set(map(type, row)) - {int}:
+            raise ValueError("Expecting a list of {sites} integer numbers of servers for step {step}, "
+                             "instead got value {row}".format(sites=len(names), step=step, row=row))
+    try:
+        servers = np.array(rows, dtype=np.int64)
+    except OverflowError:
+        servers = np.empty((len(rows), len(names)), dtype=object)
+        servers[:] = rows
+    if servers.size and servers.min() < 1:
+        step, index = np.unravel_index(np.argmin(servers), servers.shape)
+        raise ValueError("Numeric value for servers {value} is smaller than 1 for data center {name} "
+                         "at step {step}".format(value=servers[step, index], name=names[index], step=step))
+    return body["DM_capacity"], body["DE_capacity"], names, servers
+
+
+def loads_series(raw: bytes):
+    """
+    Loads and validates a series request body in the columnar format
+
+    :param raw: raw request body
+    :return: tuple (DM capacity, DE capacity, names, servers matrix), raises ValueError on failed validation
+    """
+    header, servers, names = columnar.read_columns(raw)
+    expected = set(CAPACITY_FIELDS) | {"sites", "steps"}
+    if set(header) != expected:
+        raise ValueError("Got unexpected set of header fields {fields} instead of "
+                         "{expected}".format(fields=set(header), expected=expected))
+    for key in CAPACITY_FIELDS:
+        validate_capacity(key, header[key])
+    return header["DM_capacity"], header["DE_capacity"], names, servers
+
+
+def solve_series(dm_capacity: int, de_capacity: int, names, servers: np.ndarray):
+    """
+    Solves every time step of a validated series
+
+    :param dm_capacity: number of servers the DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :param names: names of the data centers
+    :param servers: int64 or object matrix with number of servers per time step and data center
+    :return: solution of every step, with the steps where the DM data center changes
+    """
+    if (dm_capacity >= INT64_SAFE_LIMIT or de_capacity >= INT64_SAFE_LIMIT
+            or servers.size and int(servers.max()) * servers.shape[1] >= INT64_SAFE_LIMIT):
+        servers = servers.astype(object)
+    DE_counts, DM_indices = solver.solve_series(servers, dm_capacity, de_capacity,
+                                                getattr(settings, "LOGIC_REPLAY_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+
+    changes = np.flatnonzero(DM_indices[1:] != DM_indices[:-1]) + 1
+    # DM sites are returned as positions in a table of the distinct sites used
+    used, positions = np.unique(DM_indices, return_inverse=True)
+    return {
+        "DM_capacity": dm_capacity,
+        "DE_capacity": de_capacity,
+        "steps": len(DE_counts),
+        "DE": DE_counts.tolist(),
+        "DM_site": positions.tolist(),
+        "sites": [names[index] for index in used.tolist()],
+        "changes": [{"step": step, "from": names[previous], "to": names[current]}
+                    for step, previous, current in zip(changes.tolist(), DM_indices[changes - 1].tolist(),
+                                                       DM_indices[changes].tolist())],
+    }
@@ -0,0 +1,126 @@
+"""
+Streamed JSON responses for large results.
+
+A result holding a list longer than settings.LOGIC_RESPONSE_CHUNK_ITEMS items,
+e.g. a sweep, a replay or a batch, is encoded while it is sent rather than into
+one string: lists are encoded settings.LOGIC_RESPONSE_CHUNK_ITEMS items at a
+time, so that only one chunk of JSON text is held in memory besides the result.
+The text is the one JsonResponse would send, byte for byte.
+"""
+
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+DEFAULT_CHUNK_ITEMS = 8192
+
+# Separators of json.dumps, as used by JsonResponse
+ITEM_SEPARATOR = ", "
+KEY_SEPARATOR = ": "
+# Yielded by encode after each chunk of a list, where the text is sent
+FLUSH = None
+
+
+def get_chunk_items():
+    """
+    :return: number of list items encoded at a time, None when responses are never streamed
+    """
+    return getattr(settings, "LOGIC_RESPONSE_CHUNK_ITEMS", DEFAULT_CHUNK_ITEMS)
+
+
+def is_large(result, chunk_items: int):
+    """
+    :return: True when a list of the result spans several chunks
+    """
+    if type(result) == dict:
+        return any(is_large(value, chunk_items) for value in result.values())
+    if type(result) == list:
+        return len(result) > chunk_items or any(is_large(item, chunk_items) for item in result
+                                                if type(item) in (dict, list))
+    return isinstance(result, np.ndarray) and len(result) > chunk_items
+
+
+def encode(value, chunk_items: int):
+    """
+    Encodes a value into JSON text piece by piece
+
+    :param value: JSON serializable value; lists may be numpy arrays
+    :param chunk_items: number of list items encoded at a time
+    :return: generator of str, with FLUSH after each chunk of a long list
+    """
+    if type(value) == dict:
+        yield "{"
+        for position, (key, item) in enumerate(value.items()):
+            yield (ITEM_SEPARATOR if position else "") + json.dumps(key) + KEY_SEPARATOR
+            yield from encode(item, chunk_items)
+        yield "}"
+    elif is_large(value, chunk_items):
+        yield "["
+        for start in range(0, len(value), chunk_items):
+            chunk = value[start:start + chunk_items]
+            if isinstance(chunk, np.ndarray):
+                chunk = chunk.tolist()
+            separator = ITEM_SEPARATOR if start else ""
+            if any(is_large(item, chunk_items) for item in chunk if type(item) in (dict, list)):
+                # e.g. a few large results of a batch, encoded one by one
+                for position, item in enumerate(chunk):
+                    yield separator if not position else ITEM_SEPARATOR
+                    yield from encode(item, chunk_items)
+            else:
+                # the items of the chunk, without its brackets
+                yield separator + json.dumps(chunk, cls=DjangoJSONEncoder)[1:-1]
+            yield FLUSH
+        yield "]"
+    else:
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        yield json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def chunks(result, chunk_items: int):
+    """
+    :return: generator of the JSON text of the result as UTF-8 chunks, one per chunk
+             of chunk_items list items, along with the small pieces before it, e.g.
+             keys and short lists
+    """
+    pending = []
+    for piece in encode(result, chunk_items):
+        if piece is not FLUSH:
+            pending.append(piece)
+        elif pending:
+            yield "".join(pending).encode("utf-8")
+            pending.clear()
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+def json_response(result: dict):
+    """
+    :return: JsonResponse with the result, or a StreamingHttpResponse encoding it
+             chunk by chunk when it is large
+    """
+    chunk_items = get_chunk_items()
+    if chunk_items is None or not is_large(result, chunk_items):
+        return JsonResponse(result)
+    return StreamingHttpResponse(chunks(result, chunk_items), content_type="application/json")
+
+
+def asynchronous(response):
+    """
+    Makes a streamed response iterate asynchronously, so that the ASGI handler
+    sends it chunk by chunk instead of collecting it in a thread first
+
+    :return: the response
+    """
+    if response.streaming and not response.is_async:
+        iterator = response.streaming_content
+
+        async def iterate():
+            for chunk in iterator:
+                yield chunk
+
+        response.streaming_content = iterate()
+    return response
@@ -19,6 +19,26 @@ setup(name='logic',
       py_modules=[
           "tests",
           "views",
+          "admission",
+          "cache",
+          "coalesce",
+          "columnar",
+          "compression",
+          "fleets",
+          "metrics",
+          "models",
+          "offload",
+          "partials",
+          "profiling",
+          "replay",
+          "responses",
+          "snapshots",
+          "solver",
+          "store",
+          "streaming",
+          "sweep",
+          "synthetic",
+          "validation",
           "urls",
           "__init__"
       ],
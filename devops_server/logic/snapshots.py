@@ -0,0 +1,190 @@
+"""
+Fleet snapshots: large fleets stored on disk once and solved by id many times,
+with only the capacities sent along with every request.
+
+A snapshot is a file in the columnar format, see columnar, whose header holds
+only the number of sites. It is mapped read-only with np.memmap, so the servers
+column is solved straight from the page cache, which all worker processes
+share, and it is validated once per process and version.
+
+A snapshot is uploaded into a temporary file and validated, then moved over
+the previous version with os.replace. Readers that mapped the previous version
+keep using it until they finish, and the next lookup maps the new one. An
+upload larger than settings.LOGIC_SNAPSHOT_MAX_BYTES is rejected as soon as it
+goes over, and its temporary file deleted.
+Snapshots are kept in settings.LOGIC_SNAPSHOT_DIR.
+"""
+
+import os
+import re
+import threading
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import columnar, compression
+from .validation import CAPACITY_FIELDS, OPTIONAL_BODY_FIELDS, validate_capacity
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+SNAPSHOT_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class Snapshot:
+    """
+    Mapped and validated version of a snapshot
+    """
+
+    __slots__ = ("snapshot_id", "version", "servers", "names")
+
+    def __init__(self, snapshot_id: str, version: tuple, servers: np.ndarray, names: columnar.NameTable):
+        self.snapshot_id = snapshot_id
+        self.version = version
+        self.servers = servers
+        self.names = names
+
+    def __len__(self):
+        return len(self.servers)
+
+    def fleet(self, body: dict):
+        """
+        :param body: capacities to solve the snapshot with, see validate_capacities
+        :return: validation.CompactFleet sharing the mapped columns
+        """
+        validate_capacities(body)
+        return columnar.compact_fleet(body["DM_capacity"], body["DE_capacity"], self.names, self.servers,
+                                      body.get("DM_count"))
+
+
+def validate_capacities(body: dict):
+    """
+    Validates the body of a snapshot solve request:
+    {"DM_capacity": 4, "DE_capacity": 1} with an optional DM_count,
+    the values being within allowed range [1,+Inf)
+
+    :param body: request body to validate
+    :return: raises ValueError on failed validation
+    """
+    if type(body) != dict:
+        raise ValueError("Expecting an object, instead got value {body}".format(body=body))
+    if not set(CAPACITY_FIELDS) <= set(body) <= set(CAPACITY_FIELDS) | OPTIONAL_BODY_FIELDS:
+        raise ValueError("Got unexpected set of fields {body} "
+                         "instead of {expected}".format(body=set(body), expected=set(CAPACITY_FIELDS)))
+    for key, value in body.items():
+        validate_capacity(key, value)
+
+
+def snapshot_path(snapshot_id: str):
+    """
+    :return: path of the snapshot file, raises ValueError on a malformed id
+    """
+    if not SNAPSHOT_ID.fullmatch(snapshot_id):
+        raise ValueError("Snapshot id must be 1 to 64 letters, digits, _ or -, "
+                         "got {snapshot_id}".format(snapshot_id=snapshot_id))
+    return os.path.join(settings.LOGIC_SNAPSHOT_DIR, snapshot_id + ".fleet")
+
+
+def map_snapshot(snapshot_id: str, path: str):
+    """
+    Maps a snapshot file and validates its layout
+
+    :return: Snapshot, raises ValueError on a malformed file
+    """
+    with open(path, "rb") as stored:
+        stat = os.fstat(stored.fileno())
+        if not stat.st_size:
+            raise ValueError("Snapshot is empty")
+        buffer = np.memmap(stored, dtype=np.uint8, mode="r")
+    header, servers, names = columnar.read_columns(buffer)
+    if set(header) != {"sites"}:
+        raise ValueError("Snapshot header must only hold the number of sites, got {header}".format(header=header))
+    return Snapshot(snapshot_id, (stat.st_ino, stat.st_mtime_ns), servers, names)
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get(snapshot_id: str):
+    """
+    :return: current version of the snapshot, mapped on first use, or None when it does not exist
+    """
+    path = snapshot_path(snapshot_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    snapshot = _snapshots.get(snapshot_id)
+    if snapshot is None or snapshot.version != (stat.st_ino, stat.st_mtime_ns):
+        try:
+            snapshot = map_snapshot(snapshot_id, path)
+        except FileNotFoundError:
+            # deleted in the meantime
+            return None
+        with _snapshots_lock:
+            _snapshots[snapshot_id] = snapshot
+    return snapshot
+
+
+def store(snapshot_id: str, stream, chunk_size: int = CHUNK_SIZE):
+    """
+    Writes a new version of the snapshot from a stream of columnar data,
+    replacing the previous version atomically once it is validated
+
+    :param stream: binary file-like object, e.g. HttpRequest
+    :return: the new version of the snapshot, raises compression.TooLarge when the
+             data is larger than settings.LOGIC_SNAPSHOT_MAX_BYTES
+    """
+    path = snapshot_path(snapshot_id)
+    limit = getattr(settings, "LOGIC_SNAPSHOT_MAX_BYTES", DEFAULT_MAX_BYTES)
+    size = 0
+    os.makedirs(settings.LOGIC_SNAPSHOT_DIR, exist_ok=True)
+    temporary = "{path}.{suffix}.tmp".format(path=path, suffix=uuid.uuid4().hex)
+    try:
+        with open(temporary, "wb") as stored:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    raise compression.TooLarge("Snapshot is larger than {limit} bytes".format(limit=limit))
+                stored.write(chunk)
+            stored.flush()
+            os.fsync(stored.fileno())
+        snapshot = map_snapshot(snapshot_id, temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    with _snapshots_lock:
+        _snapshots[snapshot_id] = snapshot
+    return snapshot
+
+
+def delete(snapshot_id: str):
+    """
+    :return: True when the snapshot existed
+    """
+    path = snapshot_path(snapshot_id)
+    with _snapshots_lock:
+        _snapshots.pop(snapshot_id, None)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+@receiver(setting_changed)
+def reset_snapshots(setting, **kwargs):
+    """
+    Forgets mapped snapshots when the snapshot directory changes, e.g. in tests
+    """
+    if setting == "LOGIC_SNAPSHOT_DIR":
+        with _snapshots_lock:
+            _snapshots.clear()
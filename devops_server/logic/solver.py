@@ -0,0 +1,340 @@
+"""
+Solver engine for the DM/DE distribution problem.
+
+Placing the DM at a data center only changes the number of DE's required
+at that data center, so the total for any placement is the baseline
+(DE's needed to cover every data center on its own) minus the saving
+obtained at the DM site. The optimal placement is therefore the data center
+with the largest saving, which is found in a single pass over the sites.
+Savings of different sites are independent, so the best placement of k DM's,
+at most one per data center, is the k data centers with the largest savings.
+
+All arithmetic is done on integers, so arbitrarily large server counts
+are handled exactly.
+"""
+
+import heapq
+
+import numpy as np
+
+
+def de_count(servers: int, capacity: int):
+    """
+    Number of DE's of the given capacity required to cover the servers,
+    i.e. ceil(servers / capacity) computed with exact integer division.
+
+    :param servers: number of servers to cover
+    :param capacity: number of servers a single DE can handle
+    :return: number of DE's
+    """
+    return -(-servers // capacity)
+
+
+def site_saving(servers: int, dm_capacity: int, de_capacity: int):
+    """
+    Number of DE's saved at a data center when the DM is placed there.
+
+    :param servers: number of servers at the data center
+    :param dm_capacity: number of servers the DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :return: number of DE's saved
+    """
+    full = -(-servers // de_capacity)
+    if servers > dm_capacity:
+        return full + ((servers - dm_capacity) // -de_capacity)
+    return full
+
+
+def solve(servers, dm_capacity: int, de_capacity: int):
+    """
+    Finds the optimal DM placement in O(n).
+
+    Ties are resolved in favour of the first data center, which matches the
+    order produced by a stable sort of all candidate placements.
+
+    :param servers: iterable with number of servers per data center
+    :param dm_capacity: number of servers the DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :return: tuple (number of DE's, index of the DM data center)
+    """
+    baseline = 0
+    best_saving = -1
+    best_index = -1
+    for index, s in enumerate(servers):
+        full = -(-s // de_capacity)
+        baseline += full
+        if s > dm_capacity:
+            saving = full + ((s - dm_capacity) // -de_capacity)
+        else:
+            saving = full
+        if saving > best_saving:
+            best_saving = saving
+            best_index = index
+    if best_index < 0:
+        raise ValueError("Cannot place DM: no data centers given")
+    return baseline - best_saving, best_index
+
+
+def solve_array(servers: np.ndarray, dm_capacity: int, de_capacity: int):
+    """
+    Vectorized solve() for servers packed into an array, see validation.CompactFleet.
+    The array must be int64 with no risk of overflow, or hold Python ints.
+
+    :param servers: 1-d array with number of servers per data center
+    :param dm_capacity: number of servers the DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :return: tuple (number of DE's, index of the DM data center)
+    """
+    if not len(servers):
+        raise ValueError("Cannot place DM: no data centers given")
+    full = -(-servers // de_capacity)
+    saving = full + (np.maximum(servers - dm_capacity, 0) // -de_capacity)
+    # argmax returns the first data center on ties
+    best_index = int(np.argmax(saving))
+    return int(full.sum()) - int(saving[best_index]), best_index
+
+
+def solve_multi(servers: np.ndarray, dm_capacity: int, de_capacity: int, count: int):
+    """
+    Finds the optimal placement of count DM's, at most one per data center.
+
+    Picks the count data centers with the largest savings: np.partition finds
+    the smallest saving that is still picked in O(n), so only the picked ones
+    are sorted. Ties are resolved in favour of the first data centers, so the
+    best of them is the placement returned by solve(). When there are fewer
+    data centers than DM's, every data center gets one.
+
+    :param servers: 1-d array with number of servers per data center, see solve_array
+    :param dm_capacity: number of servers a DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :param count: number of DM's to place
+    :return: tuple (number of DE's, list of indices of the DM data centers, best first)
+    """
+    if not len(servers):
+        raise ValueError("Cannot place DM: no data centers given")
+    full = -(-servers // de_capacity)
+    saving = full + (np.maximum(servers - dm_capacity, 0) // -de_capacity)
+    size = len(servers)
+    if count < size:
+        threshold = np.partition(saving, size - count)[size - count]
+        above = np.flatnonzero(saving > threshold)
+        ties = np.flatnonzero(saving == threshold)[:count - len(above)]
+        chosen = np.concatenate((above, ties))
+    else:
+        chosen = np.arange(size)
+    # larger savings first, then earlier data centers
+    chosen = chosen[np.lexsort((chosen, -saving[chosen]))]
+    return int(full.sum()) - int(saving[chosen].sum()), chosen.tolist()
+
+
+def aggregate(servers: np.ndarray, dm_capacity: int, de_capacity: int):
+    """
+    Summarizes a part of a problem: the baseline of its data centers along with
+    the two largest savings. The summaries of all parts are enough to solve
+    the whole problem, see partials.merge.
+
+    :param servers: 1-d array with number of servers per data center, see solve_array
+    :param dm_capacity: number of servers the DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :return: tuple (baseline, best saving, index of its data center, runner-up saving);
+             savings and the index are None when there are not enough data centers
+    """
+    if not len(servers):
+        return 0, None, None, None
+    full = -(-servers // de_capacity)
+    saving = full + (np.maximum(servers - dm_capacity, 0) // -de_capacity)
+    best_index = int(np.argmax(saving))
+    runner_up = None
+    if len(servers) > 1:
+        runner_up = int(max(saving[:best_index].max(initial=0), saving[best_index + 1:].max(initial=0)))
+    return int(full.sum()), int(saving[best_index]), best_index, runner_up
+
+
+def solve_grid(servers: np.ndarray, dm_capacities: np.ndarray, de_capacities: np.ndarray,
+               chunk_size: int = 1 << 22):
+    """
+    Solves the problem for every combination of a DM capacity and a DE capacity.
+
+    The grid cells are laid out as rows of a (cells x data centers) array, so every
+    cell is solved at once by broadcasting. Cells are processed a chunk of rows at
+    a time, so that at most about chunk_size values are held at once.
+
+    :param servers: 1-d array with number of servers per data center, see solve_array
+    :param dm_capacities: 1-d array of DM capacities
+    :param de_capacities: 1-d array of DE capacities
+    :param chunk_size: number of (cell, data center) values computed at a time
+    :return: tuple of arrays of shape (DM capacities, DE capacities): number of DE's
+             and index of the DM data center
+    """
+    if not len(servers):
+        raise ValueError("Cannot place DM: no data centers given")
+    dm_cells = np.repeat(dm_capacities, len(de_capacities))[:, None]
+    de_cells = np.tile(de_capacities, len(dm_capacities))[:, None]
+    DE_counts = np.empty(len(dm_cells), dtype=servers.dtype)
+    DM_indices = np.empty(len(dm_cells), dtype=np.int64)
+    rows = max(1, chunk_size // len(servers))
+    for start in range(0, len(dm_cells), rows):
+        dm, de = dm_cells[start:start + rows], de_cells[start:start + rows]
+        full = -(-servers // de)
+        saving = full + (np.maximum(servers - dm, 0) // -de)
+        # argmax returns the first data center on ties
+        best = np.argmax(saving, axis=1)
+        DE_counts[start:start + rows] = full.sum(axis=1) - saving[np.arange(len(best)), best]
+        DM_indices[start:start + rows] = best
+    shape = (len(dm_capacities), len(de_capacities))
+    return DE_counts.reshape(shape), DM_indices.reshape(shape)
+
+
+def solve_series(servers: np.ndarray, dm_capacity: int, de_capacity: int, chunk_size: int = 1 << 22):
+    """
+    Solves the problem for every row of a (time steps x data centers) matrix,
+    the same data centers having different numbers of servers at every step.
+
+    Every row is solved at once by broadcasting, as solve_array does for one
+    row, a chunk of rows at a time, so that at most about chunk_size values
+    are held at once besides the matrix.
+
+    :param servers: 2-d array with number of servers per time step and data center, see solve_array
+    :param dm_capacity: number of servers the DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :param chunk_size: number of (time step, data center) values computed at a time
+    :return: tuple of 1-d arrays with a value per time step: number of DE's and
+             index of the DM data center
+    """
+    steps, sites = servers.shape
+    if not sites:
+        raise ValueError("Cannot place DM: no data centers given")
+    DE_counts = np.empty(steps, dtype=servers.dtype)
+    DM_indices = np.empty(steps, dtype=np.int64)
+    rows = max(1, chunk_size // sites)
+    for start in range(0, steps, rows):
+        chunk = servers[start:start + rows]
+        full = -(-chunk // de_capacity)
+        saving = full + (np.maximum(chunk - dm_capacity, 0) // -de_capacity)
+        # argmax returns the first data center on ties
+        best = np.argmax(saving, axis=1)
+        DE_counts[start:start + rows] = full.sum(axis=1) - saving[np.arange(len(best)), best]
+        DM_indices[start:start + rows] = best
+    return DE_counts, DM_indices
+
+
+def top_k(servers, dm_capacity: int, de_capacity: int, k: int, after: int = None):
+    """
+    Finds the k best DM placements in O(n log k) without sorting all of them.
+
+    Placements are ranked by number of DE's and then by position of the data
+    center, so the first one is the placement returned by solve(). The ranking
+    can be resumed after a given data center, which allows paginating it.
+
+    :param servers: sequence with number of servers per data center
+    :param dm_capacity: number of servers the DM can handle
+    :param de_capacity: number of servers a DE can handle
+    :param k: number of placements to return
+    :param after: index of a data center; only placements ranked after it are returned
+    :return: list of tuples (number of DE's, index of the DM data center), best first
+    """
+    baseline = 0
+    for s in servers:
+        baseline += -(-s // de_capacity)
+
+    savings = (site_saving(s, dm_capacity, de_capacity) for s in servers)
+    # a larger saving is better, and so is a smaller index on equal savings
+    candidates = ((saving, -index) for index, saving in enumerate(savings))
+    if after is not None:
+        bound = (site_saving(servers[after], dm_capacity, de_capacity), -after)
+        candidates = (key for key in candidates if key < bound)
+    return [(baseline - saving, -index) for saving, index in heapq.nlargest(k, candidates)]
+
+
+class Accumulator:
+    """
+    Running state of solve(): data centers are folded in one at a time,
+    so a problem can be solved without keeping its data centers around.
+    Only the baseline and the count best savings seen so far are stored,
+    the latter in a min-heap of size count, see solve_multi.
+    """
+
+    def __init__(self, dm_capacity: int, de_capacity: int, count: int = 1):
+        self.dm_capacity = dm_capacity
+        self.de_capacity = de_capacity
+        self.dm_count = count
+        self.count = 0
+        self.baseline = 0
+        # entries (saving, -index, name), the worst kept placement on top
+        self.heap = []
+
+    def add(self, servers: int, name: str = None):
+        """
+        Folds the next data center into the state in O(log count).
+
+        :param servers: number of servers at the data center
+        :param name: name of the data center, returned by selection()
+        :return: True when the data center is among the best DM positions so far
+        """
+        index = self.count
+        self.count += 1
+        self.baseline += de_count(servers, self.de_capacity)
+        entry = (site_saving(servers, self.dm_capacity, self.de_capacity), -index, name)
+        if len(self.heap) < self.dm_count:
+            heapq.heappush(self.heap, entry)
+            return True
+        if entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+            return True
+        return False
+
+    def keep(self, count: int):
+        """
+        Keeps only the count best data centers, e.g. once DM_count is known;
+        count must not exceed the number of data centers kept so far
+        """
+        if count < self.dm_count:
+            self.heap = heapq.nlargest(count, self.heap)
+            heapq.heapify(self.heap)
+        self.dm_count = count
+
+    def selection(self):
+        """
+        :return: list of tuples (index, name) of the DM data centers, best first
+        """
+        if not self.heap:
+            raise ValueError("Cannot place DM: no data centers given")
+        return [(-index, name) for saving, index, name in sorted(self.heap, reverse=True)]
+
+    def result(self):
+        """
+        :return: tuple (number of DE's, index of the best DM data center), as solve() does
+        """
+        if not self.heap:
+            raise ValueError("Cannot place DM: no data centers given")
+        return self.baseline - sum(entry[0] for entry in self.heap), -max(self.heap)[1]
+
+
+def solve_segments(servers, offsets, dm_capacities, de_capacities):
+    """
+    Solves many problems at once. The data centers of all problems are packed
+    into a single flat array, problem i owning servers[offsets[i]:offsets[i + 1]].
+    Every problem must have at least one data center and all values together
+    with per-problem sums must fit into int64.
+
+    :param servers: int64 array with number of servers per data center
+    :param offsets: int64 array of length (number of problems + 1) with segment bounds
+    :param dm_capacities: int64 array with DM capacity per problem
+    :param de_capacities: int64 array with DE capacity per problem
+    :return: tuple of int64 arrays (number of DE's, index of the DM data center
+             within the problem)
+    """
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    dm = np.repeat(dm_capacities, lengths)
+    de = np.repeat(de_capacities, lengths)
+
+    full = -(-servers // de)
+    saving = full + (np.maximum(servers - dm, 0) // -de)
+
+    baseline = np.add.reduceat(full, starts)
+    best_saving = np.maximum.reduceat(saving, starts)
+    # first data center reaching the best saving within each problem
+    candidates = np.flatnonzero(saving == np.repeat(best_saving, lengths))
+    best_index = candidates[np.searchsorted(candidates, starts)] - starts
+    return baseline - best_saving, best_index
@@ -0,0 +1,327 @@
+"""
+Persistent store of submitted fleets and their placements, see models.
+
+Buffered /api/devops requests are recorded once answered: the body, keyed by its
+content hash, see cache.body_digest, and the solution. Recording only queues the
+request, and a writer thread inserts the queue in batches of up to
+settings.LOGIC_STORE_BATCH_SIZE records, one transaction each, at least every
+settings.LOGIC_STORE_FLUSH_INTERVAL seconds. The queue holds at most
+settings.LOGIC_STORE_QUEUE_BYTES bytes of bodies; when the database falls behind,
+further records are dropped and counted, so that requests never wait for it.
+Bodies larger than settings.LOGIC_STORE_MAX_BODY_BYTES are not kept, only their
+placements, and streamed bodies are not recorded.
+
+A fleet has a single unlabelled placement, which gives the result of an earlier
+identical request by content hash with one index lookup, see lookup. Bodies
+larger than settings.LOGIC_STORE_LOOKUP_BYTES bytes missing from the result cache
+are looked up before being parsed, smaller ones are faster to solve again.
+
+A request may name its fleet in the settings.LOGIC_STORE_LABEL_HEADER header,
+e.g. X-Fleet: eu-production. Every such request is recorded, and the placements
+of a name over time are returned by history.
+"""
+
+from collections import OrderedDict, deque
+import atexit
+import logging
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_QUEUE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+DEFAULT_LOOKUP_BYTES = 64 * 1024
+DEFAULT_LABEL_HEADER = "X-Fleet"
+DEFAULT_HISTORY_LIMIT = 1000
+# Number of digests of unlabelled records remembered, so that repeated bodies are queued once
+RECENT_SIZE = 4096
+LABEL = re.compile(r"[A-Za-z0-9_.:-]{1,128}")
+
+logger = logging.getLogger(__name__)
+
+
+class Record:
+    """
+    Answered request waiting to be written
+    """
+
+    __slots__ = ("digest", "content_type", "size", "body", "label", "result", "created")
+
+    def __init__(self, digest: str, content_type: str, body: bytes, label: str, result: dict):
+        self.digest = digest
+        self.content_type = content_type
+        self.size = len(body)
+        self.body = body if self.size <= getattr(settings, "LOGIC_STORE_MAX_BODY_BYTES",
+                                                  DEFAULT_MAX_BODY_BYTES) else None
+        self.label = label
+        self.result = result
+        self.created = timezone.now()
+
+    @property
+    def queued_bytes(self):
+        return len(self.body) if self.body is not None else 0
+
+
+class Writer(threading.Thread):
+    """
+    Writes queued records in batches from a background thread
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, queue_bytes: int):
+        super().__init__(name="logic-store", daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_bytes = queue_bytes
+        self.records = deque()
+        self.bytes = 0
+        # number of records taken from the queue and not written yet, and of callers waiting for them
+        self.writing = 0
+        self.flushing = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+
+    def put(self, record: Record):
+        """
+        Queues a record without waiting
+
+        :return: False when the queue is full and the record is dropped
+        """
+        with self.condition:
+            if self.stopped or (self.records and self.bytes + record.queued_bytes > self.queue_bytes):
+                metrics.STORE_DROPPED.labels().inc()
+                return False
+            self.records.append(record)
+            self.bytes += record.queued_bytes
+            if len(self.records) >= self.batch_size:
+                self.condition.notify_all()
+        return True
+
+    def run(self):
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.stopped or len(self.records) >= self.batch_size
+                                            or (self.flushing and self.records), self.flush_interval)
+                    batch = [self.records.popleft() for _ in range(min(self.batch_size, len(self.records)))]
+                    self.bytes -= sum(record.queued_bytes for record in batch)
+                    self.writing = len(batch)
+                    if not batch and self.stopped:
+                        return
+                if batch:
+                    try:
+                        write(batch)
+                    except Exception:
+                        logger.exception("Failed to store %d placements", len(batch))
+                        metrics.STORE_DROPPED.labels().inc(len(batch))
+                    with self.condition:
+                        self.writing = 0
+                        self.condition.notify_all()
+        finally:
+            close_old_connections()
+
+    def flush(self, timeout: float = None):
+        """
+        Waits until everything queued so far is written
+
+        :return: False when it is not written within timeout seconds
+        """
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            try:
+                return self.condition.wait_for(lambda: not self.records and not self.writing, timeout)
+            finally:
+                self.flushing -= 1
+
+    def stop(self, discard: bool = False):
+        """
+        Writes what is queued and ends the thread
+
+        :param discard: True to drop what is queued instead of writing it
+        """
+        with self.condition:
+            if discard:
+                self.records.clear()
+                self.bytes = 0
+            self.stopped = True
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join()
+
+
+def write(batch: list):
+    """
+    Inserts records in a single transaction
+
+    :param batch: list of Record
+    """
+    from .models import Placement, SubmittedFleet
+    fleets = {}
+    for record in batch:
+        fleets.setdefault(record.digest, SubmittedFleet(digest=record.digest, content_type=record.content_type,
+                                                        size=record.size, body=record.body, created=record.created))
+    placements = [Placement(fleet_id=record.digest, label=record.label, result=record.result, created=record.created)
+                  for record in batch]
+    # a labelled body is found by its hash too, see lookup
+    placements += [Placement(fleet_id=record.digest, label=None, result=record.result, created=record.created)
+                   for record in batch if record.label is not None]
+    with transaction.atomic():
+        # fleets and unlabelled placements already stored are skipped
+        SubmittedFleet.objects.bulk_create(fleets.values(), ignore_conflicts=True)
+        Placement.objects.bulk_create(placements, ignore_conflicts=True)
+    metrics.STORE_WRITTEN.labels().inc(len(batch))
+
+
+_writer = None
+_recent = OrderedDict()
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, "LOGIC_STORE_ENABLED", False)
+
+
+def get_writer():
+    """
+    :return: Writer configured from settings, started on first use
+    """
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                writer = Writer(getattr(settings, "LOGIC_STORE_BATCH_SIZE", DEFAULT_BATCH_SIZE),
+                                getattr(settings, "LOGIC_STORE_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL),
+                                getattr(settings, "LOGIC_STORE_QUEUE_BYTES", DEFAULT_QUEUE_BYTES))
+                writer.start()
+                _writer = writer
+    return _writer
+
+
+def label(request):
+    """
+    :param request: incoming POST request
+    :return: name given to the fleet of the request, None when not given;
+             raises ValueError on a malformed name
+    """
+    header = getattr(settings, "LOGIC_STORE_LABEL_HEADER", DEFAULT_LABEL_HEADER)
+    value = request.headers.get(header) if header and is_enabled() else None
+    if value is not None and not LABEL.fullmatch(value):
+        raise ValueError("{header} must be 1 to 128 letters, digits or _.:- characters, got {value}".format(
+            header=header, value=value))
+    return value
+
+
+def record(digest: str, content_type: str, body: bytes, name: str, result: dict):
+    """
+    Queues an answered request to be stored, when the store is enabled
+
+    :param digest: content hash of the body, see cache.body_digest
+    :param name: name of the fleet, see label, or None
+    :param result: solution returned for the body
+    """
+    if not is_enabled():
+        return
+    if name is None:
+        with _lock:
+            if digest in _recent:
+                _recent.move_to_end(digest)
+                return
+    if get_writer().put(Record(digest, content_type, body, name, result)):
+        with _lock:
+            _recent[digest] = None
+            if len(_recent) > RECENT_SIZE:
+                _recent.popitem(last=False)
+
+
+def lookup(digest: str, size: int = None):
+    """
+    :param digest: content hash of a request body
+    :param size: size of the body in bytes, None to look it up whatever its size
+    :return: stored solution of an identical body, None when there is none or
+             the body is too small to be worth a query
+    """
+    if not is_enabled():
+        return None
+    if size is not None and size <= getattr(settings, "LOGIC_STORE_LOOKUP_BYTES", DEFAULT_LOOKUP_BYTES):
+        return None
+    from .models import Placement
+    return Placement.objects.filter(fleet_id=digest, label__isnull=True).values_list("result", flat=True).first()
+
+
+def history(name: str, since=None, until=None):
+    """
+    :param name: name of the fleet, see label
+    :param since: earliest time to return, None for no bound
+    :param until: latest time to return, None for no bound
+    :return: list of (time, solution) of the named fleet in chronological order,
+             the latest settings.LOGIC_STORE_HISTORY_LIMIT ones when there are more
+    """
+    from .models import Placement
+    placements = Placement.objects.filter(label=name)
+    if since is not None:
+        placements = placements.filter(created__gte=since)
+    if until is not None:
+        placements = placements.filter(created__lte=until)
+    latest = placements.order_by("-created", "-id").values_list("created", "result")
+    return list(reversed(latest[:getattr(settings, "LOGIC_STORE_HISTORY_LIMIT", DEFAULT_HISTORY_LIMIT)]))
+
+
+def flush(timeout: float = None):
+    """
+    Waits until the queued records are written, e.g. in tests or before exiting
+
+    :return: False when they are not written within timeout seconds
+    """
+    writer = _writer
+    return writer.flush(timeout) if writer is not None else True
+
+
+@atexit.register
+def stop(discard: bool = False):
+    """
+    Writes the queued records before the process exits, and ends the writer thread
+
+    :param discard: True to drop the queued records instead, e.g. of a warm-up request
+    """
+    global _writer
+    writer = _writer
+    _writer = None
+    if writer is not None:
+        writer.stop(discard)
+    if discard:
+        with _lock:
+            _recent.clear()
+
+
+def forget():
+    """
+    Runs in a forked child: the writer thread of the parent does not exist there
+    """
+    global _writer, _lock
+    _writer = None
+    _lock = threading.Lock()
+    _recent.clear()
+
+
+os.register_at_fork(after_in_child=forget)
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    """
+    Stops the writer when store settings change, e.g. in tests
+    """
+    if setting.startswith("LOGIC_STORE"):
+        stop()
+        with _lock:
+            _recent.clear()
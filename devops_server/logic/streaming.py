@@ -0,0 +1,213 @@
+"""
+Streaming ingestion of request bodies.
+
+The body is read from the request stream in chunks and decoded one JSON value
+at a time. Entries of data_centers are validated and folded into a
+solver.Accumulator as they arrive, so memory does not grow with the number of
+data centers as long as the capacities precede data_centers in the body.
+When they come later, only (name, servers) pairs are kept until the
+capacities are known.
+
+The accumulator keeps only the DM_count best data centers, so DM_count should
+precede data_centers too. When it is not known by then, the LATE_DM_COUNT best
+ones are kept instead, so that a DM_count of at most LATE_DM_COUNT is still
+accepted after data_centers, without a second pass over the body.
+"""
+
+import codecs
+import json
+import re
+
+from . import metrics, solver
+from .validation import (BODY_FIELDS, OPTIONAL_BODY_FIELDS, dict_raise_on_duplicates,
+                         validate_capacity, validate_data_center)
+
+CHUNK_SIZE = 64 * 1024
+
+# Largest JSON text a single value (e.g. one data_centers entry) may span
+MAX_VALUE_SIZE = 1024 * 1024
+
+# Number of best data centers kept while DM_count is unknown, the largest DM_count
+# accepted after data_centers
+LATE_DM_COUNT = 64
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonStreamReader:
+    """
+    Incremental reader of JSON text from a binary stream with read(size).
+    Structural characters are consumed one by one, while complete values are
+    decoded with json.JSONDecoder.raw_decode. Consumed text is dropped from
+    the buffer, so only the value being decoded is held in memory.
+    """
+
+    def __init__(self, stream, chunk_size: int = CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder(object_pairs_hook=dict_raise_on_duplicates)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """
+        Reads the next chunk from the stream into the buffer.
+
+        :return: False when the stream is exhausted
+        """
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(b"", final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character without consuming it.
+
+        :return: next character or "" at the end of the stream
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, expected: str):
+        """
+        Consumes the next character, which must be one of expected.
+
+        :return: the consumed character
+        """
+        char = self.peek()
+        if not char or char not in expected:
+            raise ValueError("Expecting one of {expected!r}, got {char!r}".format(
+                expected=expected, char=char or "end of input"))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decodes the next complete JSON value.
+
+        :return: decoded value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if len(self.buffer) - self.pos > MAX_VALUE_SIZE:
+                    raise ValueError("JSON value exceeds {size} characters".format(size=MAX_VALUE_SIZE))
+                if self._fill():
+                    continue
+                raise
+            # a number or a literal ending with the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def end(self):
+        """
+        Checks that nothing but whitespace follows the document.
+        """
+        if self.peek():
+            raise ValueError("Extra data after the request body")
+
+
+def solve_stream(stream, chunk_size: int = CHUNK_SIZE):
+    """
+    Parses, validates and solves a request body read from the stream.
+    Applies the same rules as validate_body and returns the same solution
+    as solve_problem.
+
+    :param stream: binary file-like object, e.g. HttpRequest
+    :param chunk_size: number of bytes read from the stream at a time
+    :return: optimal solution
+    """
+    reader = JsonStreamReader(stream, chunk_size)
+    if reader.peek() != "{":
+        raise ValueError("Expecting an object, instead got value {body}".format(body=reader.value()))
+    reader.expect("{")
+
+    capacities = {}
+    dm_count = None
+    seen = set()
+    accumulator = None
+    pending = []
+
+    if reader.peek() != "}":
+        while True:
+            key = reader.value()
+            if type(key) != str:
+                raise ValueError("Expecting a field name, got {key!r}".format(key=key))
+            if key in seen:
+                raise ValueError("duplicate key: %r" % (key,))
+            seen.add(key)
+            if key not in BODY_FIELDS and key not in OPTIONAL_BODY_FIELDS:
+                raise ValueError("Got unexpected set of fields {body} "
+                                 "instead of {expected}".format(body=seen, expected=BODY_FIELDS))
+            reader.expect(":")
+
+            if key == "data_centers":
+                if reader.peek() != "[":
+                    raise ValueError("Expecting a list of data centers, "
+                                     "instead got value {data_centers} instead".format(
+                                      data_centers=reader.value()))
+                reader.expect("[")
+                if len(capacities) == 2:
+                    accumulator = solver.Accumulator(capacities["DM_capacity"], capacities["DE_capacity"],
+                                                     dm_count or LATE_DM_COUNT)
+                if reader.peek() != "]":
+                    while True:
+                        data_center = reader.value()
+                        validate_data_center(data_center)
+                        if accumulator is not None:
+                            accumulator.add(data_center["servers"], data_center["name"])
+                        else:
+                            pending.append((data_center["name"], data_center["servers"]))
+                        if reader.expect(",]") == "]":
+                            break
+                else:
+                    reader.expect("]")
+            elif key == "DM_count":
+                dm_count = reader.value()
+                validate_capacity(key, dm_count)
+                if accumulator is not None and dm_count > accumulator.dm_count:
+                    raise ValueError("DM_count larger than {count} must precede data_centers in large "
+                                     "request bodies".format(count=accumulator.dm_count))
+            else:
+                capacities[key] = reader.value()
+                validate_capacity(key, capacities[key])
+
+            if reader.expect(",}") == "}":
+                break
+    else:
+        reader.expect("}")
+    reader.end()
+
+    if seen - OPTIONAL_BODY_FIELDS != BODY_FIELDS:
+        raise ValueError("Got unexpected set of fields {body} "
+                         "instead of {expected}".format(body=seen, expected=BODY_FIELDS))
+
+    if accumulator is None:
+        accumulator = solver.Accumulator(capacities["DM_capacity"], capacities["DE_capacity"], dm_count or 1)
+        for name, servers in pending:
+            accumulator.add(servers, name)
+    else:
+        accumulator.keep(dm_count or 1)
+    metrics.REQUEST_SITES.labels().observe(accumulator.count)
+    DE_count, _ = accumulator.result()
+    names = [name for _, name in accumulator.selection()]
+    if dm_count is None:
+        return {"DE": DE_count, "DM_data_center": names[0]}
+    return {"DE": DE_count, "DM_data_centers": names}
@@ -0,0 +1,87 @@
+"""
+Capacity sweeps: the same fleet solved for a grid of DM and DE capacities,
+e.g. to compare hardware options, in one vectorized pass, see solver.solve_grid.
+
+Each capacity is given either as a list of values or as an inclusive range
+{"start": 10, "stop": 100, "step": 10}, step being optional. The grid may have
+at most settings.LOGIC_SWEEP_MAX_CELLS cells, and settings.LOGIC_SWEEP_CHUNK_SIZE
+bounds the number of values computed at a time.
+"""
+
+import numpy as np
+from django.conf import settings
+
+from . import solver
+from .validation import CAPACITY_FIELDS, compile_body, validate_capacity
+
+DEFAULT_MAX_CELLS = 10000
+DEFAULT_CHUNK_SIZE = 1 << 22
+RANGE_FIELDS = {"start", "stop", "step"}
+
+
+def get_max_cells():
+    return getattr(settings, "LOGIC_SWEEP_MAX_CELLS", DEFAULT_MAX_CELLS)
+
+
+def capacity_axis(key: str, value):
+    """
+    Validates a swept capacity and lists its values
+
+    :param key: name of the capacity field
+    :param value: list of capacities or range object
+    :return: list of capacities, raises ValueError on failed validation
+    """
+    if type(value) == dict:
+        if not {"start", "stop"} <= set(value) <= RANGE_FIELDS:
+            raise ValueError("Got unexpected set of range fields {fields} for key {key} "
+                             "instead of {expected}".format(fields=set(value), key=key, expected=RANGE_FIELDS))
+        for field in value:
+            validate_capacity("{key}.{field}".format(key=key, field=field), value[field])
+        if value["stop"] < value["start"]:
+            raise ValueError("Range of {key} stops before it starts".format(key=key))
+        if (value["stop"] - value["start"]) // value.get("step", 1) >= get_max_cells():
+            raise ValueError("Range of {key} has too many values".format(key=key))
+        return list(range(value["start"], value["stop"] + 1, value.get("step", 1)))
+    if type(value) == list and value:
+        for capacity in value:
+            validate_capacity(key, capacity)
+        return value
+    raise ValueError("Expecting a non-empty list or a range of {key}, "
+                     "instead got value {value}".format(key=key, value=value))
+
+
+def solve_sweep(body: dict):
+    """
+    Validates and solves a sweep request body
+
+    :param body: body of the form accepted by process(request), with capacities given as lists or ranges
+    :return: grid of solutions, raises ValueError on failed validation
+    """
+    if type(body) != dict:
+        raise ValueError("Expecting an object, instead got value {body}".format(body=body))
+    if "DM_count" in body:
+        raise ValueError("Sweeps place a single DM, DM_count is not supported")
+    axes = {}
+    for key in CAPACITY_FIELDS:
+        if key not in body:
+            raise ValueError("Missing field {key}".format(key=key))
+        axes[key] = capacity_axis(key, body[key])
+    if len(axes["DM_capacity"]) * len(axes["DE_capacity"]) > get_max_cells():
+        raise ValueError("Sweep has more than {cells} cells".format(cells=get_max_cells()))
+
+    # the largest capacities decide whether int64 arithmetic is safe for every cell
+    fleet = compile_body(dict(body, DM_capacity=max(axes["DM_capacity"]), DE_capacity=max(axes["DE_capacity"])))
+    dtype = object if fleet.exact else np.int64
+    DE_counts, DM_indices = solver.solve_grid(fleet.servers, np.array(axes["DM_capacity"], dtype=dtype),
+                                              np.array(axes["DE_capacity"], dtype=dtype),
+                                              getattr(settings, "LOGIC_SWEEP_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+
+    # DM sites are returned as positions in a table of the distinct sites used
+    used, positions = np.unique(DM_indices, return_inverse=True)
+    return {
+        "DM_capacity": axes["DM_capacity"],
+        "DE_capacity": axes["DE_capacity"],
+        "DE": DE_counts.tolist(),
+        "DM_site": positions.reshape(DM_indices.shape).tolist(),
+        "sites": [fleet.names[index] for index in used.tolist()],
+    }
@@ -0,0 +1,47 @@
+"""
+Synthetic fleets and requests used by the management commands and the cold
+start warm-up to exercise the endpoints.
+"""
+
+import io
+import random
+
+
+def fleet_body(sites: int, seed: int = 0, max_servers: int = 100):
+    """
+    Generates a random request body accepted by process(request)
+
+    :param sites: number of data centers
+    :param seed: seed of the random generator, equal seeds give equal bodies
+    :param max_servers: largest number of servers at a data center
+    :return: request body
+    """
+    rng = random.Random(seed)
+    return {
+        "DM_capacity": rng.randint(1, max_servers),
+        "DE_capacity": rng.randint(1, max_servers),
+        "data_centers": [{"name": "City{}".format(i), "servers": rng.randint(1, max_servers)}
+                         for i in range(sites)]
+    }
+
+
+def wsgi_environ(path: str, body: bytes, stream=None, content_type: str = "application/json"):
+    """
+    Builds the WSGI environ of a POST request, to drive the WSGI application in-process
+
+    :param path: path of the endpoint, e.g. /api/devops
+    :param body: request body
+    :param stream: wsgi.input delivering the body, by default a BytesIO of the body
+    :param content_type: content type of the body
+    :return: environ dict
+    """
+    return {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": path,
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "8000",
+        "CONTENT_TYPE": content_type,
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body) if stream is None else stream,
+        "wsgi.url_scheme": "http",
+    }
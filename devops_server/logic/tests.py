@@ -1,7 +1,41 @@
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.http import JsonResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 
-from .views import solve_problem
+from concurrent.futures import Future
+import gzip
+import io
+import itertools
+import json
+import math
+import os
+import pstats
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from . import (admission, cache, coalesce, columnar, compression, fleets, metrics, offload, partials, profiling, replay,
+               responses, snapshots, solver, store, streaming, sweep, views)
+from devops.coldstart import warm_up
+
+from .management.commands import benchmark
+from .management.commands.benchmark import find_regressions
+from .management.commands.loadtest import arrival_times, summarize
+from .models import Placement, SubmittedFleet
+from .streaming import solve_stream
+from .synthetic import fleet_body
+from .validation import BODY_FIELDS, compile_body, validate_body
+from .views import solve_fleet, solve_problem, solve_batch
 
 client = Client()
 
@@ -327,3 +361,1723 @@ class SolveProblemTests(TestCase):
         for standard_input, standard_output in zip(standard_inputs, standard_outputs):
             output = solve_problem(standard_input)
             self.assertEquals(output, standard_output)
+
+    def test_matches_exhaustive_search(self):
+        def exhaustive(body):
+            solutions = []
+            for i, DM_position in enumerate(body["data_centers"]):
+                DE_count = 0
+                for j, s in enumerate(body["data_centers"]):
+                    if i == j:
+                        DE_count += max(0, math.ceil((s["servers"] - body["DM_capacity"]) / body["DE_capacity"]))
+                    else:
+                        DE_count += math.ceil(s["servers"] / body["DE_capacity"])
+                solutions.append({"DE": DE_count, "DM_data_center": DM_position["name"]})
+            return sorted(solutions, key=lambda k: k["DE"])[0]
+
+        rng = random.Random(42)
+        for _ in range(200):
+            body = {
+                "DM_capacity": rng.randint(1, 30),
+                "DE_capacity": rng.randint(1, 30),
+                "data_centers": [{"name": "City{}".format(i), "servers": rng.randint(1, 100)}
+                                 for i in range(rng.randint(1, 20))]
+            }
+            self.assertEqual(solve_problem(body), exhaustive(body))
+
+    def test_duplicate_names(self):
+        body = {
+            "DM_capacity": 10,
+            "DE_capacity": 5,
+            "data_centers": [
+                {"name": "City", "servers": 10},
+                {"name": "City", "servers": 10},
+                {"name": "Other", "servers": 3}
+            ]
+        }
+        self.assertEqual(solve_problem(body), {"DE": 3, "DM_data_center": "City"})
+
+    def test_large_server_counts(self):
+        body = {
+            "DM_capacity": 1,
+            "DE_capacity": 1,
+            "data_centers": [
+                {"name": "Small", "servers": 1},
+                {"name": "Huge", "servers": 10 ** 30 + 2}
+            ]
+        }
+        # float arithmetic cannot represent 10 ** 30 + 2 exactly
+        self.assertEqual(solve_problem(body), {"DE": 10 ** 30 + 2, "DM_data_center": "Small"})
+
+
+class BatchTests(TestCase):
+    """
+    Tests the batch endpoint and the vectorized solve_batch function
+    against solve_problem.
+    """
+    def test_matches_solve_problem(self):
+        rng = random.Random(7)
+        problems = [
+            {
+                "DM_capacity": rng.randint(1, 30),
+                "DE_capacity": rng.randint(1, 30),
+                "data_centers": [{"name": "City{}".format(i), "servers": rng.randint(1, 100)}
+                                 for i in range(rng.randint(1, 20))]
+            }
+            for _ in range(300)
+        ]
+        self.assertEqual(solve_batch(problems), [solve_problem(p) for p in problems])
+
+    def test_per_item_errors(self):
+        problems = [
+            {"DM_capacity": 20, "DE_capacity": 8,
+             "data_centers": [{"name": "Paris", "servers": 20}, {"name": "Stockholm", "servers": 62}]},
+            {"DM_capacity": 0, "DE_capacity": 8,
+             "data_centers": [{"name": "Paris", "servers": 20}]},
+            {"DM_capacity": 1, "DE_capacity": 8, "data_centers": []},
+            "not a problem",
+            {"DM_capacity": 1, "DE_capacity": 1,
+             "data_centers": [{"name": "Huge", "servers": 2 ** 70}]},
+        ]
+        results = solve_batch(problems)
+        self.assertEqual(results[0], {"DE": 8, "DM_data_center": "Paris"})
+        for result in results[1:4]:
+            self.assertIn("error", result)
+        self.assertEqual(results[4], {"DE": 2 ** 70 - 1, "DM_data_center": "Huge"})
+
+    def test_post_request(self):
+        response = client.post(reverse("process_batch"),
+                               data=[{"DM_capacity": 12, "DE_capacity": 7,
+                                      "data_centers": [{"name": "Berlin", "servers": 11},
+                                                       {"name": "Stockholm", "servers": 21}]},
+                                     {"DM_capacity": 12}],
+                               content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(results[0], {"DE": 3, "DM_data_center": "Berlin"})
+        self.assertIn("error", results[1])
+
+    def test_invalid_post_request(self):
+        response = client.post(reverse("process_batch"),
+                               data={"DM_capacity": 12},
+                               content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = client.get(reverse("process_batch"))
+        self.assertEqual(response.status_code, 404)
+
+    def test_large_post_request(self):
+        problem = fleet_body(200, seed=3)
+        problems = [problem] * (settings.DATA_UPLOAD_MAX_MEMORY_SIZE // len(json.dumps(problem)) + 1)
+        body = json.dumps(problems)
+        self.assertGreater(len(body), settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        response = client.post(reverse("process_batch"), data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(b"".join(response.streaming_content) if response.streaming
+                                    else response.content)["results"],
+                         [solve_problem(problem)] * len(problems))
+        with override_settings(LOGIC_MAX_BODY_BYTES=len(body) - 1):
+            response = client.post(reverse("process_batch"), data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("larger than", response.json()["error"])
+
+
+@override_settings(LOGIC_STREAMING_THRESHOLD=0)
+class StreamingGetSolutionTest(GetSolutionTest):
+    """
+    Runs the API endpoint tests with every body parsed incrementally.
+    """
+
+
+class SolveStreamTests(TestCase):
+    """
+    Tests the streaming parser and solver against solve_problem.
+    """
+    def solve(self, body, chunk_size=7):
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return solve_stream(io.BytesIO(body), chunk_size=chunk_size)
+
+    def test_matches_solve_problem(self):
+        rng = random.Random(3)
+        for _ in range(100):
+            body = {
+                "DM_capacity": rng.randint(1, 30),
+                "DE_capacity": rng.randint(1, 30),
+                "data_centers": [{"name": "Città {}".format(i), "servers": rng.randint(1, 10 ** 6)}
+                                 for i in range(rng.randint(1, 20))]
+            }
+            self.assertEqual(self.solve(body), solve_problem(body))
+
+    def test_capacities_after_data_centers(self):
+        body = '{"data_centers": [{"name": "Paris", "servers": 30}, {"name": "Stockholm", "servers": 66}],' \
+               ' "DM_capacity": 6, "DE_capacity": 10}'
+        self.assertEqual(self.solve(body), {"DE": 9, "DM_data_center": "Stockholm"})
+
+    def test_invalid_bodies(self):
+        invalid_bodies = [
+            '',
+            '[]',
+            '{"DM_capacity": 1, "DM_capacity": 1, "DE_capacity": 1, "data_centers": []}',
+            '{"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": "A", "name": "B", "servers": 1}]}',
+            '{"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": "A", "servers": 1}]} {}',
+            '{"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": "A", "servers": 1}]',
+            '{"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": "A", "servers": 1.5}]}',
+            '{"DM_capacity": 1, "DE_capacity": 1, "data_centers": []}',
+            '{"DM_capacity": 1, "DE_capacity": 1}',
+        ]
+        for body in invalid_bodies:
+            with self.assertRaises(ValueError):
+                self.solve(body)
+
+
+@override_settings(LOGIC_CACHE_ENABLED=True, LOGIC_CACHE_BACKEND=None, LOGIC_CACHE_SIZE=16)
+class ResultCacheTests(TestCase):
+    """
+    Tests the result cache, its stores and its integration with the API endpoint.
+    """
+    body = {
+        "DM_capacity": 12,
+        "DE_capacity": 7,
+        "data_centers": [{"name": "Berlin", "servers": 11}, {"name": "Stockholm", "servers": 21}]
+    }
+
+    def post(self, data):
+        return client.post(reverse("process_input"), data=data, content_type="application/json")
+
+    def stats(self):
+        return client.get(reverse("cache_stats")).json()
+
+    def test_fingerprint(self):
+        reordered = {"data_centers": self.body["data_centers"],
+                     "DE_capacity": 7,
+                     "DM_capacity": 12}
+        self.assertEqual(cache.fingerprint(compile_body(self.body)), cache.fingerprint(compile_body(reordered)))
+        swapped = dict(self.body, data_centers=self.body["data_centers"][::-1])
+        self.assertNotEqual(cache.fingerprint(compile_body(self.body)), cache.fingerprint(compile_body(swapped)))
+
+    def test_local_store(self):
+        store = cache.LocalStore(size=2, ttl=None)
+        store.set("a", 1)
+        store.set("b", 2)
+        store.get("a")
+        store.set("c", 3)
+        self.assertEqual(store.get("a"), 1)
+        self.assertIsNone(store.get("b"))
+        expired = cache.LocalStore(size=2, ttl=-1)
+        expired.set("a", 1)
+        self.assertIsNone(expired.get("a"))
+
+    def test_hits_and_misses(self):
+        self.assertEqual(self.stats(), {"enabled": True, "hits": 0, "misses": 0})
+        first = self.post(self.body)
+        second = self.post(self.body)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(self.stats(), {"enabled": True, "hits": 1, "misses": 1})
+        # same fleet, different formatting
+        self.post(json.dumps(self.body, indent=2))
+        self.assertEqual(self.stats(), {"enabled": True, "hits": 2, "misses": 1})
+        # failures are not cached
+        self.assertEqual(self.post(dict(self.body, DM_capacity=0)).status_code, 400)
+        self.assertEqual(self.post(dict(self.body, DM_capacity=0)).status_code, 400)
+        self.assertEqual(self.stats(), {"enabled": True, "hits": 2, "misses": 1})
+
+    @override_settings(LOGIC_CACHE_BACKEND="default",
+                       CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_django_backend(self):
+        self.post(self.body)
+        self.post(self.body)
+        self.assertEqual(self.stats(), {"enabled": True, "hits": 1, "misses": 1})
+
+    @override_settings(LOGIC_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.post(self.body).status_code, 200)
+        self.assertEqual(self.stats(), {"enabled": False})
+
+
+class FleetTests(TestCase):
+    """
+    Tests incremental updates of fleets against solve_problem
+    and the fleet API endpoints.
+    """
+    def test_matches_solve_problem(self):
+        rng = random.Random(11)
+        for _ in range(20):
+            body = {
+                "DM_capacity": rng.randint(1, 30),
+                "DE_capacity": rng.randint(1, 30),
+                "data_centers": [{"name": "City{}".format(i), "servers": rng.randint(1, 100)}
+                                 for i in range(rng.randint(1, 10))]
+            }
+            fleet = fleets.Fleet.from_body(body)
+            # mirror of the fleet as an ordered list of data centers
+            mirror = list(body["data_centers"])
+            next_name = len(mirror)
+            for _ in range(50):
+                if mirror and rng.random() < 0.3:
+                    removed = mirror.pop(rng.randrange(len(mirror)))
+                    fleet.update(remove=[removed["name"]])
+                elif mirror and rng.random() < 0.6:
+                    index = rng.randrange(len(mirror))
+                    mirror[index] = {"name": mirror[index]["name"], "servers": rng.randint(1, 100)}
+                    fleet.update(data_centers=[mirror[index]])
+                else:
+                    mirror.append({"name": "City{}".format(next_name), "servers": rng.randint(1, 100)})
+                    next_name += 1
+                    fleet.update(data_centers=[mirror[-1]])
+                if mirror:
+                    self.assertEqual(fleet.solution(), solve_problem(dict(body, data_centers=mirror)))
+                else:
+                    self.assertEqual(fleet.solution(), {"DE": 0, "DM_data_center": None})
+
+    def test_invalid_updates(self):
+        fleet = fleets.Fleet.from_body({"DM_capacity": 12, "DE_capacity": 7,
+                                        "data_centers": [{"name": "Berlin", "servers": 11}]})
+        invalid_updates = [
+            {"data_centers": [{"name": "Paris", "servers": 0}]},
+            {"data_centers": [{"name": "Paris", "servers": 1}, {"name": "Paris", "servers": 2}]},
+            {"remove": ["Paris"]},
+            {"data_centers": [{"name": "Paris", "servers": 1}], "remove": ["Berlin", "Berlin2"]},
+            {"remove": ["Berlin", "Berlin"]},
+        ]
+        for update in invalid_updates:
+            with self.assertRaises(ValueError):
+                fleet.update(**update)
+        self.assertEqual(fleet.solution(), {"DE": 0, "DM_data_center": "Berlin"})
+        with self.assertRaises(ValueError):
+            fleets.Fleet.from_body({"DM_capacity": 12, "DE_capacity": 7,
+                                    "data_centers": [{"name": "Berlin", "servers": 11},
+                                                     {"name": "Berlin", "servers": 1}]})
+
+    def test_requests(self):
+        response = client.post(reverse("create_fleet"),
+                               data={"DM_capacity": 12, "DE_capacity": 7,
+                                     "data_centers": [{"name": "Berlin", "servers": 11},
+                                                      {"name": "Stockholm", "servers": 21}]},
+                               content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        fleet_id = response.json()["id"]
+        url = reverse("fleet_detail", args=[fleet_id])
+        self.assertEqual(client.get(url).json(), {"DE": 3, "DM_data_center": "Berlin"})
+
+        response = client.patch(url, data={"data_centers": [{"name": "Stockholm", "servers": 30}],
+                                           "remove": ["Berlin"]},
+                                content_type="application/json")
+        self.assertEqual(response.json(), {"DE": 3, "DM_data_center": "Stockholm"})
+        response = client.patch(url, data={"remove": "Stockholm"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = client.patch(url, data={"remove": ["Stockholm", "Stockholm"]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        # nothing was applied
+        self.assertEqual(client.get(url).json(), {"DE": 3, "DM_data_center": "Stockholm"})
+
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertEqual(client.get(url).status_code, 404)
+        response = client.post(reverse("create_fleet"), data={"DM_capacity": 12},
+                               content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_eviction(self):
+        body = {"DM_capacity": 12, "DE_capacity": 7, "data_centers": [{"name": "Berlin", "servers": 11}]}
+        with override_settings(LOGIC_FLEETS_MAX_COUNT=2):
+            first, _ = fleets.create(body)
+            second, _ = fleets.create(body)
+            fleets.get(first)
+            third, _ = fleets.create(body)
+            # the least recently used fleet is dropped
+            self.assertIsNone(fleets.get(second))
+            self.assertIsNotNone(fleets.get(first))
+            self.assertIsNotNone(fleets.get(third))
+            self.assertEqual(len(fleets.get_registry()), 2)
+        with override_settings(LOGIC_FLEETS_TTL=0.05):
+            first, _ = fleets.create(body)
+            time.sleep(0.1)
+            second, _ = fleets.create(body)
+            # expired fleets are dropped as new ones are registered
+            self.assertEqual(len(fleets.get_registry()), 1)
+            self.assertIsNone(fleets.get(first))
+            self.assertIsNotNone(fleets.get(second))
+            time.sleep(0.1)
+            self.assertEqual(client.get(reverse("fleet_detail", args=[second])).status_code, 404)
+
+
+class TopKTests(TestCase):
+    """
+    Tests ranking of DM placements and its pagination.
+    """
+    def test_matches_full_ranking(self):
+        rng = random.Random(5)
+        for _ in range(100):
+            dm_capacity, de_capacity = rng.randint(1, 30), rng.randint(1, 30)
+            servers = [rng.randint(1, 50) for _ in range(rng.randint(1, 30))]
+            baseline = sum(solver.de_count(s, de_capacity) for s in servers)
+            ranking = sorted(((baseline - solver.site_saving(s, dm_capacity, de_capacity), i)
+                              for i, s in enumerate(servers)))
+            k = rng.randint(1, 40)
+            self.assertEqual(solver.top_k(servers, dm_capacity, de_capacity, k), ranking[:k])
+            self.assertEqual(solver.top_k(servers, dm_capacity, de_capacity, 1)[0],
+                             solver.solve(servers, dm_capacity, de_capacity))
+            after = rng.randrange(len(servers))
+            position = ranking.index((baseline - solver.site_saving(servers[after], dm_capacity, de_capacity),
+                                      after))
+            self.assertEqual(solver.top_k(servers, dm_capacity, de_capacity, k, after),
+                             ranking[position + 1:position + 1 + k])
+
+    @override_settings(LOGIC_TOP_K_PAGE_SIZE=3)
+    def test_pagination(self):
+        body = {
+            "DM_capacity": 4,
+            "DE_capacity": 1,
+            "data_centers": [{"name": "City{}".format(i), "servers": i % 5 + 1} for i in range(10)]
+        }
+        expected = [{"DE": DE_count, "DM_data_center": "City{}".format(index)}
+                    for DE_count, index in solver.top_k([s["servers"] for s in body["data_centers"]], 4, 1, 8)]
+        placements, cursor, pages = [], None, 0
+        while True:
+            url = reverse("process_input") + "?top_k=8" + ("&cursor=" + cursor if cursor else "")
+            response = client.post(url, data=body, content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            placements.extend(response.json()["placements"])
+            cursor = response.json()["cursor"]
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(placements, expected)
+
+        response = client.post(reverse("process_input") + "?top_k=100", data=body, content_type="application/json")
+        self.assertEqual(len(response.json()["placements"]), 3)
+        for query in ["?top_k=0", "?top_k=x", "?top_k=5&cursor=bad", "?top_k=5&cursor=7.1"]:
+            response = client.post(reverse("process_input") + query, data=body, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+
+
+class MultipleDMTests(TestCase):
+    """
+    Tests placement of several DM's with DM_count.
+    """
+    def test_matches_exhaustive_search(self):
+        rng = random.Random(12)
+        for _ in range(200):
+            dm_capacity, de_capacity = rng.randint(1, 30), rng.randint(1, 30)
+            servers = [rng.randint(1, 60) for _ in range(rng.randint(1, 8))]
+            dm_count = rng.randint(1, 10)
+            best = None
+            for sites in itertools.combinations(range(len(servers)), min(dm_count, len(servers))):
+                DE_count = sum(solver.de_count(max(s - dm_capacity, 0) if i in sites else s, de_capacity)
+                               for i, s in enumerate(servers))
+                if best is None or DE_count < best:
+                    best = DE_count
+            body = {
+                "DM_capacity": dm_capacity,
+                "DE_capacity": de_capacity,
+                "DM_count": dm_count,
+                "data_centers": [{"name": "City{}".format(i), "servers": s} for i, s in enumerate(servers)]
+            }
+            solution = solve_problem(body)
+            self.assertEqual(solution["DE"], best)
+            self.assertEqual(len(solution["DM_data_centers"]), min(dm_count, len(servers)))
+            # the best DM site is the one placed by a single DM
+            single = solve_problem(dict(body, DM_count=1))
+            self.assertEqual(solution["DM_data_centers"][0], single["DM_data_centers"][0])
+            del body["DM_count"]
+            self.assertEqual(single["DM_data_centers"][0], solve_problem(body)["DM_data_center"])
+
+    def test_ties_and_exact_arithmetic(self):
+        body = {
+            "DM_capacity": 10,
+            "DE_capacity": 5,
+            "DM_count": 2,
+            "data_centers": [
+                {"name": "A", "servers": 10},
+                {"name": "B", "servers": 10},
+                {"name": "C", "servers": 10},
+                {"name": "D", "servers": 3}
+            ]
+        }
+        self.assertEqual(solve_problem(body), {"DE": 3, "DM_data_centers": ["A", "B"]})
+        body["data_centers"].append({"name": "Huge", "servers": 10 ** 30 + 10})
+        self.assertEqual(solve_problem(body), {"DE": 2 * 10 ** 29 + 5, "DM_data_centers": ["A", "B"]})
+
+    def test_streamed(self):
+        rng = random.Random(13)
+        for _ in range(50):
+            body = {
+                "DM_capacity": rng.randint(1, 30),
+                "DE_capacity": rng.randint(1, 30),
+                "DM_count": rng.randint(1, 25),
+                "data_centers": [{"name": "City{}".format(i), "servers": rng.randint(1, 100)}
+                                 for i in range(rng.randint(1, 20))]
+            }
+            self.assertEqual(solve_stream(io.BytesIO(json.dumps(body).encode("utf-8")), chunk_size=11),
+                             solve_problem(body))
+            # the best data centers are kept until DM_count is known
+            late = dict(body)
+            late["DM_count"] = late.pop("DM_count")
+            self.assertEqual(solve_stream(io.BytesIO(json.dumps(late).encode("utf-8")), chunk_size=11),
+                             solve_problem(body))
+        late = b'{"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": "A", "servers": 1}], "DM_count": 0}'
+        with self.assertRaises(ValueError):
+            solve_stream(io.BytesIO(late))
+        body = fleet_body(100, seed=2)
+        body["DM_count"] = streaming.LATE_DM_COUNT + 1
+        with self.assertRaisesRegex(ValueError, "must precede data_centers"):
+            solve_stream(io.BytesIO(json.dumps(body).encode("utf-8")))
+
+    def test_requests(self):
+        body = {
+            "DM_capacity": 4,
+            "DE_capacity": 1,
+            "DM_count": 2,
+            "data_centers": [{"name": "City{}".format(i), "servers": i + 1} for i in range(5)]
+        }
+        response = client.post(reverse("process_input"), data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"DE": 7, "DM_data_centers": ["City3", "City4"]})
+        self.assertEqual(solve_batch([body])[0], response.json())
+        for invalid in [0, -1, 1.5, "2", None]:
+            response = client.post(reverse("process_input"), data=dict(body, DM_count=invalid),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        response = client.post(reverse("process_input") + "?top_k=2", data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class CompileBodyTests(TestCase):
+    """
+    Tests the single pass validator and the compact fleet it produces.
+    """
+    def test_compact_fleet(self):
+        fleet = compile_body({"DM_capacity": 12, "DE_capacity": 7,
+                              "data_centers": [{"name": "Berlin", "servers": 11},
+                                               {"servers": 21, "name": "Stockholm"}]})
+        self.assertEqual(fleet.names, ["Berlin", "Stockholm"])
+        self.assertEqual(fleet.servers.dtype, np.int64)
+        self.assertEqual(fleet.servers.tolist(), [11, 21])
+        self.assertFalse(fleet.exact)
+        fleet = compile_body({"DM_capacity": 12, "DE_capacity": 7,
+                              "data_centers": [{"name": "Berlin", "servers": 2 ** 63}]})
+        self.assertTrue(fleet.exact)
+        self.assertEqual(fleet.servers.tolist(), [2 ** 63])
+
+    def test_error_messages(self):
+        entry = {"name": "City", "servers": True}
+        invalid_bodies = [
+            ({"DM_capacity": 1, "DE_capacity": 1},
+             "Got unexpected set of fields {} instead of {}".format({"DM_capacity", "DE_capacity"}, BODY_FIELDS)),
+            ({"DM_capacity": 1, "DE_capacity": 1, "data_centers": 4},
+             "Expecting a list of data centers, instead got value 4 instead"),
+            ({"DM_capacity": 1, "DE_capacity": 1, "data_centers": [entry]},
+             "Number of servers must be int, got True for entry {}".format(entry)),
+            ({"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": 10, "servers": 1}]},
+             "Data center name must be str, got 10 for entry {'name': 10, 'servers': 1}"),
+            ({"DM_capacity": 1, "DE_capacity": 1, "data_centers": [{"name": "City", "servers": 0}]},
+             "Numeric value for servers 0 is smaller than 1 for entry {'name': 'City', 'servers': 0}"),
+            ({"DM_capacity": "", "DE_capacity": 1, "data_centers": []},
+             "Numeric value for key DM_capacity is not integer: "),
+            ({"DM_capacity": 1, "DE_capacity": 0, "data_centers": []},
+             "Numeric value for key DE_capacity is smaller than 1: 0"),
+        ]
+        for body, message in invalid_bodies:
+            with self.assertRaises(ValueError) as context:
+                compile_body(body)
+            self.assertEqual(str(context.exception), message)
+            with self.assertRaises(ValueError):
+                validate_body(body)
+
+
+class ColumnarTests(TestCase):
+    """
+    Tests the columnar binary format of fleets.
+    """
+    def test_matches_solve_problem(self):
+        rng = random.Random(21)
+        for _ in range(50):
+            body = {
+                "DM_capacity": rng.randint(1, 30),
+                "DE_capacity": rng.randint(1, 30),
+                "data_centers": [{"name": rng.choice(["", "Città", "City{}".format(i)]),
+                                  "servers": rng.randint(1, 10 ** 6)}
+                                 for i in range(rng.randint(1, 20))]
+            }
+            raw = columnar.dumps([dc["name"] for dc in body["data_centers"]],
+                                 [dc["servers"] for dc in body["data_centers"]],
+                                 {"DM_capacity": body["DM_capacity"], "DE_capacity": body["DE_capacity"]})
+            fleet = columnar.loads(raw)
+            self.assertEqual(list(fleet.names), [dc["name"] for dc in body["data_centers"]])
+            self.assertEqual(solve_fleet(fleet), solve_problem(body))
+
+    def test_zero_copy(self):
+        raw = columnar.dumps(["A", "B"], [3, 2 ** 40], {"DM_capacity": 1, "DE_capacity": 1})
+        fleet = columnar.loads(raw)
+        self.assertFalse(fleet.servers.flags.owndata)
+        self.assertFalse(fleet.exact)
+        fleet = columnar.loads(columnar.dumps(["A"], [2 ** 62], {"DM_capacity": 1, "DE_capacity": 1}))
+        self.assertTrue(fleet.exact)
+
+    def test_invalid_bodies(self):
+        header = {"DM_capacity": 1, "DE_capacity": 1}
+        valid = columnar.dumps(["A", "B"], [1, 2], header)
+        invalid_bodies = [
+            b"",
+            b'{"DM_capacity": 1}',
+            valid[:-5],
+            columnar.dumps(["A"], [0], header),
+            columnar.dumps(["A"], [1], {"DM_capacity": 1}),
+            columnar.dumps(["A"], [1], dict(header, extra=1)),
+            columnar.dumps(["A"], [1], dict(header, DE_capacity=1.5)),
+            columnar.dumps(["A"], [1], dict(header, DM_count=0)),
+            valid.replace(b"AB", b"\xff\xfe"),
+            # the second name starts within the first character
+            columnar.dumps(["é", ""], [1, 1], header).replace(np.array([0, 2, 2]).tobytes(),
+                                                              np.array([0, 1, 2]).tobytes()),
+        ]
+        for body in invalid_bodies:
+            with self.assertRaises(ValueError):
+                columnar.loads(body)
+
+    def test_requests(self):
+        raw = columnar.dumps(["Paris", "Stockholm"], [30, 66], {"DM_capacity": 6, "DE_capacity": 10})
+        response = client.post(reverse("process_input"), data=raw, content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"DE": 9, "DM_data_center": "Stockholm"})
+        response = client.post(reverse("process_input") + "?top_k=2", data=raw, content_type=columnar.CONTENT_TYPE)
+        self.assertEqual([placement["DM_data_center"] for placement in response.json()["placements"]],
+                         ["Stockholm", "Paris"])
+        raw = columnar.dumps(["A"], [1], {"DM_capacity": 1, "DE_capacity": 1, "DM_count": 3})
+        response = client.post(reverse("process_input"), data=raw, content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.json(), {"DE": 0, "DM_data_centers": ["A"]})
+        response = client.post(reverse("process_input"), data=b"{}", content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+
+
+class SnapshotTests(TestCase):
+    """
+    Tests storing fleet snapshots on disk and solving them by id.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(LOGIC_SNAPSHOT_DIR=self.directory.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def put(self, snapshot_id, body):
+        raw = columnar.dumps([dc["name"] for dc in body["data_centers"]],
+                             [dc["servers"] for dc in body["data_centers"]], {})
+        return client.put(reverse("snapshot_detail", args=[snapshot_id]), data=raw,
+                          content_type=columnar.CONTENT_TYPE)
+
+    def solve(self, snapshot_id, capacities):
+        return client.post(reverse("solve_snapshot", args=[snapshot_id]), data=capacities,
+                           content_type="application/json")
+
+    def test_solve_by_id(self):
+        body = fleet_body(500, seed=4)
+        response = self.put("inventory", body)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"id": "inventory", "sites": 500})
+        for capacities in [{"DM_capacity": 7, "DE_capacity": 3}, {"DM_capacity": 50, "DE_capacity": 9, "DM_count": 4}]:
+            response = self.solve("inventory", capacities)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), solve_problem(dict(body, **capacities)))
+
+        snapshot = snapshots.get("inventory")
+        self.assertIsInstance(snapshot.servers.base.obj, np.memmap)
+        self.assertIs(snapshots.get("inventory"), snapshot)
+
+    def test_replace(self):
+        first, second = fleet_body(10, seed=1), fleet_body(20, seed=2)
+        self.put("inventory", first)
+        previous = snapshots.get("inventory")
+        self.put("inventory", second)
+        capacities = {"DM_capacity": 20, "DE_capacity": 3}
+        self.assertEqual(self.solve("inventory", capacities).json(), solve_problem(dict(second, **capacities)))
+        # the previous version stays readable for those who mapped it
+        self.assertEqual(len(previous), 10)
+        self.assertEqual(views.solve_fleet(previous.fleet(capacities)), solve_problem(dict(first, **capacities)))
+        # a failed upload keeps the current version
+        response = client.put(reverse("snapshot_detail", args=["inventory"]), data=b"garbage",
+                              content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get(reverse("snapshot_detail", args=["inventory"])).json()["sites"], 20)
+        self.assertEqual(os.listdir(self.directory.name), ["inventory.fleet"])
+
+    def test_size_limit(self):
+        self.put("inventory", fleet_body(10, seed=1))
+        with override_settings(LOGIC_SNAPSHOT_MAX_BYTES=1000, LOGIC_SNAPSHOT_DIR=self.directory.name):
+            self.assertEqual(self.put("small", fleet_body(10, seed=1)).status_code, 201)
+            response = self.put("inventory", fleet_body(1000, seed=2))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("larger than 1000 bytes", response.json()["error"])
+        # the partial upload is deleted and the current version kept
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["inventory.fleet", "small.fleet"])
+        self.assertEqual(client.get(reverse("snapshot_detail", args=["inventory"])).json()["sites"], 10)
+
+    def test_errors(self):
+        self.put("inventory", fleet_body(3))
+        self.assertEqual(self.solve("missing", {"DM_capacity": 1, "DE_capacity": 1}).status_code, 404)
+        for capacities in [{"DM_capacity": 1}, {"DM_capacity": 1, "DE_capacity": 0},
+                           {"DM_capacity": 1, "DE_capacity": 1, "data_centers": []}]:
+            self.assertEqual(self.solve("inventory", capacities).status_code, 400)
+        for snapshot_id in ["..", "bad.id"]:
+            self.assertEqual(self.put(snapshot_id, fleet_body(3)).status_code, 400)
+        raw = columnar.dumps(["A"], [1], {"DM_capacity": 1, "DE_capacity": 1})
+        response = client.put(reverse("snapshot_detail", args=["inventory"]), data=raw,
+                              content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.delete(reverse("snapshot_detail", args=["inventory"])).status_code, 204)
+        self.assertEqual(client.get(reverse("snapshot_detail", args=["inventory"])).status_code, 404)
+        self.assertEqual(client.delete(reverse("snapshot_detail", args=["inventory"])).status_code, 404)
+
+
+class CountingEvent(threading.Event):
+    """
+    Event counting the callers waiting for it
+    """
+    def __init__(self):
+        super().__init__()
+        self.waiters = 0
+
+    def wait(self, timeout=None):
+        self.waiters += 1
+        return super().wait(timeout)
+
+
+class CoalesceTests(TestCase):
+    """
+    Tests sharing of computations between concurrent identical requests.
+    """
+    def run_concurrently(self, flights, key, function, count, timeout=5):
+        """
+        Starts a leader blocked in function and count followers joining it
+
+        :return: tuple (results and errors per caller, function releasing the leader)
+        """
+        outcomes = []
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait(5)
+            return function()
+
+        def call(work):
+            try:
+                outcomes.append(flights.do(key, work, timeout))
+            except ValueError as err:
+                outcomes.append(err)
+
+        threads = [threading.Thread(target=call, args=(blocked,))]
+        threads[0].start()
+        started.wait(5)
+        flights.flights[key].done = CountingEvent()
+        threads += [threading.Thread(target=call, args=(function,)) for _ in range(count)]
+        for thread in threads[1:]:
+            thread.start()
+        return outcomes, threads, release
+
+    def wait_for_waiters(self, flights, key, count):
+        """
+        Waits until count callers wait for the computation in flight for the key
+        """
+        done = flights.flights[key].done
+        while done.waiters < count:
+            time.sleep(0.001)
+
+    def test_shared_result_and_error(self):
+        flights = coalesce.SingleFlight()
+        calls = []
+
+        def work():
+            calls.append(1)
+            return {"DE": len(calls)}
+
+        outcomes, threads, release = self.run_concurrently(flights, "key", work, 10)
+        self.wait_for_waiters(flights, "key", 10)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(outcomes, [{"DE": 1}] * 11)
+        self.assertEqual(len(flights), 0)
+        # nothing is kept once the computation ends
+        self.assertEqual(flights.do("key", work), {"DE": 2})
+
+        def fail():
+            calls.append(1)
+            raise ValueError("broken")
+
+        calls.clear()
+        outcomes, threads, release = self.run_concurrently(flights, "key", fail, 5)
+        self.wait_for_waiters(flights, "key", 5)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([str(outcome) for outcome in outcomes], ["broken"] * 6)
+        self.assertEqual(len(calls), 1)
+        # each caller raises its own exception object
+        self.assertEqual(len(set(map(id, outcomes))), 6)
+        with self.assertRaises(ValueError):
+            flights.do("key", fail)
+        self.assertEqual(len(flights), 0)
+
+    def test_timeout(self):
+        flights = coalesce.SingleFlight()
+        outcomes, threads, release = self.run_concurrently(flights, "key", lambda: "result", 3, timeout=0.05)
+        for thread in threads[1:]:
+            thread.join()
+        # waiting callers gave up on the stuck computation and computed the result themselves
+        self.assertEqual(outcomes, ["result"] * 3)
+        self.assertEqual(len(flights), 0)
+        release.set()
+        threads[0].join()
+
+    def test_no_waiting(self):
+        release = threading.Event()
+        leader = threading.Thread(target=coalesce._flights.do, args=("no-waiting", lambda: release.wait(5)))
+        leader.start()
+        try:
+            while "no-waiting" not in coalesce._flights.flights:
+                time.sleep(0.001)
+            with coalesce.without_waiting():
+                start = time.perf_counter()
+                # e.g. on an event loop, the identical computation in flight is not waited for
+                self.assertEqual(coalesce.run("no-waiting", lambda: "result"), "result")
+                self.assertLess(time.perf_counter() - start, 1)
+        finally:
+            release.set()
+            leader.join()
+
+    def test_requests(self):
+        body = json.dumps(fleet_body(50, seed=9))
+        results = []
+        with override_settings(LOGIC_CACHE_ENABLED=False):
+            threads = [threading.Thread(target=lambda: results.append(
+                       client.post(reverse("process_input"), data=body, content_type="application/json").json()))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [solve_problem(json.loads(body))] * 8)
+
+
+class AdmissionTests(TestCase):
+    """
+    Tests admission of requests by cost and tenant, and rejection of the others.
+    """
+    def queue(self, controller, tenant, cost, timeout=5):
+        """
+        Starts a request waiting to be admitted
+
+        :return: tuple (list receiving the ticket or the rejection, waiting ticket, thread)
+        """
+        outcome = []
+        waiters = controller.waiters
+
+        def acquire():
+            try:
+                outcome.append(controller.acquire(tenant, cost, timeout))
+            except admission.Rejected as err:
+                outcome.append(err)
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        while controller.waiters == waiters and not outcome:
+            time.sleep(0.001)
+        return outcome, controller.waiting[tenant][-1] if tenant in controller.waiting else None, thread
+
+    def test_fair_between_tenants(self):
+        controller = admission.Controller(2, 1, 10, 10)
+        first = controller.acquire("a", 1, 1)
+        controller.acquire("a", 1, 1)
+        later_a, ticket_a, thread_a = self.queue(controller, "a", 1)
+        later_b, ticket_b, thread_b = self.queue(controller, "b", 1)
+        first.release()
+        thread_b.join()
+        # b holds nothing, so it goes before the earlier request of a
+        self.assertEqual(later_b, [ticket_b])
+        self.assertFalse(ticket_a.admitted)
+        ticket_b.release()
+        thread_a.join()
+        self.assertEqual(later_a, [ticket_a])
+
+    def test_tenant_share(self):
+        controller = admission.Controller(4, 0.5, 10, 10)
+        huge = controller.acquire("a", 1000, 1)
+        self.assertEqual(huge.cost, 2)
+        # a is at its share, the rest of the capacity is left to others
+        self.assertIsNone(controller.acquire("a", 1, 1, wait=False))
+        self.assertIsNotNone(controller.acquire("b", 1, 1, wait=False))
+        self.assertIsNotNone(controller.acquire("c", 1, 1, wait=False))
+        self.assertIsNone(controller.acquire("d", 1, 1, wait=False))
+        self.assertEqual(controller.waiters, 0)
+
+    def test_large_request_not_overtaken(self):
+        controller = admission.Controller(4, 1, 10, 10)
+        held = controller.acquire("a", 3, 1)
+        _, large, thread = self.queue(controller, "b", 4)
+        # the small request would fit, but the large one came first
+        self.assertIsNone(controller.acquire("c", 1, 1, wait=False))
+        held.release()
+        thread.join()
+        self.assertTrue(large.admitted)
+
+    def test_rejections(self):
+        controller = admission.Controller(1, 1, 2, 1)
+        controller.acquire("a", 1, 1)
+        waiting, _, thread = self.queue(controller, "a", 1, timeout=0.05)
+        with self.assertRaises(admission.Rejected) as context:
+            controller.acquire("a", 1, 1)
+        self.assertEqual(context.exception.status, 429)
+        _, _, other = self.queue(controller, "b", 1, timeout=0.05)
+        with self.assertRaises(admission.Rejected) as context:
+            controller.acquire("c", 1, 1)
+        self.assertEqual(context.exception.status, 503)
+        thread.join()
+        other.join()
+        self.assertEqual(waiting[0].status, 503)
+        self.assertEqual(controller.waiting, {})
+
+    def test_estimate_cost(self):
+        factory = RequestFactory()
+        with override_settings(LOGIC_ADMISSION_SITE_BYTES=10, LOGIC_ADMISSION_UNIT_SITES=100):
+            self.assertEqual(admission.estimate_cost(factory.post("/", data=b"x" * 999,
+                                                                  content_type="application/json")), 1)
+            self.assertEqual(admission.estimate_cost(factory.post("/", data=b"x" * 2000,
+                                                                  content_type="application/json")), 3)
+            request = factory.post("/", data=b"x", content_type="application/json")
+            del request.META["CONTENT_LENGTH"]
+            self.assertEqual(admission.estimate_cost(request), math.inf)
+
+    def test_deadline(self):
+        request = RequestFactory().post("/", data=b"{}", content_type="application/json",
+                                        headers={"X-Request-Timeout": "0.5"})
+        with admission.admit(request):
+            self.assertLessEqual(admission.remaining(10), 0.5)
+            self.assertLessEqual(admission.remaining(None), 0.5)
+            self.assertEqual(admission.remaining(0.1), 0.1)
+        self.assertEqual(admission.remaining(10), 10)
+        self.assertEqual(admission.get_controller().in_flight, 0)
+
+    @override_settings(LOGIC_ADMISSION_CAPACITY=1, LOGIC_ADMISSION_TIMEOUT=5)
+    def test_endpoint(self):
+        body = fleet_body(10, seed=3)
+
+        def post(**headers):
+            return client.post(reverse("process_input"), data=body, content_type="application/json",
+                               headers=headers)
+
+        self.assertEqual(post().status_code, 200)
+        self.assertEqual(post(**{"X-Request-Timeout": "soon"}).status_code, 400)
+        held = admission.get_controller().acquire("other", 1, 1)
+        try:
+            start = time.perf_counter()
+            response = post(**{"X-Request-Timeout": "0.05"})
+            # the client's deadline shortens the wait
+            self.assertLess(time.perf_counter() - start, 2)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "1")
+        finally:
+            held.release()
+        with override_settings(LOGIC_ADMISSION_TENANT_QUEUE=0):
+            self.assertEqual(post(**{"X-Tenant": "a"}).status_code, 200)
+            held = admission.get_controller().acquire("other", 1, 1)
+            response = post(**{"X-Tenant": "a"})
+            held.release()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response["Retry-After"], "1")
+
+    def test_tenant(self):
+        factory = RequestFactory()
+        request = factory.post("/", HTTP_X_TENANT="a", REMOTE_ADDR="10.1.2.3")
+        # the header is only trusted from a proxy
+        self.assertEqual(admission.tenant(request), "10.1.2.3")
+        self.assertEqual(admission.tenant(factory.post("/", HTTP_X_TENANT="a")), "a")
+        with override_settings(LOGIC_ADMISSION_TRUSTED_PROXIES=["10.0.0.0/8"]):
+            self.assertEqual(admission.tenant(request), "a")
+            self.assertEqual(admission.tenant(factory.post("/", REMOTE_ADDR="10.1.2.3")), "10.1.2.3")
+            self.assertEqual(admission.tenant(factory.post("/", HTTP_X_TENANT="a")), "127.0.0.1")
+
+
+class PartialTests(TestCase):
+    """
+    Tests partial aggregates of shards and their merging.
+    """
+    def test_merge_matches_solve_problem(self):
+        rng = random.Random(18)
+        for _ in range(200):
+            body = fleet_body(rng.randint(1, 40), seed=rng.randrange(1000), max_servers=30)
+            body["DM_capacity"], body["DE_capacity"] = rng.randint(1, 20), rng.randint(1, 20)
+            bounds = sorted(rng.randint(0, len(body["data_centers"])) for _ in range(rng.randint(0, 4)))
+            shards = [body["data_centers"][start:end]
+                      for start, end in zip([0] + bounds, bounds + [len(body["data_centers"])])]
+            shard_partials = [partials.make_partial(compile_body(dict(body, data_centers=shard)))
+                              for shard in shards]
+            for partial in shard_partials:
+                partials.validate_partial(partial)
+            merged = partials.merge(shard_partials)
+            self.assertEqual(merged, partials.make_partial(compile_body(body)))
+            self.assertEqual(partials.solution(merged), solve_problem(body))
+            # merging is associative
+            half = len(shard_partials) // 2
+            if half:
+                regrouped = partials.merge([partials.merge(shard_partials[:half]),
+                                            partials.merge(shard_partials[half:])])
+                self.assertEqual(regrouped, merged)
+
+    def test_requests(self):
+        body = {"DM_capacity": 6, "DE_capacity": 10, "data_centers": [
+            {"name": "Paris", "servers": 30}, {"name": "Stockholm", "servers": 66}, {"name": "Oslo", "servers": 66}]}
+        shard_partials = []
+        for shard in ([], body["data_centers"][:1], body["data_centers"][1:]):
+            response = client.post(reverse("process_partial"), data=dict(body, data_centers=shard),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            shard_partials.append(response.json())
+        self.assertEqual(shard_partials[2], {"DM_capacity": 6, "DE_capacity": 10, "sites": 2, "baseline": 14,
+                                             "best_saving": 1, "runner_up_saving": 1, "DM_data_center": "Stockholm"})
+        response = client.post(reverse("merge_partials"), data={"partials": shard_partials},
+                               content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["DE"], solve_problem(body)["DE"])
+        self.assertEqual(response.json()["DM_data_center"], "Stockholm")
+
+        other = dict(shard_partials[1], DE_capacity=3)
+        broken = dict(shard_partials[2], runner_up_saving=None)
+        for invalid in [[], [shard_partials[0]], [shard_partials[1], other], [broken], "x"]:
+            response = client.post(reverse("merge_partials"), data={"partials": invalid},
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        response = client.post(reverse("process_partial"), data=dict(body, DM_count=2),
+                               content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ProfilingTests(TestCase):
+    """
+    Tests the opt-in profiling of requests.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.body = json.dumps(fleet_body(2000, seed=19))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def post(self, **headers):
+        return client.post(reverse("process_input"), data=self.body, content_type="application/json", **headers)
+
+    def test_profiled_request(self):
+        with override_settings(LOGIC_PROFILE_ENABLED=True, LOGIC_PROFILE_DIR=self.directory.name,
+                               LOGIC_PROFILE_INTERVAL=0.0001, LOGIC_CACHE_ENABLED=False):
+            response = self.post(HTTP_X_PROFILE="1", HTTP_X_REQUEST_ID="slow-customer")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Profile-Id"], "slow-customer")
+            self.assertEqual(response.json(), solve_problem(json.loads(self.body)))
+            stats = pstats.Stats(os.path.join(self.directory.name, "slow-customer.pstats"))
+            self.assertTrue(any(function == "compile_body" for _, _, function in stats.stats))
+            with open(os.path.join(self.directory.name, "slow-customer.collapsed")) as collapsed:
+                for line in collapsed:
+                    stack, count = line.rsplit(" ", 1)
+                    self.assertGreater(int(count), 0)
+
+            # unsafe ids are replaced
+            response = self.post(HTTP_X_PROFILE="1", HTTP_X_REQUEST_ID="../etc")
+            self.assertRegex(response["X-Profile-Id"], "^[0-9a-f]{32}$")
+            self.assertFalse(self.post().has_header("X-Profile-Id"))
+
+        with override_settings(LOGIC_PROFILE_ENABLED=False, LOGIC_PROFILE_DIR=self.directory.name):
+            self.assertFalse(self.post(HTTP_X_PROFILE="1").has_header("X-Profile-Id"))
+        with override_settings(LOGIC_PROFILE_ENABLED=True, LOGIC_PROFILE_SAMPLE_RATE=1.0,
+                               LOGIC_PROFILE_DIR=self.directory.name):
+            self.assertTrue(self.post().has_header("X-Profile-Id"))
+
+    def test_bounded_disk_usage(self):
+        with override_settings(LOGIC_PROFILE_ENABLED=True, LOGIC_PROFILE_DIR=self.directory.name,
+                               LOGIC_PROFILE_MAX_BYTES=0):
+            self.post(HTTP_X_PROFILE="1")
+        self.assertEqual(os.listdir(self.directory.name), [])
+        for i in range(5):
+            with open(os.path.join(self.directory.name, str(i)), "wb") as profile:
+                profile.write(b"x" * 100)
+            os.utime(profile.name, ns=(i * 10 ** 9, i * 10 ** 9))
+        profiling.prune(self.directory.name, 250)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["3", "4"])
+
+
+class SweepTests(TestCase):
+    """
+    Tests solving a fleet for a grid of capacities.
+    """
+    def test_matches_solve_problem(self):
+        rng = random.Random(20)
+        for chunk_size in [1, 7, 1 << 22]:
+            body = fleet_body(rng.randint(1, 30), seed=rng.randrange(100), max_servers=60)
+            body["DM_capacity"] = [rng.randint(1, 50) for _ in range(5)]
+            body["DE_capacity"] = {"start": 1, "stop": 20, "step": 3}
+            with override_settings(LOGIC_SWEEP_CHUNK_SIZE=chunk_size):
+                result = sweep.solve_sweep(body)
+            self.assertEqual(result["DE_capacity"], [1, 4, 7, 10, 13, 16, 19])
+            for row, dm_capacity in enumerate(result["DM_capacity"]):
+                for column, de_capacity in enumerate(result["DE_capacity"]):
+                    expected = solve_problem(dict(body, DM_capacity=dm_capacity, DE_capacity=de_capacity))
+                    self.assertEqual(result["DE"][row][column], expected["DE"])
+                    self.assertEqual(result["sites"][result["DM_site"][row][column]], expected["DM_data_center"])
+
+    def test_exact_arithmetic(self):
+        body = {"DM_capacity": [1, 10 ** 30], "DE_capacity": [1],
+                "data_centers": [{"name": "Small", "servers": 1}, {"name": "Huge", "servers": 10 ** 30 + 2}]}
+        result = sweep.solve_sweep(body)
+        self.assertEqual(result["DE"], [[10 ** 30 + 2], [3]])
+        self.assertEqual(result["sites"], ["Small", "Huge"])
+
+    def test_requests(self):
+        body = {"DM_capacity": [6, 30], "DE_capacity": [10], "data_centers": [
+            {"name": "Paris", "servers": 30}, {"name": "Stockholm", "servers": 66}]}
+        response = client.post(reverse("process_sweep"), data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"DM_capacity": [6, 30], "DE_capacity": [10], "DE": [[9], [7]],
+                                           "DM_site": [[1], [0]], "sites": ["Paris", "Stockholm"]})
+        invalid_axes = [[], [0], 5, {"start": 1}, {"start": 5, "stop": 1}, {"start": 1, "stop": 2, "step": 0},
+                        {"start": 1, "stop": 10 ** 9}]
+        for axis in invalid_axes:
+            response = client.post(reverse("process_sweep"), data=dict(body, DE_capacity=axis),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        with override_settings(LOGIC_SWEEP_MAX_CELLS=3):
+            response = client.post(reverse("process_sweep"), data=dict(body, DE_capacity=[1, 2]),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+
+
+class ReplayTests(TestCase):
+    """
+    Tests solving a fleet at every step of its history.
+    """
+    def series(self, steps, sites, seed=0, max_servers=60):
+        rng = random.Random(seed)
+        return {"DM_capacity": rng.randint(1, 50), "DE_capacity": rng.randint(1, 10),
+                "sites": ["City{}".format(i) for i in range(sites)],
+                "servers": [[rng.randint(1, max_servers) for _ in range(sites)] for _ in range(steps)]}
+
+    def test_matches_solve_problem(self):
+        for chunk_size in [1, 7, 1 << 22]:
+            body = self.series(40, 9, seed=chunk_size, max_servers=30)
+            with override_settings(LOGIC_REPLAY_CHUNK_SIZE=chunk_size):
+                result = replay.solve_series(*replay.compile_series(body))
+            self.assertEqual(result["steps"], 40)
+            DM_sites = []
+            for step, row in enumerate(body["servers"]):
+                expected = solve_problem({"DM_capacity": body["DM_capacity"], "DE_capacity": body["DE_capacity"],
+                                          "data_centers": [{"name": name, "servers": servers}
+                                                           for name, servers in zip(body["sites"], row)]})
+                self.assertEqual(result["DE"][step], expected["DE"])
+                DM_sites.append(result["sites"][result["DM_site"][step]])
+                self.assertEqual(DM_sites[-1], expected["DM_data_center"])
+            self.assertEqual(result["changes"], [{"step": step, "from": DM_sites[step - 1], "to": DM_sites[step]}
+                                                 for step in range(1, 40) if DM_sites[step] != DM_sites[step - 1]])
+
+    def test_exact_arithmetic(self):
+        body = {"DM_capacity": 10 ** 30, "DE_capacity": 1, "sites": ["Small", "Huge"],
+                "servers": [[1, 10 ** 30 + 2], [10 ** 31, 2]]}
+        result = replay.solve_series(*replay.compile_series(body))
+        self.assertEqual(result["DE"], [3, 2 + 9 * 10 ** 30])
+        self.assertEqual(result["changes"], [{"step": 1, "from": "Huge", "to": "Small"}])
+
+    def test_requests(self):
+        body = {"DM_capacity": 6, "DE_capacity": 10, "sites": ["Paris", "Stockholm"],
+                "servers": [[30, 66], [30, 66], [66, 30]]}
+        expected = {"DM_capacity": 6, "DE_capacity": 10, "steps": 3, "DE": [9, 9, 9], "DM_site": [1, 1, 0],
+                    "sites": ["Paris", "Stockholm"], "changes": [{"step": 2, "from": "Stockholm", "to": "Paris"}]}
+        response = client.post(reverse("process_replay"), data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected)
+        encoded = columnar.dumps(body["sites"], body["servers"], {"DM_capacity": 6, "DE_capacity": 10})
+        response = client.post(reverse("process_replay"), data=encoded, content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.json(), expected)
+        # a series is not a fleet
+        response = client.post(reverse("process_input"), data=encoded, content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+
+        invalid = [dict(body, servers=[]), dict(body, servers=[[30]]), dict(body, servers=[[30, True]]),
+                   dict(body, servers=[[30, 0]]), dict(body, servers=[[30, 1.5]]), dict(body, sites=[1, 2]),
+                   dict(body, DE_capacity=0), dict(body, extra=1), dict(body, sites=[], servers=[[]])]
+        for series in invalid:
+            response = client.post(reverse("process_replay"), data=series, content_type="application/json")
+            self.assertEqual(response.status_code, 400, series)
+        encoded = columnar.dumps(body["sites"], [[30, 0]], {"DM_capacity": 6, "DE_capacity": 10})
+        response = client.post(reverse("process_replay"), data=encoded, content_type=columnar.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+        # the expected fields are the ones checked
+        with self.assertRaisesRegex(ValueError, "instead of .*'sites'"):
+            replay.loads_series(columnar.dumps(body["sites"], [[30, 1]], {"DM_capacity": 6, "DE_capacity": 10,
+                                                                              "DM_count": 2}))
+        self.assertEqual(client.get(reverse("process_replay")).status_code, 404)
+
+    def test_quarter_request(self):
+        # a quarter of hourly counts is larger than DATA_UPLOAD_MAX_MEMORY_SIZE as JSON
+        body = self.series(2160, 500, seed=5)
+        data = json.dumps(body)
+        self.assertGreater(len(data), settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        response = client.post(reverse("process_replay"), data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(json.loads(content), replay.solve_series(*replay.compile_series(body)))
+
+
+class CompressionTests(TestCase):
+    """
+    Tests compressed and streamed responses, and compressed request bodies.
+    """
+    series = {"DM_capacity": 6, "DE_capacity": 10, "sites": ["Paris", "Stockholm"],
+              "servers": [[30 + step % 50, 66 - step % 40] for step in range(500)]}
+
+    def replay(self, **headers):
+        return client.post(reverse("process_replay"), data=self.series, content_type="application/json", **headers)
+
+    def decompress(self, response):
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        if response.get("Content-Encoding") == "zstd":
+            return compression.zstandard.ZstdDecompressor().decompressobj().decompress(content)
+        return gzip.decompress(content) if response.get("Content-Encoding") == "gzip" else content
+
+    def test_negotiate(self):
+        preferred = compression.codings()[0]
+        self.assertEqual(compression.negotiate(""), None)
+        self.assertEqual(compression.negotiate("gzip"), "gzip")
+        self.assertEqual(compression.negotiate("gzip, deflate, br, zstd"), preferred)
+        self.assertEqual(compression.negotiate("gzip;q=1.0, zstd;q=0.5"), "gzip")
+        self.assertEqual(compression.negotiate("*"), preferred)
+        self.assertEqual(compression.negotiate("*, gzip;q=0"), "zstd" if preferred == "zstd" else None)
+        self.assertEqual(compression.negotiate("br, identity"), None)
+
+    def test_compressed_response(self):
+        plain = self.replay()
+        self.assertNotIn("Content-Encoding", plain)
+        for coding in compression.codings():
+            response = self.replay(HTTP_ACCEPT_ENCODING=coding)
+            self.assertEqual(response["Content-Encoding"], coding)
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            self.assertEqual(int(response["Content-Length"]), len(response.content))
+            self.assertLess(len(response.content), len(plain.content) / 5)
+            self.assertEqual(self.decompress(response), plain.content)
+        # not worth it for small responses
+        response = client.post(reverse("process_input"), data={"DM_capacity": 1, "DE_capacity": 1, "data_centers": [
+            {"name": "Paris", "servers": 1}]}, content_type="application/json", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", response)
+
+    @override_settings(LOGIC_RESPONSE_CHUNK_ITEMS=64)
+    def test_streamed_response(self):
+        response = self.replay()
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 10)
+        # 64 items of at most 64 bytes each, the changes being the largest ones
+        self.assertLess(max(len(chunk) for chunk in chunks), 64 * 64)
+        with override_settings(LOGIC_RESPONSE_CHUNK_ITEMS=None):
+            expected = self.replay()
+        self.assertFalse(expected.streaming)
+        self.assertEqual(b"".join(chunks), expected.content)
+        for coding in compression.codings():
+            response = self.replay(HTTP_ACCEPT_ENCODING=coding)
+            self.assertNotIn("Content-Length", response)
+            self.assertEqual(self.decompress(response), expected.content)
+
+        result = {"DE": np.arange(200), "nested": {"rows": [[1, 2]] * 100, "name": "Paris"}}
+        self.assertEqual(b"".join(responses.chunks(result, 7)), JsonResponse(
+            {"DE": list(range(200)), "nested": {"rows": [[1, 2]] * 100, "name": "Paris"}}).content)
+        # a few large results are encoded one by one
+        result = {"results": [{"DE": list(range(100))}, {"error": "invalid"}, [list(range(20))]]}
+        self.assertTrue(responses.is_large(result, 7))
+        chunks = list(responses.chunks(result, 7))
+        self.assertLess(max(len(chunk) for chunk in chunks), 7 * 16)
+        self.assertEqual(b"".join(chunks), JsonResponse(result).content)
+        # one chunk per chunk of list items whatever their size, then the closing brackets
+        self.assertEqual(len(list(responses.chunks({"DE": list(range(10 ** 6, 10 ** 6 + 70))}, 7))), 11)
+        self.assertEqual(len(list(responses.chunks({"DE": [0] * 70}, 7))), 11)
+
+    @override_settings(LOGIC_RESPONSE_CHUNK_ITEMS=64)
+    def test_async_streamed_response(self):
+        request = AsyncRequestFactory().post("/api/devops", data=json.dumps(fleet_body(100)),
+                                             content_type="application/json")
+        response = async_to_sync(views.process_async)(request)
+        self.assertFalse(response.streaming)
+        response = responses.asynchronous(responses.json_response({"DE": list(range(1000))}))
+        self.assertTrue(response.is_async)
+
+        async def collect():
+            return b"".join([chunk async for chunk in response])
+
+        self.assertEqual(json.loads(async_to_sync(collect)()), {"DE": list(range(1000))})
+
+    def test_compressed_request(self):
+        body = json.dumps(fleet_body(500, seed=4)).encode()
+        expected = solve_problem(json.loads(body))
+        encoders = {"gzip": gzip.compress}
+        if compression.zstandard is not None:
+            encoders["zstd"] = compression.zstandard.ZstdCompressor().compress
+        for coding, encode in encoders.items():
+            for threshold in [None, 0]:
+                with override_settings(LOGIC_STREAMING_THRESHOLD=threshold, LOGIC_CACHE_ENABLED=False):
+                    response = client.post(reverse("process_input"), data=encode(body),
+                                           content_type="application/json", HTTP_CONTENT_ENCODING=coding)
+                self.assertEqual(response.json(), expected)
+            fleet = compile_body(json.loads(body))
+            encoded = columnar.dumps(fleet.names, fleet.servers, {"DM_capacity": fleet.dm_capacity,
+                                                                  "DE_capacity": fleet.de_capacity})
+            response = client.post(reverse("process_input"), data=encode(encoded),
+                                   content_type=columnar.CONTENT_TYPE, HTTP_CONTENT_ENCODING=coding)
+            self.assertEqual(response.json(), expected)
+
+        invalid = [(body, "gzip"), (gzip.compress(body)[:100], "gzip"), (body, "br")]
+        for data, coding in invalid:
+            response = client.post(reverse("process_input"), data=data, content_type="application/json",
+                                   HTTP_CONTENT_ENCODING=coding)
+            self.assertEqual(response.status_code, 400, coding)
+        with override_settings(LOGIC_COMPRESSION_MAX_BODY_BYTES=len(body) - 1):
+            response = client.post(reverse("process_input"), data=gzip.compress(body),
+                                   content_type="application/json", HTTP_CONTENT_ENCODING="gzip")
+            self.assertEqual(response.status_code, 413)
+            self.assertIn("larger than", response.json()["error"])
+
+    def test_compressed_request_size(self):
+        body = json.dumps(fleet_body(2000, seed=5)).encode()
+        factory = RequestFactory()
+        plain = factory.post("/api/devops", data=body, content_type="application/json")
+        compressed = factory.post("/api/devops", data=gzip.compress(body), content_type="application/json",
+                                  HTTP_CONTENT_ENCODING="gzip")
+        # the size of a compressed body is unknown until it is read
+        with override_settings(LOGIC_STREAMING_THRESHOLD=len(body), LOGIC_ASYNC_OFFLOAD_THRESHOLD=len(body)):
+            self.assertFalse(views.is_streamed(plain))
+            self.assertTrue(views.is_streamed(compressed))
+            self.assertFalse(views.is_offloaded(plain))
+            self.assertTrue(views.is_offloaded(compressed))
+        self.assertEqual(admission.estimate_cost(plain), 1)
+        self.assertEqual(admission.estimate_cost(compressed), math.inf)
+
+        # the limit of plain bodies applies once decompressed
+        problems = json.dumps([json.loads(body)] * 3).encode()
+        with override_settings(LOGIC_MAX_BODY_BYTES=len(problems) - 1):
+            for data, headers in [(problems, {}), (gzip.compress(problems), {"HTTP_CONTENT_ENCODING": "gzip"})]:
+                response = client.post(reverse("process_batch"), data=data, content_type="application/json",
+                                       **headers)
+                self.assertEqual(response.status_code, 413)
+        response = client.post(reverse("process_batch"), data=gzip.compress(problems),
+                               content_type="application/json", HTTP_CONTENT_ENCODING="gzip")
+        self.assertEqual(response.json()["results"], [solve_problem(json.loads(body))] * 3)
+
+
+class AsyncProcessTests(TestCase):
+    """
+    Tests the asynchronous version of the API endpoint, solving inline and in the thread pool.
+    """
+    body = {
+        "DM_capacity": 6,
+        "DE_capacity": 10,
+        "data_centers": [{"name": "Paris", "servers": 30}, {"name": "Stockholm", "servers": 66}]
+    }
+
+    def post(self, data):
+        request = AsyncRequestFactory().post("/api/devops", data=data, content_type="application/json")
+        return async_to_sync(views.process_async)(request)
+
+    def check(self):
+        response = self.post(self.body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {"DE": 9, "DM_data_center": "Stockholm"})
+        self.assertEqual(self.post(dict(self.body, DE_capacity=0)).status_code, 400)
+        request = AsyncRequestFactory().get("/api/devops")
+        self.assertEqual(async_to_sync(views.process_async)(request).status_code, 404)
+
+    @override_settings(LOGIC_ASYNC_OFFLOAD_THRESHOLD=10 ** 6)
+    def test_inline(self):
+        self.check()
+
+    @override_settings(LOGIC_ASYNC_OFFLOAD_THRESHOLD=0)
+    def test_offloaded(self):
+        self.check()
+
+
+class BenchmarkTests(TestCase):
+    """
+    Tests the benchmark command and its regression check.
+    """
+    def test_find_regressions(self):
+        baseline = {"results": {"10": {"solve": {"seconds": 0.0001}},
+                                "1000": {"solve": {"seconds": 0.01}, "parse": {"seconds": 0.01}}}}
+        results = {"results": {"10": {"solve": {"seconds": 0.01}},
+                               "1000": {"solve": {"seconds": 0.0115}, "parse": {"seconds": 0.013}}}}
+        regressions = find_regressions(results, baseline, threshold=0.2, min_seconds=0.001)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("parse with 1000 sites"))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command("benchmark", sizes=[10, 20], repeat=1, output=output, stdout=io.StringIO())
+            with open(output) as results:
+                results = json.load(results)
+            self.assertEqual(set(results["results"]), {"10", "20"})
+            large_sizes = benchmark.LARGE_SIZES
+            benchmark.LARGE_SIZES = [30]
+            try:
+                call_command("benchmark", sizes=[10], repeat=1, large=True, output=output, stdout=io.StringIO())
+            finally:
+                benchmark.LARGE_SIZES = large_sizes
+            with open(output) as large:
+                self.assertEqual(set(json.load(large)["results"]), {"10", "30"})
+            self.assertEqual(set(results["results"]["10"]), {"parse", "validate", "solve", "request"})
+
+            for stages in results["results"].values():
+                for stage in stages.values():
+                    stage["seconds"] /= 100
+            with open(output, "w") as baseline:
+                json.dump(results, baseline)
+            with self.assertRaises(CommandError):
+                call_command("benchmark", sizes=[10, 20], repeat=1, baseline=output,
+                             min_seconds=0, stdout=io.StringIO())
+
+
+class PlanCommandTests(TestCase):
+    """
+    Tests bulk planning of JSONL problems and resuming it from a checkpoint.
+    """
+    def test_plan_and_resume(self):
+        lines = [json.dumps(fleet_body(i % 13 + 1, seed=i)) for i in range(40)]
+        lines[5] = "{not json"
+        lines[17] = json.dumps({"DM_capacity": 1, "DE_capacity": 1, "data_centers": []})
+        expected = []
+        for line in lines:
+            try:
+                expected.append(solve_problem(json.loads(line)))
+            except ValueError as err:
+                expected.append({"error": "Input validation failed, {err}".format(err=err)})
+
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "problems.jsonl")
+            output = os.path.join(directory, "solutions.jsonl")
+            checkpoint = os.path.join(directory, "checkpoint.json")
+            with open(source, "w") as problems:
+                problems.write("\n".join(lines[:20]) + "\n\n" + "\n".join(lines[20:]) + "\n")
+
+            call_command("plan", source, output=output, workers=2, chunk_size=7,
+                         checkpoint=checkpoint, stderr=io.StringIO())
+            with open(output) as solutions:
+                self.assertEqual([json.loads(line) for line in solutions], expected)
+            with open(checkpoint) as state:
+                self.assertEqual(json.load(state)["errors"], 2)
+
+            # interrupted after 14 problems, with a partially written chunk after them
+            with open(output, "rb") as solutions:
+                done = solutions.readlines()[:14]
+            with open(output, "wb") as solutions:
+                solutions.writelines(done + [b'{"DE": 1'])
+            with open(checkpoint, "w") as state:
+                json.dump({"problems": 14, "errors": 1, "input_offset": sum(len(line) + 1 for line in lines[:14]),
+                           "output_size": sum(len(line) for line in done)}, state)
+            call_command("plan", source, output=output, workers=1, chunk_size=5,
+                         checkpoint=checkpoint, resume=True, stderr=io.StringIO())
+            with open(output) as solutions:
+                self.assertEqual([json.loads(line) for line in solutions], expected)
+            with open(checkpoint) as state:
+                self.assertEqual(json.load(state)["problems"], 40)
+
+
+class LoadTestTests(TestCase):
+    """
+    Tests the open-loop load test command.
+    """
+    def test_arrivals_and_summary(self):
+        rng = random.Random(1)
+        self.assertEqual(arrival_times(4, 1, False, rng), [0.25, 0.5, 0.75])
+        times = arrival_times(1000, 2, True, rng)
+        self.assertEqual(times, sorted(times))
+        self.assertTrue(1800 < len(times) < 2200)
+
+        outcomes = [(i / 1000, 200, 200) for i in range(1, 1001)] + [(0.5, 500, 200)]
+        summary = summarize(1000, outcomes, elapsed=2.0, duration=1.0)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["p50"], 0.5)
+        self.assertEqual(summary["p99"], 0.99)
+        self.assertTrue(summary["saturated"])
+        self.assertEqual(sum(summary["histogram"].values()), 1001)
+        self.assertFalse(summarize(1000, outcomes, elapsed=1.01, duration=1.0)["saturated"])
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "load.json")
+            call_command("loadtest", rates=[40, 80], duration=0.5, mix=[(10, 1), (100, 1)], invalid=0.3,
+                         pool=2, output=output, stdout=io.StringIO())
+            with open(output) as results:
+                results = json.load(results)["results"]
+        self.assertEqual([result["rate"] for result in results], [40, 80])
+        for result in results:
+            self.assertGreater(result["requests"], 0)
+            # invalid payloads are answered with the expected 400
+            self.assertEqual(result["errors"], 0)
+
+
+class MetricsTests(TestCase):
+    """
+    Tests metric primitives and the Prometheus endpoint.
+    """
+    def test_histogram(self):
+        histogram = metrics.Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.samples("h", 'stage="x"'), [
+            'h_bucket{stage="x",le="1"} 2',
+            'h_bucket{stage="x",le="10"} 3',
+            'h_bucket{stage="x",le="+Inf"} 4',
+            'h_sum{stage="x"} 56.5',
+            'h_count{stage="x"} 4',
+        ])
+
+    def test_counter_across_threads(self):
+        counter = metrics.Counter()
+
+        def increment():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # shards of finished threads are folded when a new thread registers
+        counter.inc()
+        self.assertEqual(counter.samples("c", ""), ["c 8001"])
+        self.assertEqual(len(counter.values.shards), 1)
+
+    def scrape(self):
+        response = client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode("utf-8").splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_endpoint(self):
+        before = self.scrape()
+        body = {"DM_capacity": 4, "DE_capacity": 1,
+                "data_centers": [{"name": "City{}".format(i), "servers": 7 + i} for i in range(5)]}
+        client.post(reverse("process_input"), data=body, content_type="application/json")
+        client.post(reverse("process_input"), data=dict(body, DM_capacity=0), content_type="application/json")
+        after = self.scrape()
+
+        def delta(name):
+            return after[name] - before.get(name, 0)
+
+        self.assertEqual(delta('logic_responses_total{status="200"}'), 1)
+        self.assertEqual(delta('logic_responses_total{status="400"}'), 1)
+        self.assertEqual(delta("logic_request_seconds_count"), 2)
+        self.assertEqual(delta('logic_request_sites_bucket{le="10"}'), 1)
+        self.assertEqual(delta('logic_stage_seconds_count{stage="parse"}'), 2)
+        self.assertEqual(delta('logic_stage_seconds_count{stage="validate"}'), 2)
+
+
+class ColdStartTests(TestCase):
+    """
+    Tests the warm-up of preforked servers and the cold start budget of the production settings.
+    """
+    def test_warm_up_is_forgotten(self):
+        self.assertEqual(warm_up(get_wsgi_application()), 200)
+        samples = metrics.exposition()
+        self.assertIn('logic_responses_total{status="200"} 0', samples)
+        self.assertIn("logic_request_seconds_count 0", samples)
+        self.assertEqual(cache.get_cache().stats(), {"hits": 0, "misses": 0})
+
+    @override_settings(LOGIC_CACHE_ENABLED=True, LOGIC_CACHE_BACKEND="default",
+                       CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_warm_up_keeps_shared_cache(self):
+        caches["default"].set("other", "kept")
+        self.assertEqual(warm_up(get_wsgi_application()), 200)
+        cache.get_cache().clear()
+        # keys of other users of the cache survive
+        self.assertEqual(caches["default"].get("other"), "kept")
+        self.assertEqual(cache.get_cache().stats(), {"hits": 0, "misses": 0})
+
+    def test_production_budget(self):
+        # a fresh interpreter, as a replica starting up
+        env = {key: value for key, value in os.environ.items() if key != "DJANGO_SETTINGS_MODULE"}
+        result = subprocess.run([sys.executable, "-m", "devops.coldstart"], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=60)
+        measured = json.loads(result.stdout)
+        self.assertEqual(measured["settings"], "devops.settings_production")
+        self.assertEqual(measured["status"], 200)
+        self.assertEqual(measured["contrib_modules"], [])
+        # wall-clock budgets only hold on an idle machine, see python -m devops.coldstart
+        if os.environ.get("LOGIC_TIMING_TESTS") == "1":
+            self.assertTrue(measured["within_budget"], measured)
+            self.assertEqual(result.returncode, 0)
+
+
+@override_settings(LOGIC_OFFLOAD_THRESHOLD=0, LOGIC_OFFLOAD_WORKERS=1, LOGIC_CACHE_ENABLED=False)
+class OffloadTests(TestCase):
+    """
+    Tests solving problems in the offload process pool.
+    """
+    body = {
+        "DM_capacity": 4,
+        "DE_capacity": 1,
+        "data_centers": [{"name": "City{}".format(i), "servers": i + 1} for i in range(4)]
+    }
+
+    def post(self):
+        return client.post(reverse("process_input"), data=self.body, content_type="application/json")
+
+    def test_offloaded(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"DE": 6, "DM_data_center": "City3"})
+        fleet = compile_body(fleet_body(10000))
+        self.assertEqual(offload.get_pool().solve(fleet),
+                         solver.solve_array(fleet.servers, fleet.dm_capacity, fleet.de_capacity))
+
+    def test_dm_count(self):
+        body = dict(self.body, DM_count=2)
+        response = client.post(reverse("process_input"), data=body, content_type="application/json")
+        self.assertEqual(response.json(), {"DE": 3, "DM_data_centers": ["City3", "City2"]})
+        fleet = compile_body(dict(fleet_body(10000), DM_count=50))
+        self.assertEqual(offload.get_pool().solve(fleet),
+                         solver.solve_multi(fleet.servers, fleet.dm_capacity, fleet.de_capacity, 50))
+
+    @override_settings(LOGIC_OFFLOAD_QUEUE=0)
+    def test_saturated(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_timeout_keeps_slot(self):
+        pool = offload.OffloadPool(1, 1, 0.01)
+        fleet = compile_body(fleet_body(100))
+        running = Future()
+        running.set_running_or_notify_cancel()
+        pool.executor.submit = lambda *args: running
+        try:
+            with self.assertRaisesRegex(offload.Unavailable, "within"):
+                pool.solve(fleet)
+            # the worker is still solving the problem the request stopped waiting for
+            with self.assertRaisesRegex(offload.Unavailable, "Too many"):
+                pool.solve(fleet)
+            running.set_result((0, 0))
+            del pool.executor.submit
+            pool.timeout = 30
+            self.assertEqual(pool.solve(fleet), solver.solve_array(fleet.servers, fleet.dm_capacity,
+                                                                   fleet.de_capacity))
+        finally:
+            pool.shutdown()
+
+
+@override_settings(LOGIC_STORE_ENABLED=True, LOGIC_STORE_LOOKUP_BYTES=0, LOGIC_STORE_HISTORY_LIMIT=3)
+class StoreTests(TransactionTestCase):
+    """
+    Tests storing submitted fleets and their placements in the database.
+    """
+    body = json.dumps(fleet_body(50, seed=3))
+
+    def post(self, body=None, **headers):
+        return client.post(reverse("process_input"), data=body or self.body, content_type="application/json",
+                           **headers)
+
+    def tearDown(self):
+        store.stop()
+
+    def test_lookup(self):
+        digest = cache.body_digest(self.body.encode())
+        for _ in range(3):
+            self.assertEqual(self.post().status_code, 200)
+        self.assertTrue(store.flush(5))
+        # identical unlabelled bodies are stored once
+        self.assertEqual(SubmittedFleet.objects.get().digest, digest)
+        self.assertEqual(Placement.objects.count(), 1)
+        expected = solve_problem(json.loads(self.body))
+        self.assertEqual(store.lookup(digest, len(self.body)), expected)
+        with override_settings(LOGIC_STORE_LOOKUP_BYTES=len(self.body)):
+            self.assertIsNone(store.lookup(digest, len(self.body)))
+        response = client.get(reverse("stored_placement", args=[digest]))
+        self.assertEqual(response.json(), expected)
+        self.assertEqual(client.get(reverse("stored_placement", args=["0" * 32])).status_code, 404)
+
+        # answered from the database, without being solved again
+        Placement.objects.update(result={"DE": -1, "DM_data_center": "stored"})
+        with override_settings(LOGIC_CACHE_ENABLED=False):
+            self.assertEqual(self.post().json(), {"DE": -1, "DM_data_center": "stored"})
+
+    def test_lookup_labelled(self):
+        digest = cache.body_digest(self.body.encode())
+        for _ in range(2):
+            self.assertEqual(self.post(HTTP_X_FLEET="eu-production").status_code, 200)
+        self.assertTrue(store.flush(5))
+        # a placement per request, and a single one found by hash
+        self.assertEqual(Placement.objects.filter(label="eu-production").count(), 2)
+        self.assertEqual(Placement.objects.filter(label__isnull=True).count(), 1)
+        expected = solve_problem(json.loads(self.body))
+        self.assertEqual(store.lookup(digest), expected)
+        self.assertEqual(client.get(reverse("stored_placement", args=[digest])).json(), expected)
+
+    @override_settings(LOGIC_ASYNC_OFFLOAD_THRESHOLD=64 * 1024, LOGIC_STREAMING_THRESHOLD=None)
+    def test_compressed_async(self):
+        # small once compressed, but larger than the offload threshold
+        body = json.dumps(fleet_body(10000, seed=6)).encode()
+        request = AsyncRequestFactory().post("/api/devops", data=gzip.compress(body), content_type="application/json",
+                                             headers={"Content-Encoding": "gzip"})
+        self.assertLess(len(request.body), 64 * 1024)
+        # the store is only queried off the event loop
+        response = async_to_sync(views.process_async)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), solve_problem(json.loads(body)))
+
+    def test_history(self):
+        bodies = [json.dumps(fleet_body(20, seed=seed)) for seed in range(5)]
+        for body in bodies:
+            self.assertEqual(self.post(body, HTTP_X_FLEET="eu-production").status_code, 200)
+        self.post(HTTP_X_FLEET="us-production")
+        self.assertTrue(store.flush(5))
+        self.assertEqual(Placement.objects.filter(label="eu-production").count(), 5)
+
+        response = client.get(reverse("fleet_history", args=["eu-production"]))
+        placements = response.json()["placements"]
+        # the latest ones, oldest first
+        self.assertEqual([{key: value for key, value in placement.items() if key != "time"}
+                          for placement in placements],
+                         [solve_problem(json.loads(body)) for body in bodies[2:]])
+        self.assertEqual(sorted(placement["time"] for placement in placements),
+                         [placement["time"] for placement in placements])
+        response = client.get(reverse("fleet_history", args=["eu-production"]), {"since": placements[-1]["time"]})
+        self.assertEqual(response.json()["placements"], placements[-1:])
+        response = client.get(reverse("fleet_history", args=["eu-production"]), {"until": "2000-01-01T00:00:00"})
+        self.assertEqual(response.json(), {"fleet": "eu-production", "placements": []})
+        self.assertEqual(client.get(reverse("fleet_history", args=["eu-production"]),
+                                    {"since": "yesterday"}).status_code, 400)
+        self.assertEqual(client.post(reverse("fleet_history", args=["eu-production"])).status_code, 404)
+
+    def test_invalid_label(self):
+        response = self.post(HTTP_X_FLEET="eu production")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("X-Fleet", response.content.decode())
+        with override_settings(LOGIC_STORE_ENABLED=False):
+            self.assertEqual(self.post(HTTP_X_FLEET="eu production").status_code, 200)
+
+    def test_full_queue(self):
+        writer = store.Writer(batch_size=10, flush_interval=1, queue_bytes=100)
+        dropped = metrics.STORE_DROPPED.labels().values.total()[0]
+        self.assertTrue(writer.put(store.Record("a" * 32, "application/json", b"x" * 80, None, {"DE": 1})))
+        self.assertFalse(writer.put(store.Record("b" * 32, "application/json", b"x" * 80, None, {"DE": 1})))
+        self.assertEqual(metrics.STORE_DROPPED.labels().values.total()[0], dropped + 1)
+        # bodies too large to keep take no room in the queue
+        with override_settings(LOGIC_STORE_MAX_BODY_BYTES=10):
+            self.assertTrue(writer.put(store.Record("c" * 32, "application/json", b"x" * 80, "eu", {"DE": 1})))
+        writer.start()
+        self.assertTrue(writer.flush(5))
+        writer.stop()
+        self.assertEqual(SubmittedFleet.objects.get(digest="c" * 32).body, None)
+        self.assertEqual(bytes(SubmittedFleet.objects.get(digest="a" * 32).body), b"x" * 80)
@@ -1,7 +1,20 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
 urlpatterns = [
-    path('', views.process, name='process_input'),
+    path('devops', views.process_async if settings.LOGIC_ASYNC_PROCESS else views.process, name='process_input'),
+    path('devops/batch', views.process_batch, name='process_batch'),
+    path('devops/sweep', views.process_sweep, name='process_sweep'),
+    path('devops/replay', views.process_replay, name='process_replay'),
+    path('devops/partial', views.process_partial, name='process_partial'),
+    path('devops/merge', views.merge_partials, name='merge_partials'),
+    path('devops/cache', views.cache_stats, name='cache_stats'),
+    path('devops/placements/<str:digest>', views.stored_placement, name='stored_placement'),
+    path('devops/history/<str:name>', views.fleet_history, name='fleet_history'),
+    path('devops/fleets', views.create_fleet, name='create_fleet'),
+    path('devops/fleets/<str:fleet_id>', views.fleet_detail, name='fleet_detail'),
+    path('devops/snapshots/<str:snapshot_id>', views.snapshot_detail, name='snapshot_detail'),
+    path('devops/snapshots/<str:snapshot_id>/solve', views.solve_snapshot, name='solve_snapshot'),
 ]
@@ -0,0 +1,206 @@
+"""
+Validation of request bodies accepted by the logic app endpoints.
+"""
+
+import numpy as np
+
+# Largest value a packed problem may reach (sum of its servers or a capacity)
+# to be solved with int64 arithmetic; bigger problems are solved on Python ints
+INT64_SAFE_LIMIT = 2 ** 62
+
+BODY_FIELDS = {"DM_capacity", "DE_capacity", "data_centers"}
+OPTIONAL_BODY_FIELDS = {"DM_count"}
+DATA_CENTER_FIELDS = {"name", "servers"}
+CAPACITY_FIELDS = ("DM_capacity", "DE_capacity")
+
+
+class CompactFleet:
+    """
+    Validated problem in compact form: the capacities, a table of data center
+    names and an array with their numbers of servers, both in input order.
+    Servers are int64, or Python ints in an object array when the problem
+    could overflow int64 arithmetic. Names are a list, or a
+    columnar.NameTable for fleets loaded from the columnar format. dm_count is None when the body asks
+    for a single DM without giving DM_count.
+    """
+
+    __slots__ = ("dm_capacity", "de_capacity", "names", "servers", "dm_count")
+
+    def __init__(self, dm_capacity: int, de_capacity: int, names: list, servers: np.ndarray,
+                 dm_count: int = None):
+        self.dm_capacity = dm_capacity
+        self.de_capacity = de_capacity
+        self.names = names
+        self.servers = servers
+        self.dm_count = dm_count
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def exact(self):
+        """
+        True when servers are kept as Python ints instead of int64
+        """
+        return self.servers.dtype == object
+
+
+def pack_servers(servers: list, dm_capacity: int, de_capacity: int):
+    """
+    Packs numbers of servers into an int64 array, or into an object array
+    when int64 arithmetic could overflow while solving
+
+    :param servers: numbers of servers, validated
+    :param dm_capacity: validated DM capacity
+    :param de_capacity: validated DE capacity
+    :return: 1-d array of servers
+    """
+    if dm_capacity < INT64_SAFE_LIMIT and de_capacity < INT64_SAFE_LIMIT:
+        try:
+            packed = np.array(servers, dtype=np.int64)
+        except OverflowError:
+            pass
+        else:
+            if not len(packed) or int(packed.max()) * len(packed) < INT64_SAFE_LIMIT:
+                return packed
+    packed = np.empty(len(servers), dtype=object)
+    packed[:] = servers
+    return packed
+
+
+def compile_body(body: dict):
+    """
+    Validates the request body in a single pass and converts it into a CompactFleet.
+    Checks the same rules with the same error messages as validate_body.
+
+    :param body: request body to validate
+    :return: CompactFleet, raises ValueError on failed validation
+    """
+    if type(body) != dict:
+        raise ValueError("Expecting an object, instead got value {body}".format(body=body))
+
+    # Checking if all required fields are present, along with optional ones only
+    optional = len(body) - 3
+    if (optional != 0 and (optional != 1 or "DM_count" not in body)) \
+            or "DM_capacity" not in body or "DE_capacity" not in body or "data_centers" not in body:
+        raise ValueError("Got unexpected set of fields {body} "
+                         "instead of {expected}".format(
+                          body=set(body.keys()),
+                          expected=BODY_FIELDS))
+
+    # data_centers must be a list
+    data_centers = body["data_centers"]
+    if type(data_centers) != list:
+        raise ValueError("Expecting a list of data centers, "
+                         "instead got value {data_centers} instead".format(
+                          data_centers=data_centers))
+
+    names = []
+    servers = []
+    add_name = names.append
+    add_servers = servers.append
+    for data_center in data_centers:
+        if type(data_center) is dict and len(data_center) == 2:
+            name = data_center.get("name")
+            count = data_center.get("servers")
+            if type(name) is str and type(count) is int and count >= 1:
+                add_name(name)
+                add_servers(count)
+                continue
+        # the entry is malformed: report it the way validate_data_center does
+        validate_data_center(data_center)
+
+    for key in CAPACITY_FIELDS:
+        validate_capacity(key, body[key])
+    dm_count = None
+    if "DM_count" in body:
+        dm_count = body["DM_count"]
+        validate_capacity("DM_count", dm_count)
+
+    return CompactFleet(body["DM_capacity"], body["DE_capacity"], names,
+                        pack_servers(servers, body["DM_capacity"], body["DE_capacity"]), dm_count)
+
+
+def validate_body(body: dict):
+    """
+    Validates the request body, checking the following:
+    1. All required fields are present
+    2. Only required fields and the optional DM_count are present
+    3. Numerical values are within allowed range [1,+Inf)
+
+    :param body: request body to validate
+    :return: raises ValueError on failed validation
+    """
+    compile_body(body)
+
+
+def validate_data_center(data_center: dict):
+    """
+    Validates a single entry of the data_centers list: it must have exactly
+    the name and servers fields, name must be a string and servers an integer
+    within the allowed range [1,+Inf)
+
+    :param data_center: data_centers list entry to validate
+    :return: raises ValueError on failed validation
+    """
+    if type(data_center) != dict:
+        raise ValueError("Expecting a data center object, "
+                         "instead got value {entry}".format(entry=data_center))
+    # data_centers list entries must have two fields
+    if set(data_center) != DATA_CENTER_FIELDS:
+        raise ValueError("Got unexpected set of data_centers fields "
+                         "{data_center} instead of "
+                         "{expected} for entry {entry}".format(
+                          data_center=set(data_center.keys()),
+                          expected=DATA_CENTER_FIELDS,
+                          entry=data_center))
+    # name field is a string
+    if type(data_center["name"]) != str:
+        raise ValueError("Data center name must be str, got "
+                         "{data_center} for entry {entry}".format(
+                          data_center=data_center["name"],
+                          entry=data_center))
+    # servers field is an int
+    if type(data_center["servers"]) != int:
+        raise ValueError("Number of servers must be int, got "
+                         "{servers} for entry {entry}".format(
+                          servers=data_center["servers"],
+                          entry=data_center))
+    # servers field is defined on [1, Inf)
+    if data_center["servers"] < 1:
+        raise ValueError("Numeric value for servers {value} "
+                         "is smaller than 1 for entry {entry}".format(
+                          value=data_center["servers"],
+                          entry=data_center))
+
+
+def validate_capacity(key: str, value: int):
+    """
+    Validates DM_capacity, DE_capacity or DM_count: it must be an integer
+    within the allowed range [1,+Inf)
+
+    :param key: name of the field
+    :param value: value of the capacity field
+    :return: raises ValueError on failed validation
+    """
+    # capacities are integer
+    if type(value) != int:
+        raise ValueError("Numeric value for key {key} "
+                         "is not integer: {value}".format(key=key, value=value))
+    # capacities are defined on [1, Inf)
+    if value < 1:
+        raise ValueError("Numeric value for key {key} "
+                         "is smaller than 1: {value}".format(key=key, value=value))
+
+
+def dict_raise_on_duplicates(ordered_pairs: dict):
+    """
+    Reject duplicate keys for json.loads() function
+    """
+    d = {}
+    for k, v in ordered_pairs:
+        if k in d:
+            raise ValueError("duplicate key: %r" % (k,))
+        else:
+            d[k] = v
+    return d
@@ -1,10 +1,24 @@
-from django.http import JsonResponse, HttpResponseNotFound, HttpResponseBadRequest
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, HttpResponseNotFound, HttpResponseBadRequest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 
+import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import datetime
 import json
+import threading
+import time
 
 import numpy as np
 
+from . import (admission, cache, coalesce, columnar, compression, fleets, metrics, offload, partials, profiling, replay,
+               responses, snapshots, solver, store, sweep)
+from .streaming import solve_stream
+from .validation import CompactFleet, compile_body, dict_raise_on_duplicates, validate_body
+
 
 @csrf_exempt
 def process(request):
@@ -27,85 +41,621 @@ def process(request):
 
     The endpoint returns a JSON with number of DE's required and the best city to place DM:
     {"DE": 6, "DM_data_center": "City4"}
+    With the optional "DM_count": 3 field, up to that many DM's are placed, at most one
+    per city, and the cities are returned best first:
+    {"DE": 4, "DM_data_centers": ["City4", "City2", "City"]}
+    When a failure occurs, it returns either 404 or 400
+
+    Bodies larger than settings.LOGIC_STREAMING_THRESHOLD bytes, or of unknown size,
+    are parsed incrementally from the request stream, see streaming.solve_stream.
+    Solutions of other bodies are cached, see cache.ResultCache, and concurrent
+    requests with the same body share one computation, see coalesce
+
+    Fleets can be sent in the columnar binary format instead, with the
+    application/x-dm-fleet content type, see columnar.loads
+
+    With the top_k query parameter, the endpoint returns the top_k best placements instead,
+    see rank_placements:
+    {"placements": [{"DE": 6, "DM_data_center": "City4"}, ...], "cursor": "1000.17"}
+
+    Requests are admitted according to their size and their tenant, see admission;
+    those not admitted are answered with 429 or 503 and a Retry-After header
+
+    Buffered bodies and their solutions are stored in the database, see store; the
+    X-Fleet header names the fleet, whose placements are then returned by fleet_history
+    """
+
+    if request.method == "POST":
+        return solve_request(request)
+    else:
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+
+
+@csrf_exempt
+async def process_async(request):
+    """
+    Asynchronous version of process(request), routed instead of it when
+    settings.LOGIC_ASYNC_PROCESS is set, e.g. when served by devops.asgi.
+
+    The ASGI handler reads the body without blocking the event loop. Requests with
+    bodies larger than settings.LOGIC_ASYNC_OFFLOAD_THRESHOLD bytes are then solved
+    in a thread pool of settings.LOGIC_ASYNC_WORKERS threads, so that the event loop
+    keeps serving other requests meanwhile; smaller ones are solved inline, unless
+    they have to wait to be admitted, see admission.
+    """
+
+    if request.method == "POST":
+        if not is_offloaded(request):
+            response = solve_request(request, wait=False)
+            if response is not None:
+                return responses.asynchronous(response)
+        response = await asyncio.get_running_loop().run_in_executor(get_executor(), solve_request, request)
+        return responses.asynchronous(response)
+    else:
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+
+
+def solve_request(request, wait: bool = True):
+    """
+    Handles a POST request to process(request) once it is admitted, see admission,
+    recording its metrics, under the profilers when requested, see profiling
+
+    :param request: incoming POST request
+    :param wait: False to return None instead of waiting to be admitted, and to solve
+                 without waiting for identical requests in flight, e.g. on an event loop
+    :return: response with the solution, 400 on failed validation, 429 or 503 when not admitted
+    """
+    start = time.perf_counter()
+    try:
+        with metrics.stage("queue"):
+            ticket = admission.admit(request, wait)
+        if ticket is None:
+            return None
+        with ticket, (contextlib.nullcontext() if wait else coalesce.without_waiting()):
+            if profiling.is_profiled(request):
+                response = profiling.profile(request, respond)
+            else:
+                response = respond(request)
+    except ValueError as err:
+        response = HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+    except admission.Rejected as err:
+        response = HttpResponse(str(err), status=err.status)
+        response["Retry-After"] = str(err.retry_after)
+    except Exception:
+        metrics.ERRORS.labels().inc()
+        raise
+    metrics.REQUEST_SECONDS.labels().observe(time.perf_counter() - start)
+    metrics.RESPONSES.labels(response.status_code).inc()
+    try:
+        metrics.REQUEST_BYTES.labels().observe(int(request.META.get("CONTENT_LENGTH")))
+    except (TypeError, ValueError):
+        pass
+    return response
+
+
+def respond(request):
+    """
+    Solves the POST request of process(request) and builds the response,
+    timing each stage
+
+    :param request: incoming POST request
+    :return: response with the solution, or 400 on failed validation
+    """
+    parse = parse_columnar if request.content_type == columnar.CONTENT_TYPE else parse_body
+    try:
+        if "top_k" in request.GET:
+            with metrics.stage("read"):
+                raw = read_body(request)
+            fleet = parse(raw)
+            with metrics.stage("solve"):
+                result = rank_placements(fleet, request.GET["top_k"], request.GET.get("cursor"))
+        elif parse is parse_body and is_streamed(request):
+            with metrics.stage("stream"):
+                result = solve_stream(compression.decoded(request))
+        else:
+            name = store.label(request)
+            with metrics.stage("read"):
+                raw = read_body(request)
+            digest = cache.body_digest(raw)
+            result = coalesce.run(request.content_type + ":" + digest,
+                                  lambda: solve_buffered(raw, digest, parse))
+            store.record(digest, request.content_type, raw, name, result)
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+    except offload.Unavailable as err:
+        response = HttpResponse(str(err), status=503)
+        response["Retry-After"] = str(err.retry_after)
+        return response
+    return serialize(result)
+
+
+def solve_buffered(raw: bytes, digest: str, parse):
+    """
+    Solves a buffered request body, through the result cache when it is enabled;
+    large bodies solved earlier are answered from the database, see store.lookup
+
+    :param raw: raw request body
+    :param digest: digest of the body, see cache.body_digest
+    :param parse: function parsing and validating the body into a CompactFleet
+    :return: optimal solution
+    """
+    result_cache = cache.get_cache()
+    if result_cache is None:
+        return store.lookup(digest, len(raw)) or timed_solve(parse(raw))
+    return result_cache.solve(raw, parse, timed_solve, digest, lambda: store.lookup(digest, len(raw)))
+
+
+def serialize(result: dict):
+    """
+    :return: JSON response with the result, streamed when it is large, see responses
+    """
+    with metrics.stage("serialize"):
+        return responses.json_response(result)
+
+
+def cache_stats(request):
+    """
+    API endpoint reporting hit and miss counters of the result cache of this process:
+    {"enabled": true, "hits": 10, "misses": 2}
+    """
+    result_cache = cache.get_cache()
+    if result_cache is None:
+        return JsonResponse({"enabled": False})
+    return JsonResponse(dict(result_cache.stats(), enabled=True))
+
+
+def export_metrics(request):
+    """
+    Endpoint exposing metrics of this process in the Prometheus text format:
+    per stage latency, request latency, body size and number of data centers
+    histograms, responses by status code, unhandled errors and result cache counters
+    """
+    extra = []
+    result_cache = cache.get_cache()
+    if result_cache is not None:
+        stats = result_cache.stats()
+        for key in ("hits", "misses"):
+            extra += ["# HELP logic_cache_{key}_total Result cache {key}".format(key=key),
+                      "# TYPE logic_cache_{key}_total counter".format(key=key),
+                      "logic_cache_{key}_total {value}".format(key=key, value=stats[key])]
+    return HttpResponse(metrics.exposition(extra), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@csrf_exempt
+def process_batch(request):
+    """
+    API endpoint solving many problems in one request.
+    POST request is accepted with JSON body being a list of problems,
+    each of the form accepted by process(request):
+    [
+        {"DM_capacity": 4, "DE_capacity": 1, "data_centers": [...]},
+        {"DM_capacity": 2, "DE_capacity": 3, "data_centers": [...]},
+        ...
+    ]
+
+    The endpoint returns a JSON with a result per problem, in input order.
+    A result is either a solution or a validation error for that problem:
+    {"results": [{"DE": 6, "DM_data_center": "City4"}, {"error": "..."}, ...]}
+    When the body itself is malformed, it returns 400, and 413 with {"error": "..."}
+    when it is larger than settings.LOGIC_MAX_BODY_BYTES. Non POST requests return 404
+    """
+
+    if request.method == "POST":
+        try:
+            problems = json.loads(read_body(request), object_pairs_hook=dict_raise_on_duplicates)
+            if type(problems) != list:
+                raise ValueError("Expecting a list of problems, "
+                                 "instead got value {problems}".format(problems=problems))
+        except compression.TooLarge as err:
+            return too_large(err)
+        except ValueError as err:
+            return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+        return serialize({"results": solve_batch(problems)})
+    else:
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+
+
+def is_streamed(request):
+    """
+    Decides whether the request body is parsed incrementally
+
+    :param request: incoming POST request
+    :return: True when the body is too large to be buffered
+    """
+    threshold = getattr(settings, "LOGIC_STREAMING_THRESHOLD", None)
+    if threshold is None:
+        return False
+    size = compression.body_size(request)
+    # unknown size, e.g. a compressed body or a chunked upload
+    return size is None or size > threshold
+
+
+def is_offloaded(request):
+    """
+    Decides whether process_async(request) solves the request in the thread pool
+
+    :param request: incoming POST request
+    :return: True when the body is larger than the offload threshold, or of unknown
+             size, e.g. compressed
+    """
+    size = compression.body_size(request)
+    return size is None or size > getattr(settings, "LOGIC_ASYNC_OFFLOAD_THRESHOLD", 64 * 1024)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    :return: thread pool solving large requests for process_async(request)
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, "LOGIC_ASYNC_WORKERS", 4),
+                                               thread_name_prefix="logic-solve")
+    return _executor
+
+
+@csrf_exempt
+def create_fleet(request):
+    """
+    API endpoint registering a fleet that is later updated a few data centers at a time.
+    POST request is accepted with JSON body of the form accepted by process(request);
+    data center names must be unique.
+
+    The endpoint returns 201 with the fleet id and its optimal solution:
+    {"id": "2f1c...", "DE": 6, "DM_data_center": "City4"}
     When a failure occurs, it returns either 404 or 400
     """
 
     if request.method == "POST":
         try:
-            body = json.loads(request.body, encoding="utf-8", object_pairs_hook=dict_raise_on_duplicates)
-            validate_body(body)
+            fleet_id, fleet = fleets.create(json.loads(read_body(request), object_pairs_hook=dict_raise_on_duplicates))
+        except compression.TooLarge as err:
+            return too_large(err)
         except ValueError as err:
             return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
-        result = solve_problem(body)
-        return JsonResponse(result)
+        return JsonResponse(dict(fleet.solution(), id=fleet_id), status=201)
     else:
         return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
 
 
-def validate_body(body: dict):
-    """
-    Validates the request body, checking the following:
-    1. All required fields are present
-    2. Only required fields are present
-    3. Numerical values are within allowed range [1,+Inf)
-
-    :param body: request body to validate
-    :return: raises ValueError on failed validation
-    """
-    # Checking if all required fields are present
-    fields_set = {"DM_capacity", "DE_capacity", "data_centers"}
-    body_fields_set = set(body.keys())
-    if fields_set != body_fields_set:
-        raise ValueError("Got unexpected set of fields {body} "
-                         "instead of {expected}".format(
-                          body=body_fields_set,
-                          expected=fields_set))
-
-    # data_centers must be a list
-    if type(body["data_centers"]) != list:
-        raise ValueError("Expecting a list of data centers, "
-                         "instead got value {data_centers} instead".format(
-                          data_centers=body["data_centers"]))
-
-    data_centers_fields_set = {"name", "servers"}
-    for data_center in body['data_centers']:
-        # data_centers list entries must have two fields
-        if set(data_center) != data_centers_fields_set:
-            raise ValueError("Got unexpected set of data_centers fields "
-                             "{data_center} instead of "
-                             "{expected} for entry {entry}".format(
-                              data_center=set(data_center.keys()),
-                              expected=data_centers_fields_set,
-                              entry=data_center))
-        # name field is a string
-        if type(data_center["name"]) != str:
-            raise ValueError("Data center name must be str, got "
-                             "{data_center} for entry {entry}".format(
-                              data_center=data_center["name"],
-                              entry=data_center))
-        # servers field is an int
-        if type(data_center["servers"]) != int:
-            raise ValueError("Number of servers must be int, got "
-                             "{servers} for entry {entry}".format(
-                              servers=data_center["servers"],
-                              entry=data_center))
-        # servers field is defined on [1, Inf)
-        if data_center["servers"] < 1:
-            raise ValueError("Numeric value for servers {value} "
-                             "is smaller than 1 for entry {entry}".format(
-                              value=data_center["servers"],
-                              entry=data_center))
-
-    capacity = ["DM_capacity", "DE_capacity"]
-    for key in capacity:
-        # capacities are integer
-        if type(body[key]) != int:
-            raise ValueError("Numeric value for key {key} "
-                             "is not integer: {value}".format(key=key, value=body[key]))
-        # capacities are defined on [1, Inf)
-        if body[key] < 1:
-            raise ValueError("Numeric value for key {key} "
-                             "is smaller than 1: {value}".format(key=key, value=body[key]))
+@csrf_exempt
+def fleet_detail(request, fleet_id: str):
+    """
+    API endpoint for a registered fleet:
+    GET returns the current optimal solution {"DE": 6, "DM_data_center": "City4"},
+    which is {"DE": 0, "DM_data_center": null} once all data centers are removed
+    PATCH changes data centers and returns the new optimal solution. The JSON body
+    has the following form, both fields being optional:
+    {
+    "data_centers": [
+       {"name": "City", "servers": 3},
+       {"name": "New city", "servers": 5}
+       ],
+    "remove": ["City2"]
+    }
+    where data_centers are added or get a new number of servers, and data centers
+    listed in remove are removed from the fleet.
+    DELETE removes the fleet.
+    When a failure occurs, it returns either 404 or 400
+    """
+
+    fleet = fleets.get(fleet_id)
+    if fleet is None:
+        return HttpResponseNotFound("Fleet {fleet_id} does not exist".format(fleet_id=fleet_id))
+    try:
+        if request.method == "PATCH":
+            body = json.loads(read_body(request), object_pairs_hook=dict_raise_on_duplicates)
+            fleets.validate_update(body)
+            fleet.update(body.get("data_centers", []), body.get("remove", []))
+        elif request.method == "DELETE":
+            fleets.delete(fleet_id)
+            return HttpResponse(status=204)
+        elif request.method != "GET":
+            return HttpResponseNotFound("Do a GET, PATCH or DELETE request to that endpoint: "
+                                        "other methods are not supported")
+        return JsonResponse(fleet.solution())
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+
+
+@csrf_exempt
+def process_sweep(request):
+    """
+    API endpoint solving a fleet for a grid of capacities, see sweep.
+    POST request is accepted with JSON body of the form accepted by process(request),
+    where each capacity is a list or an inclusive range:
+    {
+    "DM_capacity": [4, 8, 16],
+    "DE_capacity": {"start": 1, "stop": 10, "step": 3},
+    "data_centers": [...]
+    }
+
+    The endpoint returns the number of DE's of every cell, with a row per DM capacity,
+    and the DM site of every cell as a position in the table of sites:
+    {"DM_capacity": [4, 8, 16], "DE_capacity": [1, 4, 7, 10],
+     "DE": [[21, 6, 4, 3], ...], "DM_site": [[0, 0, 1, 1], ...], "sites": ["City4", "City2"]}
+    When a failure occurs, it returns either 404 or 400
+    """
+
+    if request.method != "POST":
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+    try:
+        body = json.loads(read_body(request), object_pairs_hook=dict_raise_on_duplicates)
+        with metrics.stage("solve"):
+            result = sweep.solve_sweep(body)
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+    return serialize(result)
+
+
+@csrf_exempt
+def process_replay(request):
+    """
+    API endpoint solving a fleet at every step of its history, see replay.
+    POST request is accepted with JSON body holding the data center names once
+    and their numbers of servers per time step, or with a columnar series:
+    {
+    "DM_capacity": 4,
+    "DE_capacity": 1,
+    "sites": ["City1", "City2", "City3"],
+    "servers": [[1, 4, 5], [6, 2, 1], ...]
+    }
+
+    The endpoint returns the number of DE's of every step, the DM site of every step
+    as a position in the table of sites, and the steps where the DM site changes:
+    {"DM_capacity": 4, "DE_capacity": 1, "steps": 2160, "DE": [4, 5, ...], "DM_site": [0, 1, ...],
+     "sites": ["City3", "City1"], "changes": [{"step": 1, "from": "City3", "to": "City1"}, ...]}
+    When a failure occurs, it returns either 404 or 400
+    """
+
+    if request.method != "POST":
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+    try:
+        raw = read_body(request)
+        if request.content_type == columnar.CONTENT_TYPE:
+            with metrics.stage("validate"):
+                series = replay.loads_series(raw)
+        else:
+            with metrics.stage("parse"):
+                body = json.loads(raw, object_pairs_hook=dict_raise_on_duplicates)
+            with metrics.stage("validate"):
+                series = replay.compile_series(body)
+        with metrics.stage("solve"):
+            result = replay.solve_series(*series)
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+    return serialize(result)
+
+
+@csrf_exempt
+def process_partial(request):
+    """
+    API endpoint summarizing a shard of a problem split e.g. by region, see partials.
+    POST request is accepted with body of the form accepted by process(request),
+    holding the data centers of the shard only, which may be none; DM_count is not supported.
+
+    The endpoint returns the partial aggregate of the shard:
+    {"DM_capacity": 4, "DE_capacity": 1, "sites": 3, "baseline": 9,
+     "best_saving": 4, "runner_up_saving": 2, "DM_data_center": "City4"}
+    When a failure occurs, it returns either 404 or 400
+    """
+
+    if request.method != "POST":
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+    parse = parse_columnar if request.content_type == columnar.CONTENT_TYPE else parse_body
+    try:
+        fleet = parse(read_body(request))
+        if fleet.dm_count is not None:
+            raise ValueError("Partials place a single DM, DM_count is not supported")
+        return JsonResponse(partials.make_partial(fleet))
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+
+
+@csrf_exempt
+def merge_partials(request):
+    """
+    API endpoint combining partial aggregates of shards into the solution of the whole problem.
+    POST request is accepted with JSON body of the form
+    {"partials": [{"DM_capacity": 4, ...}, ...]}
+    where partials are returned by process_partial(request) or by this endpoint, in the
+    order of the shards; ties are resolved in favour of the first shard.
+
+    The endpoint returns the optimal solution along with the merged partial:
+    {"DE": 6, "DM_data_center": "City4", "partial": {...}}
+    When a failure occurs, it returns either 404 or 400
+    """
+
+    if request.method != "POST":
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+    try:
+        body = json.loads(read_body(request), object_pairs_hook=dict_raise_on_duplicates)
+        if type(body) != dict or set(body) != {"partials"} or type(body["partials"]) != list:
+            raise ValueError("Expecting an object with a list of partials, instead got value {body}".format(
+                body=body))
+        for partial in body["partials"]:
+            partials.validate_partial(partial)
+        merged = partials.merge(body["partials"])
+        return JsonResponse(dict(partials.solution(merged), partial=merged))
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+
+
+@csrf_exempt
+def snapshot_detail(request, snapshot_id: str):
+    """
+    API endpoint for fleet snapshots kept on disk, see snapshots:
+    PUT stores a snapshot, or atomically replaces its previous version, and
+    returns 201 with {"id": "inventory", "sites": 2000000}. The body is a fleet
+    in the columnar format whose header holds only the number of sites, see columnar.
+    GET returns the id and the number of sites of the current version.
+    DELETE removes the snapshot.
+    When a failure occurs, it returns either 404 or 400, and 413 when the uploaded
+    snapshot is larger than settings.LOGIC_SNAPSHOT_MAX_BYTES
+    """
+
+    try:
+        if request.method == "PUT":
+            snapshot = snapshots.store(snapshot_id, compression.decoded(request))
+            return JsonResponse({"id": snapshot_id, "sites": len(snapshot)}, status=201)
+        elif request.method == "GET":
+            snapshot = snapshots.get(snapshot_id)
+            if snapshot is not None:
+                return JsonResponse({"id": snapshot_id, "sites": len(snapshot)})
+        elif request.method == "DELETE":
+            if snapshots.delete(snapshot_id):
+                return HttpResponse(status=204)
+        else:
+            return HttpResponseNotFound("Do a GET, PUT or DELETE request to that endpoint: "
+                                        "other methods are not supported")
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+    return HttpResponseNotFound("Snapshot {snapshot_id} does not exist".format(snapshot_id=snapshot_id))
+
+
+@csrf_exempt
+def solve_snapshot(request, snapshot_id: str):
+    """
+    API endpoint solving a stored snapshot.
+    POST request is accepted with JSON body holding only the capacities:
+    {"DM_capacity": 4, "DE_capacity": 1}, optionally with DM_count as in process(request)
+
+    The endpoint returns the optimal solution in the format of process(request).
+    When a failure occurs, it returns either 404 or 400
+    """
+
+    if request.method != "POST":
+        return HttpResponseNotFound("Do a POST request to that endpoint: other methods are not supported")
+    try:
+        snapshot = snapshots.get(snapshot_id)
+        if snapshot is None:
+            return HttpResponseNotFound("Snapshot {snapshot_id} does not exist".format(snapshot_id=snapshot_id))
+        fleet = snapshot.fleet(json.loads(read_body(request), object_pairs_hook=dict_raise_on_duplicates))
+        return serialize(timed_solve(fleet))
+    except compression.TooLarge as err:
+        return too_large(err)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+
+
+def stored_placement(request, digest: str):
+    """
+    API endpoint returning the stored solution of an earlier /api/devops request body,
+    by the content hash of the body, see cache.body_digest:
+    {"DE": 6, "DM_data_center": "City4"}
+    When a failure occurs, it returns 404
+    """
+
+    if request.method != "GET":
+        return HttpResponseNotFound("Do a GET request to that endpoint: other methods are not supported")
+    result = store.lookup(digest, size=None)
+    if result is None:
+        return HttpResponseNotFound("No placement is stored for {digest}".format(digest=digest))
+    return JsonResponse(result)
+
+
+def fleet_history(request, name: str):
+    """
+    API endpoint returning the placements of a fleet named with the X-Fleet header
+    over time, oldest first, see store.history. The since and until query parameters
+    bound the time range, given in ISO 8601, e.g. ?since=2026-09-18T00:00:00Z:
+    {"fleet": "eu-production", "placements": [{"time": "2026-09-18T10:00:00Z", "DE": 6,
+                                               "DM_data_center": "City4"}, ...]}
+    When a failure occurs, it returns either 404 or 400
+    """
+
+    if request.method != "GET":
+        return HttpResponseNotFound("Do a GET request to that endpoint: other methods are not supported")
+    try:
+        bounds = {}
+        for key in ("since", "until"):
+            if key in request.GET:
+                value = parse_datetime(request.GET[key])
+                if value is None:
+                    raise ValueError("{key} must be an ISO 8601 date and time, got {value}".format(
+                        key=key, value=request.GET[key]))
+                bounds[key] = value if timezone.is_aware(value) else timezone.make_aware(value, datetime.timezone.utc)
+    except ValueError as err:
+        return HttpResponseBadRequest("Input validation failed, {err}".format(err=err))
+    placements = [dict(result, time=created.isoformat().replace("+00:00", "Z"))
+                  for created, result in store.history(name, **bounds)]
+    return JsonResponse({"fleet": name, "placements": placements})
+
+
+def read_body(request):
+    """
+    :return: raw request body, decompressed when it is sent compressed, see compression;
+             bodies are read from the stream, so that they are limited by
+             settings.LOGIC_MAX_BODY_BYTES instead of settings.DATA_UPLOAD_MAX_MEMORY_SIZE,
+             also once decompressed, raises compression.TooLarge beyond
+    """
+    limit = getattr(settings, "LOGIC_MAX_BODY_BYTES", 256 * 1024 * 1024)
+    decompressed_limit = getattr(settings, "LOGIC_COMPRESSION_MAX_BODY_BYTES", compression.DEFAULT_MAX_BODY_BYTES)
+    if limit is not None and decompressed_limit is not None:
+        decompressed_limit = min(limit, decompressed_limit)
+    stream = compression.decoded(request, decompressed_limit)
+    if stream is request:
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if limit is not None and length > limit:
+            raise compression.TooLarge("Request body is larger than {limit} bytes".format(limit=limit))
+    return stream.read()
+
+
+def too_large(err):
+    """
+    :return: 413 JSON response to a request whose body is larger than allowed
+    """
+    return JsonResponse({"error": str(err)}, status=413)
+
+
+def parse_body(raw: bytes):
+    """
+    Parses and validates a buffered request body
+
+    :param raw: raw request body
+    :return: validated CompactFleet, raises ValueError on failed validation
+    """
+    with metrics.stage("parse"):
+        body = json.loads(raw, object_pairs_hook=dict_raise_on_duplicates)
+    with metrics.stage("validate"):
+        fleet = compile_body(body)
+    metrics.REQUEST_SITES.labels().observe(len(fleet))
+    return fleet
+
+
+def parse_columnar(raw: bytes):
+    """
+    Loads and validates a buffered request body in the columnar format
+
+    :param raw: raw request body
+    :return: validated CompactFleet, raises ValueError on failed validation
+    """
+    with metrics.stage("validate"):
+        fleet = columnar.loads(raw)
+    metrics.REQUEST_SITES.labels().observe(len(fleet))
+    return fleet
 
 
 def solve_problem(body: dict):
@@ -113,47 +663,135 @@ def solve_problem(body: dict):
     Solves the problem of distributing DM and DE's over cities.
 
     The algorithm works as follows:
-       1 Take the first datacenter, place DM there: subtract his capacity from number
-         of servers at that datacenter
-       2 Distribute remaining servers to DE's
-       3 Append the resulting configuration to the solutions list
-       4 Repeat 1-3 for all datacenters
-       5 Find the configuration with minimum number of DE's
-    In a nutshell, the algorithm directly constructs solution space and then finds
-    the optimal solution
+       1 Compute the baseline: number of DE's required to cover every datacenter
+         without DM
+       2 For every datacenter compute the saving: number of DE's that are no longer
+         required at that datacenter when DM is placed there
+       3 Place DM to the datacenter with the largest saving (the first one on ties)
+    The number of DE's for the optimal configuration is the baseline minus the
+    largest saving. Datacenters are identified by position, so entries sharing
+    a name are handled independently.
 
     :param body: JSON object according to process(request) function requirements
     :return: optimal solution
     """
-    solutions = []
-    for DM_position in body['data_centers']:
-        DE_count = 0
-        for s in body['data_centers']:
-            if s['name'] == DM_position['name']:
-                # delta is the number of DE's required to cover what's left after
-                # putting DM to the given datacenter
-                delta = int(np.ceil((s['servers']-body['DM_capacity'])/body['DE_capacity']))
-                # when DM capacity is larger than number of servers,
-                # delta is negative or zero. It means that there is no need
-                # to add DE's to that datacenter, because DM covers it
-                # completely
-                if delta > 0:
-                    DE_count += delta
-            else:
-                DE_count += int(np.ceil(s['servers']/body['DE_capacity']))
-        solutions.append({"DE": DE_count, "DM_data_center": DM_position['name']})
-    solutions_sorted = sorted(solutions, key=lambda k: k['DE'])
-    return solutions_sorted[0]
+    return solve_fleet(compile_body(body))
 
 
-def dict_raise_on_duplicates(ordered_pairs: dict):
+def solve_fleet(fleet: CompactFleet):
     """
-    Reject duplicate keys for json.loads() function
+    Solves a validated problem, see solve_problem
+
+    :param fleet: problem converted by validation.compile_body
+    :return: optimal solution
+    """
+    if fleet.dm_count is not None:
+        return placement(fleet, *solver.solve_multi(fleet.servers, fleet.dm_capacity, fleet.de_capacity,
+                                                    fleet.dm_count))
+    return placement(fleet, *solver.solve_array(fleet.servers, fleet.dm_capacity, fleet.de_capacity))
+
+
+def placement(fleet: CompactFleet, DE_count: int, DM):
+    """
+    :param fleet: solved problem
+    :param DE_count: number of DE's
+    :param DM: index of the DM data center, or list of indices when the fleet has DM_count
+    :return: solution naming the DM data centers
+    """
+    if fleet.dm_count is not None:
+        return {"DE": DE_count, "DM_data_centers": [fleet.names[index] for index in DM]}
+    return {"DE": DE_count, "DM_data_center": fleet.names[DM]}
+
+
+def timed_solve(fleet: CompactFleet):
+    """
+    solve_fleet recording its time as the solve stage. Problems above
+    settings.LOGIC_OFFLOAD_THRESHOLD data centers are solved in the offload
+    process pool instead of the request thread, see offload.OffloadPool
+    """
+    with metrics.stage("solve"):
+        if offload.is_offloaded(fleet):
+            return placement(fleet, *offload.get_pool().solve(fleet))
+        return solve_fleet(fleet)
+
+
+def rank_placements(fleet: CompactFleet, top_k: str, cursor: str = None):
+    """
+    Ranks DM placements by number of DE's, the first data center winning ties,
+    and returns the top_k best ones. At most settings.LOGIC_TOP_K_PAGE_SIZE placements
+    are returned at once: when more remain, the response holds a cursor to pass
+    along with the same body and top_k to get the next page, otherwise the cursor is null.
+
+    :param fleet: validated problem
+    :param top_k: total number of placements requested
+    :param cursor: cursor returned with the previous page
+    :return: page of placements and the cursor of the next page
+    """
+    try:
+        top_k = int(top_k)
+    except ValueError:
+        raise ValueError("top_k must be an integer, got {top_k}".format(top_k=top_k))
+    if top_k < 1:
+        raise ValueError("top_k {top_k} is smaller than 1".format(top_k=top_k))
+    if fleet.dm_count is not None:
+        raise ValueError("top_k ranks placements of a single DM and cannot be combined with DM_count")
+
+    delivered, after = 0, None
+    if cursor:
+        try:
+            delivered, after = (int(part) for part in cursor.split("."))
+        except ValueError:
+            raise ValueError("Malformed cursor {cursor}".format(cursor=cursor))
+        if not 0 < delivered < top_k or not 0 <= after < len(fleet):
+            raise ValueError("Cursor {cursor} does not belong to that ranking".format(cursor=cursor))
+
+    page_size = min(top_k - delivered, getattr(settings, "LOGIC_TOP_K_PAGE_SIZE", 1000))
+    # one extra placement tells whether there is a next page
+    ranked = solver.top_k(fleet.servers.tolist(), fleet.dm_capacity, fleet.de_capacity, page_size + 1, after)
+    page = ranked[:page_size]
+    next_cursor = None
+    if len(ranked) > page_size and delivered + page_size < top_k:
+        next_cursor = "{delivered}.{index}".format(delivered=delivered + page_size, index=page[-1][1])
+    return {"placements": [{"DE": DE_count, "DM_data_center": fleet.names[index]}
+                           for DE_count, index in page],
+            "cursor": next_cursor}
+
+
+def solve_batch(problems: list):
     """
-    d = {}
-    for k, v in ordered_pairs:
-        if k in d:
-            raise ValueError("duplicate key: %r" % (k,))
+    Solves a list of problems in one vectorized pass.
+
+    Every problem is validated on its own. The valid ones are packed into flat
+    arrays (servers of all data centers, problem offsets and capacities) and
+    solved together by solver.solve_segments. Problems that could overflow int64
+    are solved one by one on Python ints instead, and so are problems with DM_count.
+
+    :param problems: list of JSON objects according to process(request) function requirements
+    :return: list with a solution or {"error": message} per problem
+    """
+    results = [None] * len(problems)
+    packed = []
+    for i, body in enumerate(problems):
+        try:
+            fleet = compile_body(body)
+            if not len(fleet):
+                raise ValueError("Cannot place DM: no data centers given")
+        except ValueError as err:
+            results[i] = {"error": "Input validation failed, {err}".format(err=err)}
+            continue
+        if fleet.exact or fleet.dm_count is not None:
+            results[i] = solve_fleet(fleet)
         else:
-            d[k] = v
-    return d
+            packed.append((i, fleet))
+
+    if packed:
+        offsets = np.zeros(len(packed) + 1, dtype=np.int64)
+        np.cumsum([len(fleet) for _, fleet in packed], out=offsets[1:])
+        DE_counts, DM_indices = solver.solve_segments(
+            np.concatenate([fleet.servers for _, fleet in packed]),
+            offsets,
+            np.array([fleet.dm_capacity for _, fleet in packed], dtype=np.int64),
+            np.array([fleet.de_capacity for _, fleet in packed], dtype=np.int64))
+        for (i, fleet), DE_count, DM_index in zip(packed, DE_counts.tolist(), DM_indices.tolist()):
+            results[i] = {"DE": DE_count, "DM_data_center": fleet.names[DM_index]}
+    return results